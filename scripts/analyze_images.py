@@ -3,120 +3,863 @@
 analyze_images.py - Command line tool for batch image quality analysis
 """
 
+import sys
 import json
+import math
+import re
+import time
 import argparse
+import threading
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor
 from dataclasses import asdict
-import logging
-from image_quality.analyzer import ImageQualityAnalyzer
-import cv2
+from typing import Any, Dict, List, Optional, Tuple, Union, TYPE_CHECKING
+import numpy as np
+from PIL import Image
+from image_quality.analyzer import ImageQualityAnalyzer, ImageQualityMetrics, RunningSummary, summarize_metrics
+from pipeline import FrameJob, Stage, StagedPipeline, WorkItem
+from pipeline.io import read_bytes, encode_outputs, make_writer, output_name
+from pipeline.sharding import select_shard, shard_suffix, parse_shard
+from pipeline.sources import DirectorySource, is_archive, open_source, require_random_access, SequentialSourceError
+from pipeline.sinks import DirectorySink, TarShardSink
+
+# Estimation, watching, caching, worker processes and auto-tuning are only
+# imported by the modes that use them, see benchmarks/import_time.py
+if TYPE_CHECKING:
+    from face_detection.detector import FaceCropper
+
+RESULTS_NAME = 'analysis_results'
+ESTIMATE_NAME = 'analysis_estimate'
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png')
+
+def analyze_frame(
+    analyzer: ImageQualityAnalyzer,
+    cropper: Optional['FaceCropper'],
+    image: np.ndarray,
+    filename: str
+) -> ImageQualityMetrics:
+    """Analyze a decoded RGB image, scoring detected faces when a cropper is given"""
+    if cropper is not None:
+        from face_detection.detector import DETECTION_SIZE, FaceDetection
+
+        # Detect on a PIL grayscale plane, so boxes match the analyzer's
+        # orientation, reduced by a whole factor to no less than the
+        # detector's working size, so neither the conversion nor the
+        # detection grows with the photo resolution
+        frame = Image.fromarray(image)
+        factor = max(frame.size) // DETECTION_SIZE
+        plane = (frame.reduce(factor) if factor > 1 else frame).convert('L')
+        scale_x, scale_y = frame.width / plane.width, frame.height / plane.height
+        faces = [
+            FaceDetection(int(face.x * scale_x), int(face.y * scale_y), int(face.width * scale_x), int(face.height * scale_y), face.confidence)
+            for face in cropper.detect_faces(np.asarray(plane))
+        ]
+        return analyzer.analyze_face_rois(image, faces, filename, gray_plane=plane)
+    return analyzer.analyze_image(image, filename)
+
+class AnalysisJob(FrameJob):
+    """Analysis as run by each process of a SharedFramePool (--processes)"""
+
+    def __init__(self, settings: Dict, face_roi: bool = False, pixel_cache: Optional[Tuple[str, int]] = None):
+        self.settings = settings
+        self.face_roi = face_roi
+        # (directory, max bytes), since the cache itself isn't shared between processes
+        self.pixel_cache = pixel_cache
+
+    def setup(self) -> None:
+        from pipeline.cache import PixelCache
+
+        cache = PixelCache(*self.pixel_cache) if self.pixel_cache else None
+        self.analyzer = ImageQualityAnalyzer(pixel_cache=cache, **self.settings)
+        self.cropper = None
+        if self.face_roi:
+            from face_detection.detector import FaceCropper
+            self.cropper = FaceCropper()
+
+    def decode(self, data: bytes) -> np.ndarray:
+        return self.analyzer.load_image(data)
+
+    def process(self, name: str, frame: np.ndarray, original: Optional[bytes] = None, path: Optional[str] = None) -> ImageQualityMetrics:
+        metrics = analyze_frame(self.analyzer, self.cropper, frame, name)
+        # The parent process collects the metrics
+        self.analyzer.analyzed_images.clear()
+        return metrics
+
+def build_stages(
+    sink: Union[DirectorySink, TarShardSink],
+    analyzer: ImageQualityAnalyzer,
+    mode: str = 'analyze',
+    num_threads: int = 4,
+    cropper: Optional['FaceCropper'] = None,
+    stage_workers: Optional[Dict[str, int]] = None,
+    queue_size: int = 16
+) -> List[Stage]:
+    """Build the read -> decode -> analyze [-> encode -> write] stages"""
+    workers = {'read': 2, 'decode': 2, 'encode': 2, 'write': 1, **(stage_workers or {})}
+
+    def decode(item: WorkItem) -> WorkItem:
+        item.image = analyzer.load_image(item.data)
+        item.data = None
+        return item
+
+    def analyze(item: WorkItem) -> Optional[WorkItem]:
+        # Results are keyed by the full relative name, so equal file names in different archive folders stay apart
+        metrics = analyze_frame(analyzer, cropper, item.image, item.name)
+        if mode != 'visualize':
+            return None
+
+        # Reuse the decoded pixels as BGR instead of reading the file a second time
+        img = np.ascontiguousarray(item.image[:, :, ::-1])
+        item.image = None
+        viz_img = analyzer.visualize_analysis(img, metrics)
+        item.outputs = [(output_name(item.name, '_analyzed'), viz_img)]
+        return item
+
+    def write(item: WorkItem) -> None:
+        write_outputs(item)
+        print(f"Saved visualization for {item.name}")
+
+    write_outputs = make_writer(sink)
+    stages = [
+        Stage('read', read_bytes, workers['read'], queue_size),
+        Stage('decode', decode, workers['decode'], queue_size),
+        Stage('analyze', analyze, num_threads, queue_size)
+    ]
+    if mode == 'visualize':
+        stages += [
+            Stage('encode', encode_outputs, workers['encode'], queue_size),
+            Stage('write', write, workers['write'], queue_size)
+        ]
+    return stages
+
+def prepare_instances(
+    analyzer: Optional[ImageQualityAnalyzer],
+    cropper: Optional['FaceCropper'],
+    face_roi: bool = False,
+    **analyzer_kwargs
+) -> Tuple[ImageQualityAnalyzer, Optional['FaceCropper']]:
+    """Create the analyzer, or reset a warm one, and the cropper when face_roi needs one"""
+    if analyzer is None:
+        analyzer = ImageQualityAnalyzer(**analyzer_kwargs)
+    else:
+        analyzer.reset(**analyzer_kwargs)
+    if not face_roi:
+        cropper = None
+    elif cropper is None:
+        # OpenCV is only loaded when faces are needed
+        from face_detection.detector import FaceCropper
+        cropper = FaceCropper()
+    return analyzer, cropper
+
+def analyze_items(
+    source: Any,
+    image_paths: List[str],
+    analyzer: ImageQualityAnalyzer,
+    output_dir: Path,
+    mode: str = 'analyze',
+    num_threads: int = 4,
+    face_roi: bool = False,
+    cropper: Optional['FaceCropper'] = None,
+    stage_workers: Optional[Dict[str, int]] = None,
+    queue_size: int = 16,
+    shard: Optional[Tuple[int, int]] = None,
+    tar_max_bytes: Optional[int] = None,
+    processes: int = 0,
+    slot_bytes: int = 48 << 20,
+    library_threads: Optional[int] = None
+) -> None:
+    """Analyze the named images of a source, collecting metrics into analyzer"""
+    if processes:
+        run_processes(
+            source, image_paths, analyzer,
+            face_roi=face_roi,
+            processes=processes,
+            decoders=(stage_workers or {}).get('decode', 2),
+            slot_bytes=slot_bytes,
+            library_threads=library_threads
+        )
+        return
+
+    if tar_max_bytes:
+        # Visualizations go into size-capped tar shards, written sequentially
+        sink = TarShardSink(output_dir, f"visualizations{shard_suffix(*shard) if shard else ''}", tar_max_bytes)
+        stage_workers = {**(stage_workers or {}), 'write': 1}
+    else:
+        sink = DirectorySink(output_dir)
+
+    pipeline = StagedPipeline(build_stages(
+        sink, analyzer,
+        mode=mode,
+        num_threads=num_threads,
+        cropper=cropper,
+        stage_workers=stage_workers,
+        queue_size=queue_size
+    ))
+    try:
+        pipeline.run(source.items(image_paths))
+    finally:
+        sink.close()
+    print(f"\n{pipeline.report()}")
 
 def process_directory(
     input_dir: str,
     output_dir: Path,
     mode: str = 'analyze',
     num_threads: int = 4,
+    face_roi: bool = False,
+    stage_workers: Optional[Dict[str, int]] = None,
+    queue_size: int = 16,
+    shard: Optional[Tuple[int, int]] = None,
+    tar_max_bytes: Optional[int] = None,
+    analyzer: Optional[ImageQualityAnalyzer] = None,
+    cropper: Optional['FaceCropper'] = None,
+    processes: int = 0,
+    slot_bytes: int = 48 << 20,
+    auto_tune: bool = False,
     **analyzer_kwargs
-) -> None:
-    """Process all images in a directory"""
-    analyzer = ImageQualityAnalyzer(**analyzer_kwargs)
-    image_paths = []
-    
+) -> Dict:
+    """Process all images in a directory or zip/tar archive, or only one shard of them.
+
+    A long-running caller can pass in warm analyzer and cropper instances to
+    reuse; the analyzer is reset with analyzer_kwargs. With processes > 0 the
+    analysis runs in that many worker processes fed through shared memory
+    instead of threads. With auto_tune the thread, process and library
+    thread counts are chosen from a measured warm-up on the first images
+    instead. Returns the dataset summary.
+    """
+    from pipeline.tuning import AutoTuner, Concurrency
+
+    if processes and mode == 'visualize':
+        raise ValueError("Worker processes only support analyze mode")
+    if auto_tune and tar_max_bytes:
+        raise ValueError("Auto-tuning writes loose visualizations; tar output is not supported")
+    analyzer, cropper = prepare_instances(analyzer, cropper, face_roi, **analyzer_kwargs)
+
     # Collect all image files
-    for ext in ('*.jpg', '*.jpeg', '*.png'):
-        image_paths.extend(Path(input_dir).glob(ext))
+    source = open_source(Path(input_dir), IMAGE_PATTERNS)
+    if auto_tune:
+        require_random_access(source, 'auto-tune probe')
+    image_paths = source.names
+
+    results_name = RESULTS_NAME
+    if shard is not None:
+        image_paths = select_shard(image_paths, *shard)
+        results_name += shard_suffix(*shard)
     
     if not image_paths:
         print(f"No images found in {input_dir}")
-        return
+        if shard is not None:
+            # Still record the empty shard so the merge can tell it ran
+            save_results(output_dir / f"{results_name}.json", [], analyzer.get_dataset_summary(), analyzer.thresholds())
+        return analyzer.get_dataset_summary()
+
+    def run_batch(names: List[str], concurrency: Concurrency) -> None:
+        analyzer.fft_workers = concurrency.library_threads
+        analyze_items(
+            source, names, analyzer, output_dir,
+            mode=mode,
+            num_threads=concurrency.threads,
+            face_roi=face_roi,
+            cropper=cropper,
+            stage_workers=stage_workers,
+            queue_size=queue_size,
+            shard=shard,
+            tar_max_bytes=tar_max_bytes,
+            processes=concurrency.processes,
+            slot_bytes=slot_bytes,
+            library_threads=concurrency.library_threads if auto_tune else None
+        )
 
     print(f"Processing {len(image_paths)} images...")
+    fft_workers = analyzer.fft_workers
+    try:
+        if auto_tune:
+            AutoTuner(run_batch, allow_processes=mode == 'analyze').run(image_paths)
+        else:
+            run_batch(image_paths, Concurrency(num_threads, processes, fft_workers))
+    finally:
+        analyzer.fft_workers = fft_workers
+        source.close()
 
-    results = []
-    
-    def process_image(path: Path):
-        try:
-            # Analyze image
-            metrics = analyzer.analyze_image(str(path))
-            results.append(asdict(metrics))
-            
-            # Handle visualization if requested
-            if mode == 'visualize':
-                # Read image with OpenCV for visualization
-                img = cv2.imread(str(path))
-                if img is not None:
-                    viz_img = analyzer.visualize_analysis(img, metrics)
-                    output_path = output_dir / f"{path.stem}_analyzed{path.suffix}"
-                    cv2.imwrite(str(output_path), viz_img)
-                    print(f"Saved visualization for {path.name}")
-        except Exception as e:
-            logging.error(f"Error processing {path}: {str(e)}")
-
-    # Process images in parallel
-    with ThreadPoolExecutor(max_workers=num_threads) as executor:
-        list(executor.map(process_image, image_paths))
+    if analyzer.pixel_cache is not None and not processes:
+        print(f"Pixel cache: {analyzer.pixel_cache.hits} hits, {analyzer.pixel_cache.misses} misses")
 
     # Get dataset summary
     summary = analyzer.get_dataset_summary()
+    results = [asdict(metrics) for metrics in analyzer.analyzed_images]
+    save_results(output_dir / f"{results_name}.json", results, summary, analyzer.thresholds())
     
-    # Save results
+    print(f"\nResults saved to {output_dir}")
+    print_summary(summary)
+    return summary
+
+def watch_directory(
+    input_dir: str,
+    output_dir: Path,
+    mode: str = 'analyze',
+    num_threads: int = 4,
+    face_roi: bool = False,
+    stage_workers: Optional[Dict[str, int]] = None,
+    queue_size: int = 16,
+    shard: Optional[Tuple[int, int]] = None,
+    analyzer: Optional[ImageQualityAnalyzer] = None,
+    cropper: Optional['FaceCropper'] = None,
+    processes: int = 0,
+    slot_bytes: int = 48 << 20,
+    settle: float = 2.0,
+    poll_interval: float = 1.0,
+    use_inotify: bool = True,
+    stop: Optional[threading.Event] = None,
+    save_interval: float = 30.0,
+    **analyzer_kwargs
+) -> Dict:
+    """Analyze a directory, then keep analyzing new and changed images until stopped.
+
+    Only the images that changed are analyzed; results of changed and removed
+    images are replaced or dropped in a running summary. Writing the result
+    file and clustering near-duplicates take time in proportion to all the
+    images, so that happens at most every save_interval seconds (right after
+    the first batch, then while there are unsaved changes) and when the
+    watch stops. Stops on SIGINT/SIGTERM unless a stop event is given.
+    Returns the final dataset summary.
+    """
+    from pipeline.watch import DirectoryWatcher, stop_on_signal
+
+    if processes and mode == 'visualize':
+        raise ValueError("Worker processes only support analyze mode")
+    if is_archive(Path(input_dir)):
+        raise ValueError("Watch mode needs a directory, not an archive")
+    analyzer, cropper = prepare_instances(analyzer, cropper, face_roi, **analyzer_kwargs)
+
+    results_path = output_dir / f"{RESULTS_NAME}{shard_suffix(*shard) if shard else ''}.json"
+    summary = RunningSummary(analyzer.duplicate_distance)
+    watcher = DirectoryWatcher(input_dir, IMAGE_PATTERNS, settle, poll_interval, use_inotify)
+    if stop is None:
+        stop = stop_on_signal()
+    print(f"Watching {input_dir} for new images ({watcher.mode}), Ctrl-C to stop")
+
+    def analyze_batch(ready: List[str], removed: List[str]) -> None:
+        for name in ready + removed:
+            summary.remove(name)
+        if ready:
+            print(f"\nProcessing {len(ready)} new or changed images...")
+            analyze_items(
+                DirectorySource(Path(input_dir), IMAGE_PATTERNS, ready), ready, analyzer, output_dir,
+                mode=mode,
+                num_threads=num_threads,
+                face_roi=face_roi,
+                cropper=cropper,
+                stage_workers=stage_workers,
+                queue_size=queue_size,
+                processes=processes,
+                slot_bytes=slot_bytes
+            )
+            for metrics in analyzer.analyzed_images:
+                summary.add(metrics)
+            analyzer.analyzed_images.clear()
+
+        # Counts only; duplicate clusters are rebuilt when the results are saved
+        current = summary.summary(duplicates=False)
+        print(
+            f"{time.strftime('%H:%M:%S')} {len(ready)} analyzed, {len(removed)} removed - "
+            f"{current.get('total_images', 0)} images, {current.get('accepted_images', 0)} accepted"
+        )
+
+    def save() -> None:
+        save_results(results_path, [asdict(m) for m in summary.metrics.values()], summary.summary(), analyzer.thresholds())
+        print(f"{time.strftime('%H:%M:%S')} results saved to {results_path}")
+
+    last_save = -math.inf
+    unsaved = False
+    try:
+        # Idle batches let unsaved changes be written on time when nothing arrives
+        for ready, removed in watcher.batches(stop, idle=True):
+            if shard is not None:
+                ready, removed = select_shard(ready, *shard), select_shard(removed, *shard)
+            if ready or removed:
+                analyze_batch(ready, removed)
+                unsaved = True
+            if unsaved and time.monotonic() - last_save >= save_interval:
+                save()
+                last_save, unsaved = time.monotonic(), False
+    finally:
+        if unsaved:
+            save()
+
+    final = summary.summary()
+    if 'error' not in final:
+        print_summary(final)
+    return final
+
+def estimate_directory(
+    input_dir: str,
+    output_dir: Path,
+    num_threads: int = 4,
+    face_roi: bool = False,
+    stage_workers: Optional[Dict[str, int]] = None,
+    queue_size: int = 16,
+    shard: Optional[Tuple[int, int]] = None,
+    analyzer: Optional[ImageQualityAnalyzer] = None,
+    cropper: Optional['FaceCropper'] = None,
+    processes: int = 0,
+    slot_bytes: int = 48 << 20,
+    target_precision: float = 0.02,
+    confidence: float = 0.95,
+    initial_sample: int = 200,
+    seed: int = 0,
+    **analyzer_kwargs
+) -> Dict:
+    """Estimate the dataset summary from a stratified random sample, grown until precise enough.
+
+    Images are stratified by resolution and file size from a header scan.
+    The sample grows, proportionally across strata, until every rate
+    (acceptance and each rejection reason) is known to within
+    +/- target_precision at the given confidence, or every image has been
+    analyzed. Returns the estimate, which is also saved with the sample results.
+    """
+    from image_quality.estimate import build_strata, estimate_summary, grow_sample, scan_headers, widest_rate_interval
+
+    analyzer, cropper = prepare_instances(analyzer, cropper, face_roi, **analyzer_kwargs)
+    source = open_source(Path(input_dir), IMAGE_PATTERNS)
+    require_random_access(source, 'sampling round')
+    image_paths = source.names
+    if shard is not None:
+        image_paths = select_shard(image_paths, *shard)
+    if not image_paths:
+        print(f"No images found in {input_dir}")
+        source.close()
+        return {"error": "No images analyzed"}
+
+    start = time.perf_counter()
+    print(f"Scanning headers of {len(image_paths)} images...")
+    strata = build_strata(scan_headers(source, image_paths), seed=seed)
+    print(f"{len(strata)} strata by resolution and file size, {time.perf_counter() - start:.1f}s")
+
+    results: Dict[str, ImageQualityMetrics] = {}
+    size = initial_sample
+    try:
+        while True:
+            added = grow_sample(strata, size)
+            print(f"\nAnalyzing {len(added)} more sampled images...")
+            analyze_items(
+                source, added, analyzer, output_dir,
+                num_threads=num_threads,
+                face_roi=face_roi,
+                cropper=cropper,
+                stage_workers=stage_workers,
+                queue_size=queue_size,
+                processes=processes,
+                slot_bytes=slot_bytes
+            )
+            for metrics in analyzer.analyzed_images:
+                results[metrics.filename] = metrics
+            analyzer.analyzed_images.clear()
+
+            estimate = estimate_summary(strata, results, confidence)
+            sampled = sum(stratum.sampled for stratum in strata)
+            if 'error' in estimate:
+                if sampled == len(image_paths):
+                    return estimate
+                size = 2 * sampled
+                continue
+            widest = widest_rate_interval(estimate)
+            acceptance = estimate['acceptance_rate']
+            print(
+                f"Sampled {sampled} of {len(image_paths)}: acceptance {acceptance['estimate']:.1%} "
+                f"({acceptance['low']:.1%}-{acceptance['high']:.1%}), widest rate interval +/-{widest:.1%}"
+            )
+            if widest <= target_precision or sampled == len(image_paths):
+                break
+            # Interval width shrinks with the square root of the sample size
+            needed = math.ceil(sampled * (widest / target_precision) ** 2)
+            size = min(max(needed, math.ceil(1.5 * sampled)), 4 * sampled)
+    finally:
+        source.close()
+
+    estimate['elapsed_seconds'] = time.perf_counter() - start
+    output_path = output_dir / f"{ESTIMATE_NAME}{shard_suffix(*shard) if shard else ''}.json"
+    save_results(output_path, [asdict(m) for m in results.values()], estimate, analyzer.thresholds())
+    print(f"\nEstimate saved to {output_path}")
+    print_estimate(estimate)
+    return estimate
+
+def run_processes(
+    source: Any,
+    image_paths: List[str],
+    analyzer: ImageQualityAnalyzer,
+    face_roi: bool = False,
+    processes: int = 4,
+    decoders: int = 2,
+    slot_bytes: int = 48 << 20,
+    library_threads: Optional[int] = None
+) -> None:
+    """Analyze the images in worker processes, collecting metrics into analyzer"""
+    from pipeline.shm import SharedFramePool
+
+    cache = analyzer.pixel_cache
+    settings = {
+        **analyzer.thresholds(),
+        'face_roi_size': analyzer.face_roi_size,
+        'min_face_coverage': analyzer.min_face_coverage,
+        'precision': analyzer.precision,
+        'memory_budget': analyzer.memory_budget,
+        'fft_workers': analyzer.fft_workers
+    }
+    job = AnalysisJob(
+        settings,
+        face_roi=face_roi,
+        pixel_cache=(str(cache.cache_dir), cache.max_bytes) if cache is not None else None
+    )
+    job.library_threads = library_threads
+    pool = SharedFramePool(job, workers=processes, decoders=decoders, slot_bytes=slot_bytes)
+    for name, metrics in pool.run(source.items(image_paths)):
+        if metrics is not None:
+            analyzer.analyzed_images.append(metrics)
+    print(f"\n{pool.report()}")
+
+def save_results(output_path: Path, results: List[Dict], summary: Dict, settings: Dict) -> None:
+    """Write per-image results, ordered by filename, with the dataset summary and thresholds used"""
     output = {
-        'individual_results': results,
-        'dataset_summary': summary
+        'individual_results': sorted(results, key=lambda r: r['filename']),
+        'dataset_summary': summary,
+        'settings': settings
     }
     
-    with open(output_dir / 'analysis_results.json', 'w') as f:
+    with open(output_path, 'w') as f:
         json.dump(output, f, indent=2)
-    
-    print(f"\nResults saved to {output_dir}")
+
+def print_summary(summary: Dict) -> None:
     print(f"\nSummary:")
     print(f"Total images: {summary['total_images']}")
     print(f"Accepted images: {summary['accepted_images']}")
     print("\nRejection reasons:")
     for reason, count in summary['rejection_reasons'].items():
         print(f"- {reason}: {count}")
+    duplicates = summary.get('duplicates')
+    if duplicates and duplicates['clusters']:
+        print(f"\nNear-duplicates: {duplicates['redundant_images']} images in {duplicates['clusters']} clusters")
+        for cluster in duplicates['groups']:
+            print(f"- keep {cluster['keep']}, drop {', '.join(cluster['duplicates'])}")
 
-def main():
-    parser = argparse.ArgumentParser(description='Analyze image quality in a directory')
-    parser.add_argument('input_directory', help='Directory containing input images')
+def print_estimate(estimate: Dict) -> None:
+    def interval(value: Dict[str, float], percent: bool = True) -> str:
+        if percent:
+            return f"{value['estimate']:.1%} ({value['low']:.1%}-{value['high']:.1%})"
+        return f"{value['estimate']:.1f} ({value['low']:.1f}-{value['high']:.1f})"
+
+    print(f"\nEstimated summary ({estimate['confidence']:.0%} confidence intervals):")
+    print(f"Images: {estimate['total_images']}, analyzed {estimate['analyzed_images']} of {estimate['sampled_images']} sampled")
+    print(f"Acceptance rate: {interval(estimate['acceptance_rate'])}")
+    print("\nRejection rates:")
+    for reason, rate in estimate['rejection_rates'].items():
+        print(f"- {reason}: {interval(rate)}")
+    print(f"- any other reason: below {estimate['unseen_reason_rate_bound']:.1%}")
+    print("\nAverage metrics:")
+    for name, value in estimate['average_metrics'].items():
+        print(f"- {name}: {interval(value, percent=False)}")
+
+def merge_results(results_dir: Path, output_path: Optional[Path] = None) -> Dict:
+    """Combine per-shard result files into the result of a single run.
+
+    Every shard of the run must be present; the summary is rebuilt from the
+    merged per-image results so it matches an unsharded run exactly.
+    """
+    # Exact match, so files derived from shard results (e.g. rescored ones)
+    # are not mistaken for shards
+    pattern = re.compile(rf"{re.escape(RESULTS_NAME)}\.shard-(\d+)-of-(\d+)\.json")
+    shards = {}
+    counts = set()
+    for path in sorted(results_dir.iterdir()):
+        match = pattern.fullmatch(path.name)
+        if not match:
+            continue
+        index, count = int(match.group(1)), int(match.group(2))
+        if index in shards:
+            raise ValueError(f"Shard {index} appears more than once in {results_dir}: {shards[index].name}, {path.name}")
+        shards[index] = path
+        counts.add(count)
+    if not shards:
+        raise FileNotFoundError(f"No shard results found in {results_dir}")
+    if len(counts) != 1:
+        raise ValueError(f"Shard results from runs with different shard counts: {sorted(counts)}")
+    expected = counts.pop()
+    out_of_range = sorted(index for index in shards if index >= expected)
+    if out_of_range:
+        raise ValueError(f"Shard results {out_of_range} are out of range for {expected} shards")
+    missing = sorted(set(range(expected)) - set(shards))
+    if missing:
+        raise ValueError(f"Found {len(shards)} of {expected} shard results in {results_dir}, missing shards {missing}")
+    shard_files = [shards[index] for index in range(expected)]
+
+    results = []
+    settings = []
+    for path in shard_files:
+        with open(path) as f:
+            shard_output = json.load(f)
+        results.extend(shard_output['individual_results'])
+        settings.append(shard_output.get('settings', {}))
+
+    if any(shard_settings != settings[0] for shard_settings in settings):
+        raise ValueError("Shard results were produced with different thresholds")
+
+    # Rebuilding the summary also re-clusters duplicates across shard boundaries
+    metrics = [ImageQualityMetrics(**record) for record in results]
+    summary = summarize_metrics(metrics, settings[0].get('duplicate_distance', 6))
+    results = [asdict(m) for m in metrics]
+    save_results(output_path or results_dir / f"{RESULTS_NAME}.json", results, summary, settings[0])
+    return summary
+
+def merge_main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(
+        prog='analyze_images.py merge',
+        description='Merge per-shard analysis results into a single result file'
+    )
+    parser.add_argument('results_directory', help='Directory containing the shard result files')
+    parser.add_argument('--output', help=f'Merged result file (default: {RESULTS_NAME}.json in the results directory)')
+    args = parser.parse_args(argv)
+
+    try:
+        summary = merge_results(Path(args.results_directory), Path(args.output) if args.output else None)
+    except (FileNotFoundError, ValueError) as e:
+        parser.error(str(e))
+    print(f"Merged results saved to {args.output or Path(args.results_directory) / f'{RESULTS_NAME}.json'}")
+    print_summary(summary)
+
+def rescore_main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(
+        prog='analyze_images.py rescore',
+        description='Apply new quality thresholds to stored analysis results without re-analyzing images'
+    )
+    parser.add_argument('results_file', help='analysis_results.json from a previous run')
+    parser.add_argument('--output', help='Rescored result file (default: <results_file>.rescored.json)')
+    add_threshold_arguments(parser, use_defaults=False)
+    args = parser.parse_args(argv)
+
+    results_path = Path(args.results_file)
+    with open(results_path) as f:
+        stored = json.load(f)
+
+    # Unspecified thresholds keep the values the results were produced with
+    settings = {**stored.get('settings', {}), **threshold_kwargs(args)}
+
+    start = time.perf_counter()
+    analyzer = ImageQualityAnalyzer(**settings)
+    try:
+        analyzer.rescore(stored['individual_results'])
+    except ValueError as e:
+        parser.error(str(e))
+    summary = analyzer.get_dataset_summary()
+    elapsed = time.perf_counter() - start
+
+    output_path = Path(args.output) if args.output else results_path.with_suffix('.rescored.json')
+    save_results(output_path, [asdict(m) for m in analyzer.analyzed_images], summary, analyzer.thresholds())
+    print(f"Rescored {len(analyzer.analyzed_images)} images in {elapsed:.3f}s, saved to {output_path}")
+    print_summary(summary)
+
+def add_threshold_arguments(parser: argparse.ArgumentParser, use_defaults: bool = True) -> None:
+    """Quality threshold options, shared by analysis and rescoring"""
+    thresholds = [
+        ('--min-width', int, 800, 'Minimum acceptable width'),
+        ('--min-height', int, 600, 'Minimum acceptable height'),
+        ('--min-saturation', float, 0.2, 'Minimum acceptable saturation'),
+        ('--max-saturation', float, 0.8, 'Maximum acceptable saturation'),
+        ('--min-contrast', float, 0.3, 'Minimum acceptable contrast'),
+        ('--blur-threshold', float, 100.0, 'Blur detection threshold'),
+        ('--duplicate-distance', int, 6, 'Maximum perceptual hash distance (bits) for near-duplicates')
+    ]
+    group = parser.add_argument_group('quality thresholds')
+    for flag, type_, default, help_text in thresholds:
+        if use_defaults:
+            group.add_argument(flag, type=type_, default=default, help=f'{help_text} (default: {default})')
+        else:
+            group.add_argument(flag, type=type_, help=f'{help_text} (default: value stored with the results)')
+
+def threshold_kwargs(args: argparse.Namespace) -> Dict:
+    """Analyzer keyword arguments for the threshold options that were given"""
+    names = (
+        'min_width', 'min_height', 'min_saturation', 'max_saturation',
+        'min_contrast', 'blur_threshold', 'duplicate_distance'
+    )
+    return {name: getattr(args, name) for name in names if getattr(args, name) is not None}
+
+def build_parser() -> argparse.ArgumentParser:
+    from pipeline.watch import add_watch_arguments
+
+    parser = argparse.ArgumentParser(
+        description='Analyze image quality in a directory',
+        epilog='Use "analyze_images.py merge RESULTS_DIR" to combine --shard results, '
+               'and "analyze_images.py rescore RESULTS_FILE" to apply new thresholds to stored results'
+    )
+    parser.add_argument('input_directory', help='Directory or zip/tar archive containing input images')
     parser.add_argument('output_directory', help='Directory to save analysis results')
     parser.add_argument('--mode', choices=['analyze', 'visualize'], default='analyze',
                       help='Processing mode: analyze only or visualize analysis (default: analyze)')
     parser.add_argument('--threads', '-t', type=int, default=4,
-                      help='Number of threads to use (default: 4)')
-    # Quality thresholds
-    parser.add_argument('--min-width', type=int, default=800,
-                      help='Minimum acceptable width (default: 800)')
-    parser.add_argument('--min-height', type=int, default=600,
-                      help='Minimum acceptable height (default: 600)')
-    parser.add_argument('--min-saturation', type=float, default=0.2,
-                      help='Minimum acceptable saturation (default: 0.2)')
-    parser.add_argument('--max-saturation', type=float, default=0.8,
-                      help='Maximum acceptable saturation (default: 0.8)')
-    parser.add_argument('--min-contrast', type=float, default=0.3,
-                      help='Minimum acceptable contrast (default: 0.3)')
-    parser.add_argument('--blur-threshold', type=float, default=100.0,
-                      help='Blur detection threshold (default: 100.0)')
-    
-    args = parser.parse_args()
-    
+                      help='Number of analysis threads to use (default: 4)')
+    parser.add_argument('--auto-tune', action='store_true',
+                      help='Choose --threads/--processes and the OpenCV and FFT thread counts from a measured warm-up on the first images')
+    parser.add_argument('--read-workers', type=int, default=2,
+                      help='Threads reading files from disk (default: 2)')
+    parser.add_argument('--decode-workers', type=int, default=2,
+                      help='Threads decoding images (default: 2)')
+    parser.add_argument('--encode-workers', type=int, default=2,
+                      help='Threads encoding visualizations (default: 2)')
+    parser.add_argument('--write-workers', type=int, default=1,
+                      help='Threads writing visualizations to disk (default: 1)')
+    parser.add_argument('--queue-size', type=int, default=16,
+                      help='Maximum items waiting between two stages (default: 16)')
+    parser.add_argument('--tar-output', action='store_true',
+                      help='Write visualizations into tar shards instead of one file per image')
+    parser.add_argument('--tar-max-mb', type=int, default=1024,
+                      help='Maximum size of each tar shard in MB (default: 1024)')
+    parser.add_argument('--pixel-cache',
+                      help='Directory for a memory-mapped cache of decoded pixels, reused across runs')
+    parser.add_argument('--pixel-cache-mb', type=int, default=10240,
+                      help='Maximum pixel cache size in MB (default: 10240)')
+    parser.add_argument('--processes', type=int, default=0,
+                      help='Analyze in this many worker processes fed through shared memory instead of threads (analyze mode only)')
+    parser.add_argument('--slot-mb', type=int, default=48,
+                      help='Size of each shared memory frame slot in MB with --processes; larger images are piped (default: 48)')
+    parser.add_argument('--shard', type=parse_shard,
+                      help='Only process shard i of N (e.g. 0/4) and write per-shard results')
+    watch = add_watch_arguments(parser)
+    watch.add_argument('--save-interval', type=float, default=30.0,
+                       help='Seconds between rewrites of the result file while watching; it is also written on exit (default: 30)')
+    estimate = parser.add_argument_group('estimate mode')
+    estimate.add_argument('--estimate', action='store_true',
+                          help='Estimate the summary from a stratified random sample instead of analyzing every image')
+    estimate.add_argument('--estimate-precision', type=float, default=0.02,
+                          help='Grow the sample until every rate is known to within +/- this fraction (default: 0.02)')
+    estimate.add_argument('--estimate-confidence', type=float, default=0.95,
+                          help='Confidence level of the intervals (default: 0.95)')
+    estimate.add_argument('--estimate-sample', type=int, default=200,
+                          help='Size of the first sample (default: 200)')
+    estimate.add_argument('--seed', type=int, default=0,
+                          help='Random seed for drawing the sample (default: 0)')
+    parser.add_argument('--face-roi', action='store_true',
+                      help='Score blur and detail on detected faces only, resampled to --face-roi-size')
+    parser.add_argument('--face-roi-size', type=int, default=224,
+                      help='Side of the square face patch used in --face-roi mode (default: 224)')
+    parser.add_argument('--precision', choices=['float64', 'float32'], default='float64',
+                      help='Float precision of the analysis; float32 needs less than half the memory (default: float64)')
+    parser.add_argument('--memory-budget-mb', type=int,
+                      help='Memory one analysis may use; larger images are skipped with an error (default: no limit)')
+    add_threshold_arguments(parser)
+    return parser
+
+def validate_args(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """Reject option combinations that parse but can't run, through parser.error"""
+    if args.processes and args.mode == 'visualize':
+        parser.error("--processes only supports --mode analyze")
+    if args.watch and args.tar_output:
+        parser.error("--watch writes loose files; --tar-output is not supported")
+    if args.estimate and (args.watch or args.mode == 'visualize'):
+        parser.error("--estimate only supports --mode analyze without --watch")
+    if args.auto_tune and (args.watch or args.estimate or args.tar_output):
+        parser.error("--auto-tune only supports full runs without --watch, --estimate or --tar-output")
+    if not 0 < args.estimate_confidence < 1:
+        parser.error("--estimate-confidence must be between 0 and 1")
+
+def run(
+    args: argparse.Namespace,
+    analyzer: Optional[ImageQualityAnalyzer] = None,
+    cropper: Optional['FaceCropper'] = None
+) -> Dict:
+    """Run an analysis from parsed command line arguments, optionally on warm instances"""
+    from pipeline.cache import PixelCache
+
     # Create output directory if it doesn't exist
     output_dir = Path(args.output_directory)
     output_dir.mkdir(parents=True, exist_ok=True)
-    
-    process_directory(
+
+    analyzer_kwargs = threshold_kwargs(args)
+    analyzer_kwargs['precision'] = args.precision
+    analyzer_kwargs['memory_budget'] = args.memory_budget_mb * 1024 * 1024 if args.memory_budget_mb else None
+    # A new cache object per run, so a warm analyzer neither keeps the last job's cache nor its counts
+    analyzer_kwargs['pixel_cache'] = PixelCache(args.pixel_cache, args.pixel_cache_mb * 1024 * 1024) if args.pixel_cache else None
+    if cropper is not None:
+        # Face ROI detection uses the defaults, like the cropper a single run creates
+        cropper.reset()
+
+    stage_workers = {
+        'read': args.read_workers,
+        'decode': args.decode_workers,
+        'encode': args.encode_workers,
+        'write': args.write_workers
+    }
+    if args.estimate:
+        return estimate_directory(
+            args.input_directory,
+            output_dir,
+            num_threads=args.threads,
+            face_roi=args.face_roi,
+            stage_workers=stage_workers,
+            queue_size=args.queue_size,
+            shard=args.shard,
+            analyzer=analyzer,
+            cropper=cropper,
+            processes=args.processes,
+            slot_bytes=args.slot_mb * 1024 * 1024,
+            target_precision=args.estimate_precision,
+            confidence=args.estimate_confidence,
+            initial_sample=args.estimate_sample,
+            seed=args.seed,
+            face_roi_size=(args.face_roi_size, args.face_roi_size),
+            **analyzer_kwargs
+        )
+    if args.watch:
+        return watch_directory(
+            args.input_directory,
+            output_dir,
+            mode=args.mode,
+            num_threads=args.threads,
+            face_roi=args.face_roi,
+            stage_workers=stage_workers,
+            queue_size=args.queue_size,
+            shard=args.shard,
+            analyzer=analyzer,
+            cropper=cropper,
+            processes=args.processes,
+            slot_bytes=args.slot_mb * 1024 * 1024,
+            settle=args.settle,
+            poll_interval=args.poll_interval,
+            use_inotify=not args.poll,
+            save_interval=args.save_interval,
+            face_roi_size=(args.face_roi_size, args.face_roi_size),
+            **analyzer_kwargs
+        )
+
+    return process_directory(
         args.input_directory,
         output_dir,
         mode=args.mode,
         num_threads=args.threads,
-        min_width=args.min_width,
-        min_height=args.min_height,
-        min_saturation=args.min_saturation,
-        max_saturation=args.max_saturation,
-        min_contrast=args.min_contrast,
-        blur_threshold=args.blur_threshold
+        face_roi=args.face_roi,
+        stage_workers=stage_workers,
+        queue_size=args.queue_size,
+        shard=args.shard,
+        tar_max_bytes=args.tar_max_mb * 1024 * 1024 if args.tar_output else None,
+        analyzer=analyzer,
+        cropper=cropper,
+        processes=args.processes,
+        slot_bytes=args.slot_mb * 1024 * 1024,
+        auto_tune=args.auto_tune,
+        face_roi_size=(args.face_roi_size, args.face_roi_size),
+        **analyzer_kwargs
     )
 
+def main():
+    commands = {'merge': merge_main, 'rescore': rescore_main}
+    if len(sys.argv) > 1 and sys.argv[1] in commands:
+        return commands[sys.argv[1]](sys.argv[2:])
+
+    parser = build_parser()
+    args = parser.parse_args()
+    validate_args(parser, args)
+    try:
+        run(args)
+    except SequentialSourceError as e:
+        # Whether a tar can be seeked is only known once it has been opened
+        parser.error(str(e))
+
 if __name__ == '__main__':
     main() 
\ No newline at end of file
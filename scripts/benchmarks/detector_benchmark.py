@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+detector_benchmark.py - Speed, recall and precision of face detector configurations
+
+Builds a labelled fixture set by compositing faces onto backgrounds at
+controlled rotations and sizes, runs every detector configuration over it
+and reports images/s, recall and precision at IoU 0.5, recall by rotation
+and face size, the cascade time of each rotation on its own, and a Pareto
+table of the configurations no other one beats on all of speed, recall and
+precision.
+
+Faces come from the astronaut in scikit-image's sample data, or from
+--faces, a directory of photos labelled by their largest upright frontal
+detection. Backgrounds are synthetic, or random crops of --backgrounds.
+
+    python benchmarks/detector_benchmark.py
+    python benchmarks/detector_benchmark.py --configs full two-stage --per-cell 1
+    python benchmarks/detector_benchmark.py --config 'fast=angles:0,15,-15,30,-30;scale_factor:1.4'
+    python benchmarks/detector_benchmark.py --fixture-dir /tmp/faces_fixture --output results.json
+
+Detection runs single threaded, so images/s is per core.
+"""
+
+import sys
+import json
+import time
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from face_detection.detector import DETECTION_ANGLES, FaceCropper, FaceDetection
+
+IMAGE_SIZE = (1024, 768)
+# Rotations (applied clockwise and counterclockwise) and face sizes as a fraction of the shorter image side
+ROTATIONS = (0, 10, 20, 30, 45, 60, 90)
+FACE_SCALES = (0.08, 0.12, 0.2, 0.3)
+IOU_THRESHOLD = 0.5
+
+# Named FaceCropper settings; --config adds more
+PRESETS: Dict[str, Dict[str, Any]] = {
+    'full': {},
+    'full-sf1.2': {'scale_factor': 1.2},
+    'full-mn3': {'min_neighbors': 3},
+    'full-mn5': {'min_neighbors': 5},
+    'full-9-angles': {'angles': (0, 15, -15, 30, -30, 45, -45, 90, -90)},
+    'full-upright': {'angles': (0, 10, -10, 20, -20)},
+    'two-stage': {'detection': 'two-stage'},
+    'two-stage-512': {'detection': 'two-stage', 'proposal_size': 512}
+}
+
+Box = Tuple[int, int, int, int]
+
+@dataclass
+class Fixture:
+    name: str
+    image: np.ndarray
+    # Upright bounding boxes of each face, with the rotation and size it was composited at
+    faces: List[Dict[str, Any]]
+
+def _largest_frontal_face(gray: np.ndarray) -> Optional[Box]:
+    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    boxes = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(40, 40))
+    if not len(boxes):
+        return None
+    return tuple(int(v) for v in max(boxes, key=lambda b: b[2] * b[3]))
+
+def face_sources(directory: Optional[Path]) -> List[Tuple[np.ndarray, Box]]:
+    """(BGR image, face box) pairs to composite faces from"""
+    if directory is None:
+        from skimage import data
+
+        images = [cv2.cvtColor(data.astronaut(), cv2.COLOR_RGB2BGR)]
+    else:
+        images = [cv2.imread(str(p)) for p in sorted(directory.iterdir()) if p.suffix.lower() in ('.jpg', '.jpeg', '.png')]
+    sources = []
+    for image in images:
+        if image is None:
+            continue
+        box = _largest_frontal_face(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+        if box is not None:
+            sources.append((image, box))
+    if not sources:
+        raise SystemExit("No upright frontal face found in the face images")
+    return sources
+
+def background(rng: np.random.Generator, pool: List[np.ndarray]) -> np.ndarray:
+    """A random crop of a background image, or smooth color fields with shapes and noise"""
+    width, height = IMAGE_SIZE
+    if pool:
+        image = pool[rng.integers(len(pool))]
+        scale = max(width / image.shape[1], height / image.shape[0])
+        if scale > 1:
+            image = cv2.resize(image, (int(np.ceil(image.shape[1] * scale)), int(np.ceil(image.shape[0] * scale))))
+        x0 = rng.integers(image.shape[1] - width + 1)
+        y0 = rng.integers(image.shape[0] - height + 1)
+        return image[y0:y0 + height, x0:x0 + width].copy()
+
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    image = np.empty((height, width, 3), dtype=np.float32)
+    for channel in range(3):
+        fx, fy = rng.uniform(1, 6, 2)
+        image[:, :, channel] = 127 + 80 * np.sin(x / width * fx * np.pi) * np.cos(y / height * fy * np.pi)
+    for _ in range(25):
+        x0, y0 = rng.integers(0, width - 40), rng.integers(0, height - 40)
+        image[y0:y0 + rng.integers(10, 250), x0:x0 + rng.integers(10, 250)] = rng.uniform(0, 255, 3)
+    image = cv2.GaussianBlur(image, (0, 0), 1.5) + rng.normal(0, 6, image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+def composite(canvas: np.ndarray, source: np.ndarray, face: Box, size: int, angle: float, center: Tuple[int, int]) -> Box:
+    """Paste the face, scaled to size pixels and rotated by angle degrees, onto canvas at center.
+
+    The head is blended in through a feathered ellipse. Returns the upright
+    bounding box of the rotated face box, which is what the detector reports
+    for a face it finds in a rotated copy of the image.
+    """
+    x, y, w, h = face
+    scale = size / w
+    face_center = (x + w / 2, y + h / 2)
+    # Source pixels map onto the canvas scaled and rotated about the face center
+    M = cv2.getRotationMatrix2D(face_center, angle, scale)
+    M[0, 2] += center[0] - face_center[0]
+    M[1, 2] += center[1] - face_center[1]
+    height, width = canvas.shape[:2]
+    warped = cv2.warpAffine(source, M, (width, height), flags=cv2.INTER_LINEAR)
+
+    mask = np.zeros(source.shape[:2], dtype=np.float32)
+    axes = (int(w * 0.75), int(h * 0.95))
+    cv2.ellipse(mask, (int(face_center[0]), int(face_center[1] - h * 0.1)), axes, 0, 0, 360, 1.0, -1)
+    mask = cv2.GaussianBlur(mask, (0, 0), w * 0.08)
+    alpha = cv2.warpAffine(mask, M, (width, height))[:, :, None]
+    canvas[:] = (warped * alpha + canvas * (1 - alpha)).astype(np.uint8)
+
+    corners = np.array([[x, y, 1], [x + w, y, 1], [x + w, y + h, 1], [x, y + h, 1]], dtype=np.float64) @ M.T
+    x0, y0 = corners.min(axis=0)
+    x1, y1 = corners.max(axis=0)
+    return int(x0), int(y0), int(x1 - x0), int(y1 - y0)
+
+def build_fixtures(
+    sources: List[Tuple[np.ndarray, Box]],
+    backgrounds: List[np.ndarray],
+    per_cell: int = 2,
+    negatives: int = 8,
+    seed: int = 0
+) -> List[Fixture]:
+    """per_cell images with one face for every rotation and face size, plus faceless negatives.
+
+    Images go through JPEG at quality 90 like the photos the detector sees.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = IMAGE_SIZE
+    fixtures = []
+    for rotation in ROTATIONS:
+        for face_scale in FACE_SCALES:
+            for index in range(per_cell):
+                angle = rotation if index % 2 == 0 else -rotation
+                size = int(face_scale * min(width, height))
+                # Keep the rotated head inside the image
+                reach = int(size * 0.9)
+                center = (int(rng.integers(reach, width - reach)), int(rng.integers(reach, height - reach)))
+                canvas = background(rng, backgrounds)
+                source, face = sources[rng.integers(len(sources))]
+                box = composite(canvas, source, face, size, angle, center)
+                fixtures.append(Fixture(
+                    f"face_r{angle:+d}_s{face_scale:.2f}_{index}", canvas,
+                    [{'box': box, 'rotation': rotation, 'scale': face_scale}]
+                ))
+    for index in range(negatives):
+        fixtures.append(Fixture(f"negative_{index}", background(rng, backgrounds), []))
+
+    for fixture in fixtures:
+        encoded = cv2.imencode('.jpg', fixture.image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1]
+        fixture.image = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+    return fixtures
+
+def save_fixtures(fixtures: List[Fixture], directory: Path) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    labels = {}
+    for fixture in fixtures:
+        cv2.imwrite(str(directory / f"{fixture.name}.png"), fixture.image)
+        labels[f"{fixture.name}.png"] = fixture.faces
+    (directory / 'labels.json').write_text(json.dumps(labels, indent=2))
+
+def load_fixtures(directory: Path) -> List[Fixture]:
+    labels = json.loads((directory / 'labels.json').read_text())
+    return [
+        Fixture(Path(name).stem, cv2.imread(str(directory / name)), [{**face, 'box': tuple(face['box'])} for face in faces])
+        for name, faces in labels.items()
+    ]
+
+def _iou(a: Box, b: Box) -> float:
+    return FaceDetection(*a).calculate_iou(FaceDetection(*b))
+
+def match(detections: List[FaceDetection], truth: List[Box]) -> Tuple[List[bool], int]:
+    """Greedy matching, most confident detection first: which true faces were found, and the true positives"""
+    found = [False] * len(truth)
+    for detection in sorted(detections, key=lambda d: d.confidence, reverse=True):
+        ious = [0.0 if found[i] else _iou(detection.get_box(), box) for i, box in enumerate(truth)]
+        if ious and max(ious) >= IOU_THRESHOLD:
+            found[int(np.argmax(ious))] = True
+    return found, sum(found)
+
+def evaluate(cropper: FaceCropper, fixtures: Sequence[Fixture], grays: Sequence[np.ndarray]) -> Dict[str, Any]:
+    """Time, recall and precision of one configuration over the fixtures"""
+    seconds = 0.0
+    true_positives = detected = faces = 0
+    by_rotation: Dict[int, List[bool]] = {}
+    by_scale: Dict[float, List[bool]] = {}
+    for fixture, gray in zip(fixtures, grays):
+        start = time.perf_counter()
+        detections = cropper.detect_faces(gray)
+        seconds += time.perf_counter() - start
+        found, hits = match(detections, [face['box'] for face in fixture.faces])
+        true_positives += hits
+        detected += len(detections)
+        faces += len(fixture.faces)
+        for face, hit in zip(fixture.faces, found):
+            by_rotation.setdefault(face['rotation'], []).append(hit)
+            by_scale.setdefault(face['scale'], []).append(hit)
+    return {
+        'images_per_second': len(fixtures) / seconds,
+        'recall': true_positives / faces if faces else 0.0,
+        'precision': true_positives / detected if detected else 1.0,
+        'detections': detected,
+        'recall_by_rotation': {str(k): float(np.mean(v)) for k, v in sorted(by_rotation.items())},
+        'recall_by_scale': {f"{k:.2f}": float(np.mean(v)) for k, v in sorted(by_scale.items())}
+    }
+
+def angle_costs(fixtures: Sequence[Fixture], grays: Sequence[np.ndarray], angles: Sequence[int]) -> Dict[int, Dict[str, float]]:
+    """Milliseconds per image and faces found by the full pass at each rotation on its own.
+
+    The full pass runs every rotation independently, so its time is about
+    the sum of these; a rotation that costs a lot but only finds faces other
+    rotations find too is a candidate for dropping.
+    """
+    costs = {}
+    for angle in angles:
+        result = evaluate(FaceCropper(angles=(angle,)), fixtures, grays)
+        costs[angle] = {'ms_per_image': 1000 / result['images_per_second'], 'recall': result['recall']}
+    return costs
+
+def pareto_front(results: Dict[str, Dict[str, Any]]) -> List[str]:
+    """Configurations that no other one matches or beats on speed, recall and precision together"""
+    keys = ('images_per_second', 'recall', 'precision')
+    front = []
+    for name, result in results.items():
+        dominated = any(
+            all(other[k] >= result[k] for k in keys) and any(other[k] > result[k] for k in keys)
+            for other_name, other in results.items() if other_name != name
+        )
+        if not dominated:
+            front.append(name)
+    return front
+
+def parse_config(spec: str) -> Tuple[str, Dict[str, Any]]:
+    """'name=key:value;key:value' into a name and FaceCropper keyword arguments"""
+    name, _, settings = spec.partition('=')
+    kwargs: Dict[str, Any] = {}
+    for setting in filter(None, settings.split(';')):
+        key, _, value = setting.partition(':')
+        if key == 'angles':
+            kwargs[key] = tuple(int(a) for a in value.split(','))
+        elif key == 'scale_factor':
+            kwargs[key] = float(value)
+        elif key in ('min_neighbors', 'proposal_size'):
+            kwargs[key] = int(value)
+        elif key == 'detection':
+            kwargs[key] = value
+        else:
+            raise argparse.ArgumentTypeError(f"Unknown setting {key!r} in {spec!r}")
+    return name, kwargs
+
+def main():
+    parser = argparse.ArgumentParser(description='Face detector speed, recall and precision on composited faces')
+    parser.add_argument('--configs', nargs='+', choices=list(PRESETS), default=list(PRESETS),
+                      help='Preset configurations to run (default: all)')
+    parser.add_argument('--config', type=parse_config, action='append', default=[],
+                      help="Extra configuration as name=key:value;..., with keys angles, scale_factor, "
+                           "min_neighbors, detection and proposal_size")
+    parser.add_argument('--faces', type=Path, help='Photos to take faces from (default: scikit-image astronaut)')
+    parser.add_argument('--backgrounds', type=Path, help='Photos without faces to use as backgrounds (default: synthetic)')
+    parser.add_argument('--per-cell', type=int, default=2,
+                      help='Images per rotation and face size, alternating the rotation direction (default: 2)')
+    parser.add_argument('--negatives', type=int, default=8, help='Images without faces (default: 8)')
+    parser.add_argument('--seed', type=int, default=0, help='Fixture random seed (default: 0)')
+    parser.add_argument('--fixture-dir', type=Path,
+                      help='Save the fixture set here, or load it if it already holds one')
+    parser.add_argument('--no-angle-costs', action='store_true', help='Skip timing each rotation on its own')
+    parser.add_argument('--output', type=Path, help='Also write all results to this JSON file')
+    args = parser.parse_args()
+    cv2.setNumThreads(1)
+
+    if args.fixture_dir is not None and (args.fixture_dir / 'labels.json').exists():
+        fixtures = load_fixtures(args.fixture_dir)
+        print(f"Loaded {len(fixtures)} fixture images from {args.fixture_dir}")
+    else:
+        backgrounds = []
+        if args.backgrounds is not None:
+            backgrounds = [cv2.imread(str(p)) for p in sorted(args.backgrounds.iterdir()) if p.suffix.lower() in ('.jpg', '.jpeg', '.png')]
+            backgrounds = [image for image in backgrounds if image is not None]
+        fixtures = build_fixtures(face_sources(args.faces), backgrounds, args.per_cell, args.negatives, args.seed)
+        if args.fixture_dir is not None:
+            save_fixtures(fixtures, args.fixture_dir)
+        print(f"Built {len(fixtures)} fixture images")
+    grays = [cv2.cvtColor(fixture.image, cv2.COLOR_BGR2GRAY) for fixture in fixtures]
+
+    configs = {name: PRESETS[name] for name in args.configs}
+    configs.update(args.config)
+    results = {}
+    print(f"\n{'config':<20} {'images/s':>9} {'recall':>7} {'precision':>9} {'detections':>10}")
+    for name, kwargs in configs.items():
+        cropper = FaceCropper(**kwargs)
+        # Load the cascades outside the timed runs
+        cropper.cascades
+        results[name] = {'settings': {k: list(v) if isinstance(v, tuple) else v for k, v in kwargs.items()},
+                         **evaluate(cropper, fixtures, grays)}
+        result = results[name]
+        print(f"{name:<20} {result['images_per_second']:>9.2f} {result['recall']:>7.3f} {result['precision']:>9.3f} {result['detections']:>10}")
+
+    rotations = sorted({r for result in results.values() for r in result['recall_by_rotation']}, key=int)
+    print("\nRecall by rotation (degrees, either direction)")
+    print(f"{'config':<20}" + ''.join(f"{r:>7}" for r in rotations))
+    for name, result in results.items():
+        print(f"{name:<20}" + ''.join(f"{result['recall_by_rotation'].get(r, 0.0):>7.2f}" for r in rotations))
+    print("\nRecall by face size (fraction of the shorter side)")
+    scales = sorted({s for result in results.values() for s in result['recall_by_scale']})
+    print(f"{'config':<20}" + ''.join(f"{s:>7}" for s in scales))
+    for name, result in results.items():
+        print(f"{name:<20}" + ''.join(f"{result['recall_by_scale'].get(s, 0.0):>7.2f}" for s in scales))
+
+    costs = {}
+    if not args.no_angle_costs:
+        costs = angle_costs(fixtures, grays, DETECTION_ANGLES)
+        print("\nFull pass cost of each rotation on its own")
+        print(f"{'angle':>6} {'ms/image':>9} {'recall':>7}")
+        for angle, cost in costs.items():
+            print(f"{angle:>6} {cost['ms_per_image']:>9.1f} {cost['recall']:>7.3f}")
+
+    front = pareto_front(results)
+    print("\nPareto front (fastest first)")
+    print(f"{'config':<20} {'images/s':>9} {'recall':>7} {'precision':>9}")
+    for name in sorted(front, key=lambda n: -results[n]['images_per_second']):
+        result = results[name]
+        print(f"{name:<20} {result['images_per_second']:>9.2f} {result['recall']:>7.3f} {result['precision']:>9.3f}")
+    dominated = [name for name in results if name not in front]
+    if dominated:
+        print(f"Dominated: {', '.join(dominated)}")
+
+    if args.output is not None:
+        args.output.write_text(json.dumps({
+            'fixtures': len(fixtures),
+            'faces': sum(len(f.faces) for f in fixtures),
+            'configs': results,
+            'angle_costs': {str(k): v for k, v in costs.items()},
+            'pareto_front': front
+        }, indent=2))
+        print(f"\nResults saved to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+import_time.py - Check that the command line tools start quickly
+
+Runs `python -X importtime` in fresh interpreters for each entry point and
+compares the time the module itself adds against a budget. NumPy and Pillow,
+which every tool needs, are imported first and timed separately as the
+baseline, so the budgets don't move with the machine or the installed
+versions of those packages. The scripts are byte-compiled first, so stale
+bytecode isn't timed either. Heavy packages (OpenCV, SciPy, scikit-image)
+must not be imported at all until an analysis actually needs them, so
+`--help`, merges, rescoring and cache-hit runs don't pay for them.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --budget-ms 30 --repeat 10
+
+Exits with status 1 when a module is over budget or loads a heavy package.
+"""
+
+import re
+import sys
+import compileall
+import time
+import argparse
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent
+
+# Entry points that must stay light, with the milliseconds each may add to the baseline
+BUDGETS_MS = {
+    'analyze_images': 40,
+    'image_quality': 15,
+    'pipeline': 15
+}
+
+# Imported before the module under test and timed on their own
+BASELINE_MODULES = ('numpy', 'PIL.Image')
+
+HEAVY_PACKAGES = ('cv2', 'scipy', 'skimage')
+
+LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+def _import_times(modules: Sequence[str]) -> List[Tuple[str, int, float, float]]:
+    """(name, nesting depth, self ms, cumulative ms) of every import made importing modules in order"""
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', '; '.join(f'import {module}' for module in modules)],
+        cwd=SCRIPTS_DIR, capture_output=True, text=True, check=True
+    )
+    entries = []
+    for line in completed.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, len(indent) - 1, int(self_us) / 1000, int(cumulative_us) / 1000))
+    return entries
+
+def measure_import(module: str) -> Tuple[float, Dict[str, float]]:
+    """Import time of module in ms on top of the baseline, and self time in ms of every module it loaded"""
+    entries = _import_times(BASELINE_MODULES + (module,))
+    # A package is listed after everything it imported, so the module's own
+    # entries start after the last top level baseline entry
+    start = max((index + 1 for index, (name, depth, _, _) in enumerate(entries) if depth == 0 and name in BASELINE_MODULES), default=0)
+    entries = entries[start:]
+    total = next((cumulative for name, depth, _, cumulative in entries if name == module and depth == 0), 0.0)
+    return total, {name: self_ms for name, _, self_ms, _ in entries}
+
+def measure_baseline() -> float:
+    """Import time of the baseline modules in ms"""
+    packages = {module.split('.')[0] for module in BASELINE_MODULES}
+    return sum(
+        cumulative for name, depth, _, cumulative in _import_times(BASELINE_MODULES)
+        if depth == 0 and name.split('.')[0] in packages
+    )
+
+def measure_help(script: str) -> float:
+    """Wall time in ms of running a script with --help"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, script, '--help'], cwd=SCRIPTS_DIR, capture_output=True, check=True)
+    return (time.perf_counter() - start) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description='Import time benchmark for the command line tools')
+    parser.add_argument('modules', nargs='*', help=f'Modules to check (default: {", ".join(BUDGETS_MS)})')
+    parser.add_argument('--budget-ms', type=float,
+                      help="Milliseconds every module may add to the baseline, overriding the built-in per-module budgets")
+    parser.add_argument('--repeat', type=int, default=5,
+                      help='Fresh interpreters per module; the fastest run counts (default: 5)')
+    parser.add_argument('--top', type=int, default=5,
+                      help='Slowest imported modules to list per entry point (default: 5)')
+    args = parser.parse_args()
+
+    # Modules with stale bytecode would otherwise be timed compiling
+    compileall.compile_dir(SCRIPTS_DIR, quiet=1)
+    repeat = max(1, args.repeat)
+    baseline = min(measure_baseline() for _ in range(repeat))
+    print(f"{'baseline':<16} {baseline:8.1f} ms  ({', '.join(BASELINE_MODULES)}, not budgeted)")
+
+    failures: List[str] = []
+    for module in args.modules or list(BUDGETS_MS):
+        budget = args.budget_ms or BUDGETS_MS.get(module, 150)
+        runs = [measure_import(module) for _ in range(repeat)]
+        total, self_times = min(runs, key=lambda run: run[0])
+        heavy = sorted({name.split('.')[0] for name in self_times} & set(HEAVY_PACKAGES))
+
+        status = 'ok' if total <= budget and not heavy else 'FAIL'
+        print(f"{module:<16} {total:8.1f} ms  (budget {budget:.0f} ms over the baseline)  {status}")
+        for name, ms in sorted(self_times.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {ms:8.1f} ms  {name}")
+        if total > budget:
+            failures.append(f"{module} adds {total:.1f} ms to the baseline, over the {budget:.0f} ms budget")
+        if heavy:
+            failures.append(f"{module} loads {', '.join(heavy)} at import time")
+
+    help_ms = min(measure_help('analyze_images.py') for _ in range(repeat))
+    print(f"\nanalyze_images.py --help: {help_ms:.1f} ms wall time, including interpreter start")
+
+    if failures:
+        print()
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
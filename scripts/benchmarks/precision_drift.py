@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+precision_drift.py - Compare float32 and float64 analysis: score drift, memory and speed
+
+Analyzes every image with both precisions and reports the largest score
+difference (scores are 0-100), the largest relative raw feature difference,
+the peak memory per pixel measured with tracemalloc and the time per image.
+Without an input directory a set of synthetic images is generated.
+
+    python benchmarks/precision_drift.py
+    python benchmarks/precision_drift.py /data/photos --limit 50
+
+Exits with status 1 when the drift exceeds the bounds or the measured peak
+memory exceeds PEAK_BYTES_PER_PIXEL, which the memory budget relies on.
+"""
+
+import sys
+import time
+import argparse
+import tracemalloc
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from image_quality.analyzer import ImageQualityAnalyzer
+from image_quality.precision import PRECISIONS, PEAK_BYTES_PER_PIXEL
+
+SCORES = ('blur_score', 'detail_score', 'edge_density', 'local_variance', 'saturation_mean', 'contrast_score')
+
+def synthetic_images(count: int = 6) -> Iterator[Tuple[str, np.ndarray]]:
+    """Smooth color fields with sharp shapes and noise, at a few sizes and aspect ratios"""
+    rng = np.random.default_rng(0)
+    sizes = [(640, 480), (1024, 768), (1501, 999), (2048, 1365), (800, 1200), (3000, 2000)]
+    for index in range(count):
+        width, height = sizes[index % len(sizes)]
+        y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+        image = np.empty((height, width, 3), dtype=np.float32)
+        for channel in range(3):
+            fx, fy = rng.uniform(1, 8, 2)
+            image[:, :, channel] = 127 + 90 * np.sin(x / width * fx * np.pi) * np.cos(y / height * fy * np.pi)
+        for _ in range(20):
+            x0, y0 = rng.integers(0, width - 50), rng.integers(0, height - 50)
+            image[y0:y0 + rng.integers(10, 200), x0:x0 + rng.integers(10, 200)] = rng.uniform(0, 255, 3)
+        image += rng.normal(0, 4 + 4 * index, image.shape)
+        yield f"synthetic_{index}_{width}x{height}", np.clip(image, 0, 255).astype(np.uint8)
+
+def directory_images(path: Path, limit: int) -> Iterator[Tuple[str, np.ndarray]]:
+    files = sorted(p for p in path.iterdir() if p.suffix.lower() in ('.jpg', '.jpeg', '.png'))
+    for file in files[:limit]:
+        with Image.open(file) as image:
+            yield file.name, np.asarray(image.convert('RGB'))
+
+def measure(analyzer: ImageQualityAnalyzer, image: np.ndarray) -> Tuple[Dict[str, float], float, int]:
+    """Raw features, seconds and peak traced bytes for one extract_features call"""
+    gray_plane = Image.fromarray(image).convert('L')
+    # Warm run, so buffers and lazy imports don't count as a one-off, with
+    # buffers sized for this image rather than the largest one so far
+    analyzer._scratch.clear()
+    analyzer.extract_features(image, gray_plane)
+    tracemalloc.start()
+    start = time.perf_counter()
+    features = analyzer.extract_features(image, gray_plane)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    # Scratch buffers were allocated before tracing started but belong to the peak
+    return features, elapsed, peak + analyzer._scratch.nbytes
+
+def main():
+    parser = argparse.ArgumentParser(description='float32 vs float64 analysis drift, memory and speed')
+    parser.add_argument('input_directory', nargs='?', help='Images to compare (default: synthetic images)')
+    parser.add_argument('--limit', type=int, default=20, help='Maximum images to compare (default: 20)')
+    parser.add_argument('--max-score-drift', type=float, default=0.5,
+                      help='Largest allowed score difference, on the 0-100 scale (default: 0.5)')
+    parser.add_argument('--max-feature-drift', type=float, default=1e-3,
+                      help='Largest allowed relative raw feature difference (default: 0.001)')
+    args = parser.parse_args()
+
+    analyzers = {precision: ImageQualityAnalyzer(precision=precision) for precision in PRECISIONS}
+    images = directory_images(Path(args.input_directory), args.limit) if args.input_directory else synthetic_images()
+
+    worst_score = {name: 0.0 for name in SCORES}
+    worst_feature: Dict[str, float] = {}
+    peak_per_pixel = {precision: 0.0 for precision in PRECISIONS}
+    seconds = {precision: 0.0 for precision in PRECISIONS}
+    flips = 0
+    count = 0
+
+    print(f"{'image':<32} {'MB f64':>8} {'MB f32':>8} {'ms f64':>8} {'ms f32':>8} {'max score diff':>15}")
+    for name, image in images:
+        pixels = image.shape[0] * image.shape[1]
+        results, peaks, times = {}, {}, {}
+        for precision, analyzer in analyzers.items():
+            results[precision], times[precision], peaks[precision] = measure(analyzer, image)
+            seconds[precision] += times[precision]
+            peak_per_pixel[precision] = max(peak_per_pixel[precision], peaks[precision] / pixels)
+
+        reference, low = results['float64'], results['float32']
+        for feature, value in reference.items():
+            relative = abs(low[feature] - value) / max(abs(value), 1e-12)
+            worst_feature[feature] = max(worst_feature.get(feature, 0.0), relative)
+
+        scores = {precision: analyzers[precision].score_features(features) for precision, features in results.items()}
+        diffs = {score: abs(float(scores['float32'][score]) - float(scores['float64'][score])) for score in SCORES}
+        for score, diff in diffs.items():
+            worst_score[score] = max(worst_score[score], diff)
+        accepted = {
+            precision: not analyzers[precision]._rejection_reasons(image.shape[1], image.shape[0], s)[0]
+            for precision, s in scores.items()
+        }
+        flips += accepted['float32'] != accepted['float64']
+        count += 1
+
+        print(
+            f"{name[:32]:<32} {peaks['float64'] / 1e6:>8.1f} {peaks['float32'] / 1e6:>8.1f} "
+            f"{times['float64'] * 1000:>8.1f} {times['float32'] * 1000:>8.1f} {max(diffs.values()):>15.5f}"
+        )
+
+    print(f"\nCompared {count} images")
+    print("Largest score differences (0-100 scale):")
+    for score, diff in worst_score.items():
+        print(f"  {score:<18} {diff:.5f}")
+    print("Largest relative raw feature differences:")
+    for feature, diff in worst_feature.items():
+        print(f"  {feature:<20} {diff:.2e}")
+    print(f"Acceptance decisions changed: {flips}")
+    for precision in PRECISIONS:
+        print(
+            f"{precision}: peak {peak_per_pixel[precision]:.1f} bytes/pixel "
+            f"(budget assumes {PEAK_BYTES_PER_PIXEL[precision]}), "
+            f"{seconds[precision] * 1000 / max(1, count):.1f} ms/image"
+        )
+
+    failures = []
+    if max(worst_score.values()) > args.max_score_drift:
+        failures.append(f"score drift {max(worst_score.values()):.5f} over {args.max_score_drift}")
+    if max(worst_feature.values(), default=0.0) > args.max_feature_drift:
+        failures.append(f"raw feature drift {max(worst_feature.values()):.2e} over {args.max_feature_drift:.0e}")
+    for precision in PRECISIONS:
+        if peak_per_pixel[precision] > PEAK_BYTES_PER_PIXEL[precision]:
+            failures.append(f"{precision} peak memory {peak_per_pixel[precision]:.1f} bytes/pixel over the assumed {PEAK_BYTES_PER_PIXEL[precision]}")
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -3,129 +3,559 @@
 crop_faces.py - Command line tool for detecting and cropping faces from images
 """
 
+import os
+import threading
 import cv2
+import numpy as np
 from pathlib import Path
 import argparse
-from face_detection.detector import FaceCropper
-from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
+from face_detection.detector import DETECTION_MODES, FaceCropper, FaceDetection
+from face_detection.lossless import jpeg_mcu_size, jpegtran_path, lossless_crop, snap_crop_box
+from pipeline import FrameJob, Stage, StagedPipeline, WorkItem
+from pipeline.io import read_bytes, encode_outputs, output_name, write_output
+from pipeline.sharding import select_shard, shard_suffix, parse_shard
+from pipeline.sources import DirectorySource, is_archive, open_source, require_random_access, SequentialSourceError
+from pipeline.sinks import DirectorySink, TarShardSink
 import logging
 
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png', '*.bmp')
+
+def face_outputs(
+    cropper: FaceCropper,
+    img: np.ndarray,
+    path: Path,
+    mode: str = 'crop',
+    original: Optional[bytes] = None,
+    link_from: Optional[Path] = None,
+    lossless_jpeg: bool = False
+) -> Tuple[List[Tuple[str, Union[np.ndarray, bytes, Path]]], Dict[str, str]]:
+    """Detect faces and return the images to save: all perfect confidence faces, else the best lower confidence face.
+
+    Also returns a message per output name, to print once that output has
+    actually been written (see write_face_outputs).
+
+    Without faces the original file is passed through: linked from link_from
+    when given, else as the original bytes, and only re-encoded when neither
+    is available. With lossless_jpeg, crops of JPEG originals are cut from
+    the compressed data where possible (see crop_output).
+    """
+    # Convert to grayscale for detection
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    
+    # Detect faces
+    faces = cropper.detect_faces(gray)
+    if not faces:
+        print(f"No faces found in {path} - copying original file")
+        # Copy original file to output directory
+        if link_from is not None:
+            return [(path.as_posix(), link_from)], {}
+        return [(path.as_posix(), original if original is not None else img)], {}
+    
+    if mode == 'visualize':
+        # Create visualization with bounding boxes
+        viz_img = cropper.visualize_detections(img, faces)
+        name = output_name(path, '_detected')
+        return [(name, viz_img)], {name: f"Saved detection visualization for {path}"}
+
+    # Header of a JPEG original that lossless crops can be cut from
+    jpeg = jpeg_mcu_size(original) if lossless_jpeg and original is not None else None
+    if jpeg is not None and jpeg[2:] != (img.shape[1], img.shape[0]):
+        jpeg = None
+
+    outputs = []
+    messages = {}
+    # Split faces into perfect confidence and others
+    perfect_faces = [f for f in faces if f.confidence >= 0.95]  # Using 0.99 to account for floating point
+    other_faces = [f for f in faces if f.confidence < 0.95]
+    
+    # Process all perfect confidence faces
+    for idx, face in enumerate(perfect_faces, 1):
+        try:
+            crop = crop_output(cropper, img, face, original, jpeg)
+            if crop is not None:
+                # Add index only if there are multiple perfect faces
+                name = output_name(path, f"_face_{idx}" if len(perfect_faces) > 1 else "_face")
+                outputs.append((name, crop))
+                messages[name] = f"Saved perfect confidence face {idx} from {path} (confidence: {face.confidence:.2f})"
+        except Exception as e:
+            logging.error(f"Error processing perfect face {idx} from {path}: {str(e)}")
+    
+    # Process the best lower confidence face if any exist and no perfect faces were found
+    if other_faces and not perfect_faces:
+        best_face = other_faces[0]  # faces are already sorted by confidence
+        try:
+            crop = crop_output(cropper, img, best_face, original, jpeg)
+            if crop is not None:
+                name = output_name(path, '_face')
+                outputs.append((name, crop))
+                messages[name] = f"Saved highest confidence face from {path} (confidence: {best_face.confidence:.2f})"
+        except Exception as e:
+            logging.error(f"Error processing face from {path}: {str(e)}")
+
+    return outputs, messages
+
+def write_face_outputs(
+    sink: Union[DirectorySink, TarShardSink],
+    outputs: List[Tuple[str, Union[bytes, Path]]],
+    messages: Dict[str, str]
+) -> None:
+    """Write an image's encoded outputs, printing each one's message once it is saved"""
+    for name, payload in outputs:
+        write_output(sink, name, payload)
+        if name in messages:
+            print(messages[name])
+
+def crop_output(
+    cropper: FaceCropper,
+    img: np.ndarray,
+    face: FaceDetection,
+    original: Optional[bytes] = None,
+    jpeg: Optional[Tuple[int, int, int, int]] = None
+) -> Optional[Union[np.ndarray, bytes]]:
+    """Crop one face, losslessly from the JPEG bytes when the box snaps onto MCUs.
+
+    jpeg is the original's (mcu_width, mcu_height, width, height), see
+    jpeg_mcu_size. The snapped box keeps the size of crop_face's square box
+    and moves it by less than one MCU; when that isn't close enough, or
+    jpegtran is missing or fails, the pixels are cropped and re-encoded.
+    """
+    if jpeg is not None:
+        box = snap_crop_box(cropper.crop_box(img.shape[1], img.shape[0], face), jpeg[:2])
+        data = lossless_crop(original, box) if box is not None else None
+        if data is not None:
+            return data
+    return cropper.crop_face(img, face)
+
+class CropJob(FrameJob):
+    """Detection and cropping as run by each process of a SharedFramePool (--processes)"""
+
+    # Originals are passed through for images without faces
+    keep_original = True
+
+    def __init__(
+        self,
+        mode: str = 'crop',
+        padding_percent: float = 50,
+        pixel_cache: Optional[Tuple[str, int]] = None,
+        link_originals: bool = False,
+        lossless_jpeg: bool = False,
+        detection: str = 'full',
+        proposal_size: int = 384
+    ):
+        self.mode = mode
+        self.padding_percent = padding_percent
+        self.link_originals = link_originals
+        self.lossless_jpeg = lossless_jpeg
+        self.detection = detection
+        self.proposal_size = proposal_size
+        # (directory, max bytes), since the cache itself isn't shared between processes
+        self.pixel_cache = pixel_cache
+
+    def setup(self) -> None:
+        from pipeline.cache import PixelCache
+
+        cache = PixelCache(*self.pixel_cache) if self.pixel_cache else None
+        self.cropper = FaceCropper(self.padding_percent, cache, self.detection, self.proposal_size)
+
+    def decode(self, data: bytes) -> Optional[np.ndarray]:
+        return self.cropper.load_image(data)
+
+    def process(
+        self,
+        name: str,
+        frame: np.ndarray,
+        original: Optional[bytes] = None,
+        path: Optional[str] = None
+    ) -> Tuple[List[Tuple[str, Union[bytes, Path]]], Dict[str, str]]:
+        # Encoded here, so only the (much smaller) files go back to the parent
+        link_from = Path(path) if self.link_originals and path is not None else None
+        outputs, messages = face_outputs(self.cropper, frame, Path(name), self.mode, original, link_from, self.lossless_jpeg)
+        item = WorkItem(name=name, outputs=outputs)
+        return (encode_outputs(item).outputs if item.outputs else []), messages
+
+def build_stages(
+    sink: Union[DirectorySink, TarShardSink],
+    cropper: FaceCropper,
+    mode: str = 'crop',
+    num_threads: int = 4,
+    stage_workers: Optional[Dict[str, int]] = None,
+    queue_size: int = 16,
+    link_originals: bool = False,
+    lossless_jpeg: bool = False
+) -> List[Stage]:
+    """Build the read -> decode -> detect -> encode -> write stages"""
+    workers = {'read': 2, 'decode': 2, 'encode': 2, 'write': 1, **(stage_workers or {})}
+
+    def decode(item: WorkItem) -> Optional[WorkItem]:
+        # The encoded bytes stay on the item for passthrough and lossless crops
+        img = cropper.load_image(item.data)
+        if img is None:
+            logging.error(f"Could not read image: {item.name}")
+            return None
+        item.image = img
+        return item
+
+    def detect(item: WorkItem) -> Optional[WorkItem]:
+        img, original = item.image, item.data
+        item.image = item.data = None
+        link_from = Path(item.source) if link_originals and isinstance(item.source, (str, os.PathLike)) else None
+        # The messages wait on the item until the write stage has saved the outputs
+        item.outputs, item.result = face_outputs(cropper, img, Path(item.name), mode, original, link_from, lossless_jpeg)
+        return item if item.outputs else None
+
+    def write(item: WorkItem) -> None:
+        write_face_outputs(sink, item.outputs, item.result)
+        item.outputs = []
+
+    return [
+        Stage('read', read_bytes, workers['read'], queue_size),
+        Stage('decode', decode, workers['decode'], queue_size),
+        Stage('detect', detect, num_threads, queue_size),
+        Stage('encode', encode_outputs, workers['encode'], queue_size),
+        Stage('write', write, workers['write'], queue_size)
+    ]
+
 def process_directory(
     input_dir: str,
     output_dir: Path,
     mode: str = 'crop',
     num_threads: int = 4,
+    stage_workers: Optional[Dict[str, int]] = None,
+    queue_size: int = 16,
+    shard: Optional[Tuple[int, int]] = None,
+    tar_max_bytes: Optional[int] = None,
+    cropper: Optional[FaceCropper] = None,
+    processes: int = 0,
+    slot_bytes: int = 48 << 20,
+    link_originals: bool = False,
+    lossless_jpeg: bool = False,
+    auto_tune: bool = False,
     **cropper_kwargs
-) -> None:
-    """Process all images in a directory"""
-    cropper = FaceCropper(**cropper_kwargs)
-    image_paths = []
+) -> Dict[str, int]:
+    """Process all images in a directory or zip/tar archive, or only one shard of them.
+
+    A long-running caller can pass in a warm cropper, which is used as is.
+    With processes > 0 detection runs in that many worker processes fed
+    through shared memory instead of threads; with auto_tune the thread,
+    process and OpenCV thread counts are chosen from a measured warm-up on
+    the first images instead. Images without faces are copied byte for
+    byte, or hard linked with link_originals; lossless_jpeg cuts JPEG crops
+    from the compressed data when jpegtran is installed. Returns the number
+    of items each stage processed.
+    """
+    from pipeline.tuning import AutoTuner, Concurrency
+
+    if cropper is None:
+        cropper = FaceCropper(**cropper_kwargs)
+    if lossless_jpeg and jpegtran_path() is None:
+        logging.warning("jpegtran not found - JPEG crops will be re-encoded")
+        lossless_jpeg = False
     
     # Collect all image files
-    valid_extensions = ('*.jpg', '*.jpeg', '*.png', '*.bmp')
-    for ext in valid_extensions:
-        image_paths.extend(Path(input_dir).glob(ext))
+    source = open_source(Path(input_dir), IMAGE_PATTERNS)
+    if auto_tune:
+        require_random_access(source, 'auto-tune probe')
+    image_paths = source.names
+
+    # Output names are unique per input, so shards can share one output directory
+    if shard is not None:
+        image_paths = select_shard(image_paths, *shard)
     
     if not image_paths:
         print(f"No images found in {input_dir}")
-        return
+        return {}
 
     print(f"Processing {len(image_paths)} images...")
-    
-    def process_image(path: Path, output_dir: Path, cropper: FaceCropper, mode: str = 'crop') -> None:
-        """Process a single image, saving all perfect confidence faces and the best lower confidence face."""
-        try:
-            # Read and validate image
-            img = cv2.imread(str(path))
-            if img is None:
-                logging.error(f"Could not read image: {path}")
-                return
-                
-            # Convert to grayscale for detection
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
-            # Detect faces
-            faces = cropper.detect_faces(gray)
-            if not faces:
-                print(f"No faces found in {path} - copying original file")
-                # Copy original file to output directory
-                output_path = output_dir / path.name
-                cv2.imwrite(str(output_path), img)
-                return
-            
-            if mode == 'visualize':
-                # Create visualization with bounding boxes
-                viz_img = cropper.visualize_detections(img, faces)
-                output_path = output_dir / f"{path.stem}_detected{path.suffix}"
-                cv2.imwrite(str(output_path), viz_img)
-                print(f"Saved detection visualization for {path.name}")
-            else:
-                # Split faces into perfect confidence and others
-                perfect_faces = [f for f in faces if f.confidence >= 0.95]  # Using 0.99 to account for floating point
-                other_faces = [f for f in faces if f.confidence < 0.95]
-                
-                # Process all perfect confidence faces
-                for idx, face in enumerate(perfect_faces, 1):
-                    try:
-                        crop = cropper.crop_face(img, face)
-                        if crop is not None:
-                            # Add index only if there are multiple perfect faces
-                            suffix = f"_face_{idx}" if len(perfect_faces) > 1 else "_face"
-                            output_path = output_dir / f"{path.stem}{suffix}{path.suffix}"
-                            cv2.imwrite(str(output_path), crop)
-                            print(f"Saved perfect confidence face {idx} from {path.name} (confidence: {face.confidence:.2f})")
-                    except Exception as e:
-                        logging.error(f"Error processing perfect face {idx} from {path.name}: {str(e)}")
-                
-                # Process the best lower confidence face if any exist and no perfect faces were found
-                if other_faces and not perfect_faces:
-                    best_face = other_faces[0]  # faces are already sorted by confidence
-                    try:
-                        crop = cropper.crop_face(img, best_face)
-                        if crop is not None:
-                            output_path = output_dir / f"{path.stem}_face{path.suffix}"
-                            cv2.imwrite(str(output_path), crop)
-                            print(f"Saved highest confidence face from {path.name} (confidence: {best_face.confidence:.2f})")
-                    except Exception as e:
-                        logging.error(f"Error processing face from {path.name}: {str(e)}")
-        
-        except Exception as e:
-            logging.error(f"Error processing {path}: {str(e)}")
 
-    # Process images in parallel if requested
-    if num_threads > 1:
-        with ThreadPoolExecutor(max_workers=num_threads) as executor:
-            list(executor.map(lambda path: process_image(path, output_dir, cropper, mode), image_paths))
+    if tar_max_bytes:
+        # Crops go into size-capped tar shards, written sequentially
+        sink = TarShardSink(output_dir, f"faces{shard_suffix(*shard) if shard else ''}", tar_max_bytes)
+        stage_workers = {**(stage_workers or {}), 'write': 1}
     else:
-        for path in image_paths:
-            process_image(path, output_dir, cropper, mode)
-    
+        sink = DirectorySink(output_dir)
+
+    counts: Dict[str, int] = {}
+
+    def run_batch(names: List[str], concurrency: Concurrency) -> None:
+        batch_counts = crop_items(
+            source, names, sink, cropper,
+            mode=mode,
+            num_threads=concurrency.threads,
+            stage_workers=stage_workers,
+            queue_size=queue_size,
+            processes=concurrency.processes,
+            slot_bytes=slot_bytes,
+            link_originals=link_originals,
+            lossless_jpeg=lossless_jpeg,
+            library_threads=concurrency.library_threads if auto_tune else None
+        )
+        for stage, count in batch_counts.items():
+            counts[stage] = counts.get(stage, 0) + count
+
+    try:
+        if auto_tune:
+            AutoTuner(run_batch, allow_processes=True).run(image_paths)
+        else:
+            run_batch(image_paths, Concurrency(num_threads, processes))
+    finally:
+        sink.close()
+        source.close()
+
     print(f"\nResults saved to {output_dir}")
+    if cropper.pixel_cache is not None and not processes:
+        print(f"Pixel cache: {cropper.pixel_cache.hits} hits, {cropper.pixel_cache.misses} misses")
+    return counts
+
+def crop_items(
+    source: Any,
+    image_paths: List[str],
+    sink: Union[DirectorySink, TarShardSink],
+    cropper: FaceCropper,
+    mode: str = 'crop',
+    num_threads: int = 4,
+    stage_workers: Optional[Dict[str, int]] = None,
+    queue_size: int = 16,
+    processes: int = 0,
+    slot_bytes: int = 48 << 20,
+    link_originals: bool = False,
+    lossless_jpeg: bool = False,
+    library_threads: Optional[int] = None
+) -> Dict[str, int]:
+    """Detect and crop the named images of a source into sink.
+
+    Returns the number of items each stage processed.
+    """
+    if processes:
+        from pipeline.shm import SharedFramePool
+
+        cache = cropper.pixel_cache
+        job = CropJob(
+            mode, cropper.padding_percent,
+            (str(cache.cache_dir), cache.max_bytes) if cache is not None else None,
+            link_originals, lossless_jpeg, cropper.detection, cropper.proposal_size
+        )
+        job.library_threads = library_threads
+        pool = SharedFramePool(job, workers=processes, decoders=(stage_workers or {}).get('decode', 2), slot_bytes=slot_bytes)
+        written = 0
+        for name, result in pool.run(source.items(image_paths)):
+            outputs, messages = result or ([], {})
+            write_face_outputs(sink, outputs, messages)
+            written += bool(outputs)
+        print(f"\n{pool.report()}")
+        return {'detect': pool.processed, 'write': written}
+
+    pipeline = StagedPipeline(build_stages(
+        sink, cropper,
+        mode=mode,
+        num_threads=num_threads,
+        stage_workers=stage_workers,
+        queue_size=queue_size,
+        link_originals=link_originals,
+        lossless_jpeg=lossless_jpeg
+    ))
+    pipeline.run(source.items(image_paths))
+    print(f"\n{pipeline.report()}")
+    return {stats.name: stats.processed for stats in pipeline.stats}
+
+def watch_directory(
+    input_dir: str,
+    output_dir: Path,
+    mode: str = 'crop',
+    num_threads: int = 4,
+    stage_workers: Optional[Dict[str, int]] = None,
+    queue_size: int = 16,
+    shard: Optional[Tuple[int, int]] = None,
+    cropper: Optional[FaceCropper] = None,
+    processes: int = 0,
+    slot_bytes: int = 48 << 20,
+    link_originals: bool = False,
+    lossless_jpeg: bool = False,
+    settle: float = 2.0,
+    poll_interval: float = 1.0,
+    use_inotify: bool = True,
+    stop: Optional[threading.Event] = None,
+    **cropper_kwargs
+) -> Dict[str, int]:
+    """Crop faces from a directory, then keep cropping new and changed images until stopped.
+
+    Changed images are cropped again, overwriting their earlier outputs;
+    outputs of removed images are left in place. Stops on SIGINT/SIGTERM
+    unless a stop event is given. Returns the number of items each stage
+    processed over the whole run.
+    """
+    from pipeline.watch import DirectoryWatcher, stop_on_signal
+
+    if is_archive(Path(input_dir)):
+        raise ValueError("Watch mode needs a directory, not an archive")
+    if cropper is None:
+        cropper = FaceCropper(**cropper_kwargs)
+    if lossless_jpeg and jpegtran_path() is None:
+        logging.warning("jpegtran not found - JPEG crops will be re-encoded")
+        lossless_jpeg = False
+
+    sink = DirectorySink(output_dir)
+    watcher = DirectoryWatcher(input_dir, IMAGE_PATTERNS, settle, poll_interval, use_inotify)
+    if stop is None:
+        stop = stop_on_signal()
+    print(f"Watching {input_dir} for new images ({watcher.mode}), Ctrl-C to stop")
+
+    totals: Dict[str, int] = {}
+    try:
+        for ready, removed in watcher.batches(stop):
+            if shard is not None:
+                ready = select_shard(ready, *shard)
+            if not ready:
+                continue
+            print(f"\nProcessing {len(ready)} new or changed images...")
+            counts = crop_items(
+                DirectorySource(Path(input_dir), IMAGE_PATTERNS, ready), ready, sink, cropper,
+                mode=mode,
+                num_threads=num_threads,
+                stage_workers=stage_workers,
+                queue_size=queue_size,
+                processes=processes,
+                slot_bytes=slot_bytes,
+                link_originals=link_originals,
+                lossless_jpeg=lossless_jpeg
+            )
+            for stage, count in counts.items():
+                totals[stage] = totals.get(stage, 0) + count
+    finally:
+        sink.close()
+    return totals
+
+def build_parser() -> argparse.ArgumentParser:
+    from pipeline.watch import add_watch_arguments
 
-def main():
     parser = argparse.ArgumentParser(description='Process faces in images')
-    parser.add_argument('input_directory', help='Directory containing input images')
+    parser.add_argument('input_directory', help='Directory or zip/tar archive containing input images')
     parser.add_argument('output_directory', help='Directory to save processed images')
     parser.add_argument('--mode', choices=['crop', 'visualize'], default='crop',
                        help='Processing mode: crop faces or visualize detections')
     parser.add_argument('--threads', '-t', type=int, default=4,
-                       help='Number of threads to use (default: 4)')
+                       help='Number of detection threads to use (default: 4)')
+    parser.add_argument('--auto-tune', action='store_true',
+                       help='Choose --threads/--processes and the OpenCV thread count from a measured warm-up on the first images')
+    parser.add_argument('--read-workers', type=int, default=2,
+                       help='Threads reading files from disk (default: 2)')
+    parser.add_argument('--decode-workers', type=int, default=2,
+                       help='Threads decoding images (default: 2)')
+    parser.add_argument('--encode-workers', type=int, default=2,
+                       help='Threads encoding crops and visualizations (default: 2)')
+    parser.add_argument('--write-workers', type=int, default=1,
+                       help='Threads writing output files (default: 1)')
+    parser.add_argument('--queue-size', type=int, default=16,
+                       help='Maximum items waiting between two stages (default: 16)')
+    parser.add_argument('--tar-output', action='store_true',
+                       help='Write crops into tar shards instead of one file per crop')
+    parser.add_argument('--tar-max-mb', type=int, default=1024,
+                       help='Maximum size of each tar shard in MB (default: 1024)')
+    parser.add_argument('--pixel-cache',
+                       help='Directory for a memory-mapped cache of decoded pixels, reused across runs')
+    parser.add_argument('--pixel-cache-mb', type=int, default=10240,
+                       help='Maximum pixel cache size in MB (default: 10240)')
+    parser.add_argument('--processes', type=int, default=0,
+                       help='Detect faces in this many worker processes fed through shared memory instead of threads')
+    parser.add_argument('--slot-mb', type=int, default=48,
+                       help='Size of each shared memory frame slot in MB with --processes; larger images are piped (default: 48)')
+    parser.add_argument('--link-originals', action='store_true',
+                       help='Hard link images without faces into the output directory instead of copying them')
+    parser.add_argument('--lossless-jpeg', action='store_true',
+                       help='Crop JPEG faces on MCU boundaries without re-encoding; requires jpegtran')
+    parser.add_argument('--shard', type=parse_shard,
+                       help='Only process shard i of N (e.g. 0/4)')
     parser.add_argument('--padding', type=float, default=50,
                        help='Padding around face as percentage (default: 50)')
+    parser.add_argument('--detection', choices=DETECTION_MODES, default='full',
+                       help='full: every cascade and angle over the whole image; '
+                            'two-stage: propose on a small image, verify in high resolution regions - '
+                            'faster, and finds smaller faces (default: full)')
+    parser.add_argument('--proposal-size', type=int, default=384,
+                       help='Longest side of the image proposals are searched in with two-stage detection (default: 384)')
+    add_watch_arguments(parser)
     
-    args = parser.parse_args()
-    
+    return parser
+
+def validate_args(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """Reject option combinations that parse but can't run, through parser.error"""
+    if args.watch and args.tar_output:
+        parser.error("--watch writes loose files; --tar-output is not supported")
+    if args.auto_tune and args.watch:
+        parser.error("--auto-tune only supports full runs, not --watch")
+
+def run(args: argparse.Namespace, cropper: Optional[FaceCropper] = None) -> Dict[str, int]:
+    """Run face cropping from parsed command line arguments, optionally on a warm cropper"""
+    from pipeline.cache import PixelCache
+
     # Create output directory if it doesn't exist
     output_dir = Path(args.output_directory)
     output_dir.mkdir(parents=True, exist_ok=True)
-    
-    process_directory(
+
+    # A new cache object per run, so a warm cropper neither keeps the last job's cache nor its counts
+    pixel_cache = PixelCache(args.pixel_cache, args.pixel_cache_mb * 1024 * 1024) if args.pixel_cache else None
+    if cropper is not None:
+        cropper.reset(args.padding, pixel_cache, args.detection, args.proposal_size)
+
+    stage_workers = {
+        'read': args.read_workers,
+        'decode': args.decode_workers,
+        'encode': args.encode_workers,
+        'write': args.write_workers
+    }
+    if args.watch:
+        return watch_directory(
+            args.input_directory,
+            output_dir,
+            mode=args.mode,
+            num_threads=args.threads,
+            stage_workers=stage_workers,
+            queue_size=args.queue_size,
+            shard=args.shard,
+            cropper=cropper,
+            processes=args.processes,
+            slot_bytes=args.slot_mb * 1024 * 1024,
+            link_originals=args.link_originals,
+            lossless_jpeg=args.lossless_jpeg,
+            settle=args.settle,
+            poll_interval=args.poll_interval,
+            use_inotify=not args.poll,
+            pixel_cache=pixel_cache,
+            padding_percent=args.padding,
+            detection=args.detection,
+            proposal_size=args.proposal_size
+        )
+
+    return process_directory(
         args.input_directory,
         output_dir,
         mode=args.mode,
         num_threads=args.threads,
-        padding_percent=args.padding
+        stage_workers=stage_workers,
+        queue_size=args.queue_size,
+        shard=args.shard,
+        tar_max_bytes=args.tar_max_mb * 1024 * 1024 if args.tar_output else None,
+        cropper=cropper,
+        processes=args.processes,
+        slot_bytes=args.slot_mb * 1024 * 1024,
+        link_originals=args.link_originals,
+        lossless_jpeg=args.lossless_jpeg,
+        auto_tune=args.auto_tune,
+        pixel_cache=pixel_cache,
+        padding_percent=args.padding,
+        detection=args.detection,
+        proposal_size=args.proposal_size
     )
 
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    validate_args(parser, args)
+    try:
+        run(args)
+    except SequentialSourceError as e:
+        # Whether a tar can be seeked is only known once it has been opened
+        parser.error(str(e))
+
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -5,10 +5,13 @@ detector.py - Core face detection and cropping functionality
 import cv2
 import numpy as np
 from dataclasses import dataclass
-from typing import List, Tuple, Optional, Dict
+from typing import Any, List, Tuple, Optional, Dict, Sequence, TYPE_CHECKING
 import logging
 import threading
 
+if TYPE_CHECKING:
+    from pipeline.cache import PixelCache
+
 @dataclass
 class FaceDetection:
     x: int
@@ -37,10 +40,80 @@ class FaceDetection:
         
         return intersection / union
 
+# Default rotations tried by the full detection pass, and by two-stage verification near a proposal's angle
+DETECTION_ANGLES = (0, 10, -10, -15, 15, -20, 20, -30, 30, 40, -40, 45, -45, 50, -50, 55, -55, 60, -60, 90, -90)
+# Rotations of the two-stage proposal pass
+PROPOSAL_ANGLES = (0, -30, 30)
+# Two-stage verification: the ROI margin around a proposal as a fraction of
+# its size, the face size the ROI is resized to, and the angle range searched
+ROI_MARGIN = 0.6
+VERIFY_FACE_SIZE = 120
+VERIFY_ANGLE_RANGE = 20
+
+DETECTION_MODES = ('full', 'two-stage')
+
+# Longest side the full pass detects at; larger images are scaled down first
+DETECTION_SIZE = 1024
+
+def _rotate(img: np.ndarray, center: Tuple[int, int], angle: float) -> np.ndarray:
+    if angle == 0:
+        return img
+    M = cv2.getRotationMatrix2D(center, angle, 1.0)
+    return cv2.warpAffine(img, M, (img.shape[1], img.shape[0]))
+
+def _rotate_back(box: Any, center: Tuple[int, int], angle: float) -> Tuple[int, int, int, int]:
+    """Bounding box, in the unrotated image, of a box detected in the image rotated by angle"""
+    x, y, w, h = (int(v) for v in box)
+    if angle == 0:
+        return x, y, w, h
+    corners = np.array([
+        [x, y],
+        [x + w, y],
+        [x + w, y + h],
+        [x, y + h]
+    ], dtype=np.float32)
+    
+    # Rotate corners back, rounding through float32 like the corner array
+    M_inv = cv2.getRotationMatrix2D(center, -angle, 1.0)
+    px, py = corners[:, 0].astype(np.float64), corners[:, 1].astype(np.float64)
+    xs = (M_inv[0][0] * px + M_inv[0][1] * py + M_inv[0][2]).astype(np.float32)
+    ys = (M_inv[1][0] * px + M_inv[1][1] * py + M_inv[1][2]).astype(np.float32)
+    
+    # Get bounding box of rotated corners
+    x = int(np.min(xs))
+    y = int(np.min(ys))
+    return x, y, int(np.max(xs) - x), int(np.max(ys) - y)
+
+def _confidence(face_area: int, image_area: int, angle: float, profile: bool) -> float:
+    """Confidence based on detection size and angle; profiles start lower"""
+    size_ratio = face_area / image_area
+    angle_penalty = abs(angle) / 90.0 * 0.2  # Max 0.2 penalty for angle
+    return (0.7 if profile else 0.8) + min(size_ratio * 5, 0.2) - angle_penalty
+
+class _CascadeLease:
+    """A thread's hold on a classifier set, handed back when the thread exits"""
+
+    def __init__(self, owner: 'FaceCropper', cascades: Dict[str, cv2.CascadeClassifier]):
+        self.owner = owner
+        self.cascades = cascades
+
+    def __del__(self):
+        # Runs when the thread's local storage is cleared
+        self.owner._release_cascades(self.cascades)
+
 class FaceCropper:
     """Face detection and cropping functionality"""
-    def __init__(self, padding_percent: float = 50):
-        self.padding_percent = padding_percent
+    def __init__(
+        self,
+        padding_percent: float = 50,
+        pixel_cache: Optional['PixelCache'] = None,
+        detection: str = 'full',
+        proposal_size: int = 384,
+        angles: Sequence[int] = DETECTION_ANGLES,
+        scale_factor: float = 1.3,
+        min_neighbors: int = 4
+    ):
+        self.reset(padding_percent, pixel_cache, detection, proposal_size, angles, scale_factor, min_neighbors)
         # Store cascade paths instead of initializing classifiers
         self.cascade_paths = {
             'front': cv2.data.haarcascades + 'haarcascade_frontalface_default.xml',
@@ -49,30 +122,105 @@ class FaceCropper:
         }
         # Thread-local storage for cascade classifiers
         self._local = threading.local()
+        # Loaded classifier sets released by finished threads, reused by new ones
+        self._idle_cascades: List[Dict[str, cv2.CascadeClassifier]] = []
+        self._idle_lock = threading.Lock()
+
+    def reset(
+        self,
+        padding_percent: float = 50,
+        pixel_cache: Optional['PixelCache'] = None,
+        detection: str = 'full',
+        proposal_size: int = 384,
+        angles: Sequence[int] = DETECTION_ANGLES,
+        scale_factor: float = 1.3,
+        min_neighbors: int = 4
+    ) -> None:
+        """Apply a run's settings, defaults for those not given, so a warm instance keeps only its loaded cascades"""
+        if detection not in DETECTION_MODES:
+            raise ValueError(f"Unknown detection mode {detection!r}, expected one of {', '.join(DETECTION_MODES)}")
+        self.padding_percent = padding_percent
+        self.pixel_cache = pixel_cache
+        # 'full' sweeps every cascade and angle over the whole image at 1024 px;
+        # 'two-stage' proposes on a proposal_size image and verifies in ROIs
+        self.detection = detection
+        self.proposal_size = proposal_size
+        # Cascade settings: the rotations searched (two-stage verifies the
+        # ones near each proposal), the full pass's scale step, and the
+        # neighbors a frontal detection needs; profiles need one fewer
+        self.angles = tuple(angles)
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+
+    @property
+    def _profile_neighbors(self) -> int:
+        return max(1, self.min_neighbors - 1)
 
     @property
     def cascades(self) -> Dict[str, cv2.CascadeClassifier]:
         """Get thread-local cascade classifiers."""
-        if not hasattr(self._local, 'cascades'):
-            # Initialize cascades for this thread
-            self._local.cascades = {
-                name: cv2.CascadeClassifier(path)
-                for name, path in self.cascade_paths.items()
-            }
-        return self._local.cascades
+        if not hasattr(self._local, 'lease'):
+            with self._idle_lock:
+                cascades = self._idle_cascades.pop() if self._idle_cascades else None
+            if cascades is None:
+                cascades = self._load_cascades()
+            self._local.lease = _CascadeLease(self, cascades)
+        return self._local.lease.cascades
+
+    def _load_cascades(self) -> Dict[str, cv2.CascadeClassifier]:
+        return {
+            name: cv2.CascadeClassifier(path)
+            for name, path in self.cascade_paths.items()
+        }
+
+    def _release_cascades(self, cascades: Dict[str, cv2.CascadeClassifier]) -> None:
+        with self._idle_lock:
+            self._idle_cascades.append(cascades)
+
+    def warm_up(self, threads: int) -> None:
+        """Load classifier sets for this many threads ahead of time.
+
+        Sets outlive the threads that used them, so a long-running process
+        parses the cascade XML once per concurrent thread instead of once per
+        thread ever started.
+        """
+        with self._idle_lock:
+            missing = threads - len(self._idle_cascades)
+        for _ in range(missing):
+            self._release_cascades(self._load_cascades())
+
+    def load_image(self, source: Any) -> Optional[np.ndarray]:
+        """Load an image as a BGR uint8 array from a path or raw bytes, or None if unreadable.
+
+        With a pixel cache configured the result is a read-only memory-mapped
+        view of the cached pixels.
+        """
+        if not isinstance(source, (bytes, bytearray, memoryview)):
+            with open(source, 'rb') as f:
+                source = f.read()
+        if self.pixel_cache is not None:
+            return self.pixel_cache.get_or_decode(bytes(source), 'bgr', self._decode)
+        return self._decode(source)
+
+    def _decode(self, data: bytes) -> Optional[np.ndarray]:
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
 
     def detect_faces(self, gray_img: np.ndarray) -> List[FaceDetection]:
         """Detect faces using multiple cascades and multiple rotations."""
+        if self.detection == 'two-stage':
+            return self._detect_two_stage(gray_img)
+        return self._detect_full(gray_img)
+
+    def _detect_full(self, gray_img: np.ndarray) -> List[FaceDetection]:
+        """Sweep every cascade and angle over the image at DETECTION_SIZE"""
         all_faces = []
         
         try:
             # Store original dimensions for scaling back
             orig_height, orig_width = gray_img.shape
-            orig_img = gray_img.copy()
             
             # First scale the image to a standard size for detection
-            target_size = 1024
-            scale = min(target_size / orig_width, target_size / orig_height)
+            scale = min(DETECTION_SIZE / orig_width, DETECTION_SIZE / orig_height)
             
             if scale < 1.0:  # Only scale down, never up
                 new_width = int(orig_width * scale)
@@ -80,172 +228,182 @@ class FaceCropper:
                 gray_img = cv2.resize(gray_img, (new_width, new_height))
             else:
                 scale = 1.0
-                new_width, new_height = orig_width, orig_height
             
             # Normalize image for better detection
             gray_img = cv2.equalizeHist(gray_img.astype(np.uint8))
             
             # Base parameters for detection at standard size
             front_params = {
-                'scaleFactor': 1.3,
-                'minNeighbors': 4,
+                'scaleFactor': self.scale_factor,
+                'minNeighbors': self.min_neighbors,
                 'minSize': (100, 100),
                 'flags': cv2.CASCADE_SCALE_IMAGE
             }
             
             # More lenient parameters for profile detection
             profile_params = {
-                'scaleFactor': 1.3,  # More gradual scaling for profiles
-                'minNeighbors': 3,   # More lenient neighbor requirement
+                'scaleFactor': self.scale_factor,
+                'minNeighbors': self._profile_neighbors,  # More lenient neighbor requirement
                 'minSize': (100, 100),
                 'flags': cv2.CASCADE_SCALE_IMAGE
             }
             
-            # Define rotation angles - different sets for front and profile
-            angles = [0, 10, -10, -15, 15, -20, 20, -30, 30, 40,-40, 45, -45, 50, -50, 55, -55, 60, -60, 90, -90, ]  # Less extreme for frontal
+            for x, y, w, h, angle, profile, flipped in self._detect_at_angles(gray_img, self.angles, front_params, profile_params):
+                # Scale back to original image coordinates
+                orig_x = int(x / scale)
+                orig_y = int(y / scale)
+                orig_w = int(w / scale)
+                orig_h = int(h / scale)
+                
+                # If this was detected in the flipped image, adjust coordinates
+                if flipped:
+                    orig_x = orig_width - (orig_x + orig_w)
+                
+                confidence = _confidence(orig_w * orig_h, orig_width * orig_height, angle, profile)
+                all_faces.append(FaceDetection(orig_x, orig_y, orig_w, orig_h, confidence))
             
-            center = (new_width // 2, new_height // 2)
+            return self._remove_duplicates(all_faces)
             
-            # First try frontal detection
-            for angle in angles:
+        except Exception as e:
+            logging.error(f"Error in face detection: {str(e)}")
+            return all_faces
+
+    def _detect_at_angles(
+        self,
+        gray_img: np.ndarray,
+        angles: Sequence[int],
+        front_params: Dict[str, Any],
+        profile_params: Dict[str, Any]
+    ) -> List[Tuple[int, int, int, int, int, bool, bool]]:
+        """Run the frontal cascades, then the profile cascade on the image and its mirror, at every angle.
+
+        Returns (x, y, w, h, angle, profile, flipped) boxes in gray_img's
+        coordinates, rotated back to upright; boxes found in the mirrored
+        image are still mirrored.
+        """
+        height, width = gray_img.shape
+        center = (width // 2, height // 2)
+        boxes = []
+        
+        # First try frontal detection
+        for angle in angles:
+            try:
+                rotated = _rotate(gray_img, center, angle)
+                for name, cascade in self.cascades.items():
+                    if 'profile' in name:  # Only use frontal cascades here
+                        continue
+                    try:
+                        for box in cascade.detectMultiScale(rotated, **front_params):
+                            boxes.append((*_rotate_back(box, center, angle), angle, False, False))
+                    except cv2.error as e:
+                        logging.warning(f"OpenCV error during detection: {str(e)}")
+            except Exception as e:
+                logging.warning(f"Error processing angle {angle}: {str(e)}")
+        
+        # Then try profile detection, with a mirrored version for right profiles
+        flipped = cv2.flip(gray_img, 1)
+        cascade = self.cascades['profile_left']
+        for angle in angles:
+            for img in [gray_img, flipped]:  # Try both original and flipped
                 try:
-                    if angle != 0:
-                        M = cv2.getRotationMatrix2D(center, angle, 1.0)
-                        rotated = cv2.warpAffine(gray_img, M, (new_width, new_height))
-                    else:
-                        rotated = gray_img
-                    
-                    # Try frontal cascades
-                    for name, cascade in self.cascades.items():
-                        if 'profile' not in name:  # Only use frontal cascades here
-                            try:
-                                detections = cascade.detectMultiScale(rotated, **front_params)
-                                
-                                for (x, y, w, h) in detections:
-                                    # If image was rotated, transform detection coordinates back
-                                    if angle != 0:
-                                        # Get corners of detection
-                                        corners = np.array([
-                                            [x, y],
-                                            [x + w, y],
-                                            [x + w, y + h],
-                                            [x, y + h]
-                                        ], dtype=np.float32)
-                                        
-                                        # Rotate corners back
-                                        M_inv = cv2.getRotationMatrix2D(center, -angle, 1.0)
-                                        for i in range(len(corners)):
-                                            px = corners[i][0]
-                                            py = corners[i][1]
-                                            corners[i][0] = M_inv[0][0] * px + M_inv[0][1] * py + M_inv[0][2]
-                                            corners[i][1] = M_inv[1][0] * px + M_inv[1][1] * py + M_inv[1][2]
-                                        
-                                        # Get bounding box of rotated corners
-                                        x = int(np.min(corners[:, 0]))
-                                        y = int(np.min(corners[:, 1]))
-                                        w = int(np.max(corners[:, 0]) - x)
-                                        h = int(np.max(corners[:, 1]) - y)
-                                    
-                                    # Scale back to original image coordinates
-                                    orig_x = int(x / scale)
-                                    orig_y = int(y / scale)
-                                    orig_w = int(w / scale)
-                                    orig_h = int(h / scale)
-                                    
-                                    # Calculate confidence based on detection size and angle
-                                    face_area = orig_w * orig_h
-                                    image_area = orig_width * orig_height
-                                    size_ratio = face_area / image_area
-                                    angle_penalty = abs(angle) / 90.0 * 0.2  # Max 0.2 penalty for angle
-                                    confidence = 0.8 + min(size_ratio * 5, 0.2) - angle_penalty
-                                    
-                                    all_faces.append(FaceDetection(orig_x, orig_y, orig_w, orig_h, confidence))
-                                    
-                            except cv2.error as e:
-                                logging.warning(f"OpenCV error during detection: {str(e)}")
-                                continue
-                            
+                    rotated = _rotate(img, center, angle)
+                    try:
+                        for box in cascade.detectMultiScale(rotated, **profile_params):
+                            boxes.append((*_rotate_back(box, center, angle), angle, True, img is flipped))
+                    except cv2.error as e:
+                        logging.warning(f"OpenCV error during profile detection: {str(e)}")
                 except Exception as e:
-                    logging.warning(f"Error processing angle {angle}: {str(e)}")
-                    continue
+                    logging.warning(f"Error processing profile angle {angle}: {str(e)}")
+        
+        return boxes
+
+    def _detect_two_stage(self, gray_img: np.ndarray) -> List[FaceDetection]:
+        """Propose faces on a small image, then verify and refine each one in a high resolution ROI.
+
+        The proposal pass runs at proposal_size pixels with a few angles and
+        a small minimum face size, so it finds faces down to about 6% of the
+        image side (the full pass stops at about 10%). Each proposal is then
+        searched for again in a crop of the full image around it, resized so
+        the face is VERIFY_FACE_SIZE pixels, at the detection angles near
+        the angle it was proposed at. Proposals that don't verify are
+        dropped. Apart from the fixed proposal pass, the cost grows with the
+        number of faces rather than with image area times angles. Faces tilted
+        well away from every proposal angle can be missed.
+        """
+        faces = []
+        try:
+            orig_height, orig_width = gray_img.shape
+            scale = min(1.0, self.proposal_size / max(orig_width, orig_height))
+            small = gray_img
+            if scale < 1.0:
+                small = cv2.resize(gray_img, (int(orig_width * scale), int(orig_height * scale)), interpolation=cv2.INTER_AREA)
+            small = cv2.equalizeHist(small.astype(np.uint8))
             
-            # Then try profile detection
-            # Create a mirrored version for right profiles
-            flipped = cv2.flip(gray_img, 1)
+            proposal_params = {
+                'scaleFactor': 1.2,
+                'minNeighbors': 3,
+                'minSize': (24, 24),
+                'flags': cv2.CASCADE_SCALE_IMAGE
+            }
             
-            for angle in angles:
-                for img in [gray_img, flipped]:  # Try both original and flipped
-                    try:
-                        if angle != 0:
-                            M = cv2.getRotationMatrix2D(center, angle, 1.0)
-                            rotated = cv2.warpAffine(img, M, (new_width, new_height))
-                        else:
-                            rotated = img
-                        
-                        # Only use profile cascade
-                        cascade = self.cascades['profile_left']
-                        try:
-                            detections = cascade.detectMultiScale(rotated, **profile_params)
-                            
-                            for (x, y, w, h) in detections:
-                                # If image was rotated, transform detection coordinates back
-                                if angle != 0:
-                                    # Get corners of detection
-                                    corners = np.array([
-                                        [x, y],
-                                        [x + w, y],
-                                        [x + w, y + h],
-                                        [x, y + h]
-                                    ], dtype=np.float32)
-                                    
-                                    # Rotate corners back
-                                    M_inv = cv2.getRotationMatrix2D(center, -angle, 1.0)
-                                    for i in range(len(corners)):
-                                        px = corners[i][0]
-                                        py = corners[i][1]
-                                        corners[i][0] = M_inv[0][0] * px + M_inv[0][1] * py + M_inv[0][2]
-                                        corners[i][1] = M_inv[1][0] * px + M_inv[1][1] * py + M_inv[1][2]
-                                    
-                                    # Get bounding box of rotated corners
-                                    x = int(np.min(corners[:, 0]))
-                                    y = int(np.min(corners[:, 1]))
-                                    w = int(np.max(corners[:, 0]) - x)
-                                    h = int(np.max(corners[:, 1]) - y)
-                                
-                                # Scale back to original image coordinates
-                                orig_x = int(x / scale)
-                                orig_y = int(y / scale)
-                                orig_w = int(w / scale)
-                                orig_h = int(h / scale)
-                                
-                                # Calculate confidence based on detection size and angle
-                                face_area = orig_w * orig_h
-                                image_area = orig_width * orig_height
-                                size_ratio = face_area / image_area
-                                angle_penalty = abs(angle) / 90.0 * 0.2  # Max 0.2 penalty for angle
-                                
-                                # Adjust confidence for profile detections
-                                confidence = 0.7 + min(size_ratio * 5, 0.2) - angle_penalty  # Lower base confidence for profiles
-                                
-                                # If this was detected in the flipped image, adjust coordinates
-                                if img is flipped:
-                                    orig_x = orig_width - (orig_x + orig_w)
-                                
-                                all_faces.append(FaceDetection(orig_x, orig_y, orig_w, orig_h, confidence))
-                                
-                        except cv2.error as e:
-                            logging.warning(f"OpenCV error during profile detection: {str(e)}")
-                            continue
-                            
-                    except Exception as e:
-                        logging.warning(f"Error processing profile angle {angle}: {str(e)}")
-                        continue
+            # Overlapping proposals from different cascades and angles are searched once
+            proposals: List[Tuple[FaceDetection, set]] = []
+            for x, y, w, h, angle, profile, flipped in self._detect_at_angles(small, PROPOSAL_ANGLES, proposal_params, proposal_params):
+                if flipped:
+                    x = small.shape[1] - (x + w)
+                box = FaceDetection(int(x / scale), int(y / scale), int(w / scale), int(h / scale))
+                for known, angles in proposals:
+                    if known.calculate_iou(box) > 0.3:
+                        angles.add(angle)
+                        break
+                else:
+                    proposals.append((box, {angle}))
             
-            return self._remove_duplicates(all_faces)
+            for box, angles in proposals:
+                faces.extend(self._verify_proposal(gray_img, box, angles))
+            
+            return self._remove_duplicates(faces)
             
         except Exception as e:
             logging.error(f"Error in face detection: {str(e)}")
-            return all_faces
+            return faces
+
+    def _verify_proposal(self, gray_img: np.ndarray, proposal: FaceDetection, proposal_angles: set) -> List[FaceDetection]:
+        """Detect faces in the region around a proposal, in full image coordinates"""
+        orig_height, orig_width = gray_img.shape
+        size = max(proposal.width, proposal.height)
+        margin = int(size * ROI_MARGIN)
+        x0, y0 = max(0, proposal.x - margin), max(0, proposal.y - margin)
+        x1 = min(orig_width, proposal.x + proposal.width + margin)
+        y1 = min(orig_height, proposal.y + proposal.height + margin)
+        
+        # Small faces are enlarged, at most 2x, so they're well above the cascades' 24 px window
+        roi_scale = min(VERIFY_FACE_SIZE / size, 2.0)
+        roi_width, roi_height = max(1, round((x1 - x0) * roi_scale)), max(1, round((y1 - y0) * roi_scale))
+        interpolation = cv2.INTER_AREA if roi_scale < 1.0 else cv2.INTER_LINEAR
+        roi = cv2.resize(gray_img[y0:y1, x0:x1], (roi_width, roi_height), interpolation=interpolation)
+        roi = cv2.equalizeHist(roi.astype(np.uint8))
+        
+        face_size = size * roi_scale
+        params = {
+            'scaleFactor': 1.1,
+            'minSize': (int(face_size * 0.5), int(face_size * 0.5)),
+            'maxSize': (int(face_size * 2), int(face_size * 2)),
+            'flags': cv2.CASCADE_SCALE_IMAGE
+        }
+        angles = [a for a in self.angles if any(abs(a - p) <= VERIFY_ANGLE_RANGE for p in proposal_angles)]
+        
+        faces = []
+        for x, y, w, h, angle, profile, flipped in self._detect_at_angles(
+            roi, angles, {**params, 'minNeighbors': self.min_neighbors}, {**params, 'minNeighbors': self._profile_neighbors}
+        ):
+            if flipped:
+                x = roi_width - (x + w)
+            face_x, face_y = x0 + int(x / roi_scale), y0 + int(y / roi_scale)
+            face_w, face_h = int(w / roi_scale), int(h / roi_scale)
+            confidence = _confidence(face_w * face_h, orig_width * orig_height, angle, profile)
+            faces.append(FaceDetection(face_x, face_y, face_w, face_h, confidence))
+        return faces
     
     def _remove_duplicates(self, faces: List[FaceDetection], iou_threshold: float = 0.5) -> List[FaceDetection]:
         """Remove overlapping detections using IoU and containment, keeping highest confidence ones."""
@@ -281,8 +439,11 @@ class FaceCropper:
     
     def crop_face(self, img: np.ndarray, face: FaceDetection) -> Optional[np.ndarray]:
         """Create a square crop of the face with consistent padding."""
-        img_height, img_width = img.shape[:2]
-        
+        x0, y0, x1, y1 = self.crop_box(img.shape[1], img.shape[0], face)
+        return img[y0:y1, x0:x1].copy()
+
+    def crop_box(self, img_width: int, img_height: int, face: FaceDetection) -> Tuple[int, int, int, int]:
+        """The (x0, y0, x1, y1) box crop_face cuts out of an image of this size."""
         # Calculate padding based on face dimensions
         face_size = max(face.width, face.height)
         padding = int(face_size * (self.padding_percent / 100))
@@ -324,23 +485,18 @@ class FaceCropper:
         end_x = max(0, min(end_x, img_width))
         end_y = max(0, min(end_y, img_height))
         
-        # Extract the crop
-        crop = img[start_y:end_y, start_x:end_x].copy()
-        
         # Ensure square crop
-        height, width = crop.shape[:2]
-        if height != width:
-            min_dim = min(height, width)
-            if height > width:
-                # Crop height to match width
-                excess = height - width
-                crop = crop[excess//2:excess//2 + min_dim, :]
-            else:
-                # Crop width to match height
-                excess = width - height
-                crop = crop[:, excess//2:excess//2 + min_dim]
+        height, width = end_y - start_y, end_x - start_x
+        if height > width:
+            # Crop height to match width
+            start_y += (height - width) // 2
+            end_y = start_y + width
+        elif width > height:
+            # Crop width to match height
+            start_x += (width - height) // 2
+            end_x = start_x + height
         
-        return crop
+        return start_x, start_y, end_x, end_y
     
     def visualize_detections(self, img: np.ndarray, faces: List[FaceDetection]) -> np.ndarray:
         """Draw bounding boxes and confidence scores on the image."""
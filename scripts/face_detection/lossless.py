@@ -0,0 +1,74 @@
+"""
+lossless.py - Lossless JPEG crops on MCU boundaries with jpegtran
+"""
+
+import io
+import shutil
+import logging
+import subprocess
+from functools import lru_cache
+from typing import Optional, Tuple
+
+# EXIF orientation tag; only upright files have pixels where the decoder puts them
+_ORIENTATION = 0x0112
+
+@lru_cache(maxsize=1)
+def jpegtran_path() -> Optional[str]:
+    """Path of the jpegtran binary (libjpeg-turbo), or None when it isn't installed"""
+    return shutil.which('jpegtran')
+
+def jpeg_mcu_size(data: bytes) -> Optional[Tuple[int, int, int, int]]:
+    """(mcu_width, mcu_height, width, height) of an upright JPEG, else None.
+
+    Only the header is parsed. Files with an EXIF orientation other than 1
+    are decoded rotated, so their crop boxes don't map onto the stored
+    blocks and None is returned for them too.
+    """
+    from PIL import Image
+
+    if not data.startswith(b'\xff\xd8'):
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.format != 'JPEG' or image.getexif().get(_ORIENTATION, 1) != 1:
+                return None
+            # layer: (component id, horizontal sampling, vertical sampling, quantization table)
+            h_samp = max(layer[1] for layer in image.layer)
+            v_samp = max(layer[2] for layer in image.layer)
+            return 8 * h_samp, 8 * v_samp, image.width, image.height
+    except Exception:
+        return None
+
+def snap_crop_box(
+    box: Tuple[int, int, int, int],
+    mcu: Tuple[int, int],
+    max_shift_fraction: float = 0.05
+) -> Optional[Tuple[int, int, int, int]]:
+    """Move a crop box up and left onto MCU boundaries, keeping its size.
+
+    jpegtran can only start a lossless crop on an MCU boundary; the far edges
+    may fall anywhere. Moving the box toward the origin keeps it inside the
+    image and keeps a square box square. Returns None when the move would
+    exceed max_shift_fraction of the box size, which happens for crops only a
+    few MCUs across.
+    """
+    x0, y0, x1, y1 = box
+    snapped_x, snapped_y = x0 - x0 % mcu[0], y0 - y0 % mcu[1]
+    size = max(x1 - x0, y1 - y0)
+    if size <= 0 or max(x0 - snapped_x, y0 - snapped_y) > max_shift_fraction * size:
+        return None
+    return snapped_x, snapped_y, snapped_x + (x1 - x0), snapped_y + (y1 - y0)
+
+def lossless_crop(data: bytes, box: Tuple[int, int, int, int], timeout: float = 30) -> Optional[bytes]:
+    """Crop JPEG bytes to an MCU-aligned box without re-encoding, or None if jpegtran can't"""
+    binary = jpegtran_path()
+    if binary is None:
+        return None
+    x0, y0, x1, y1 = box
+    command = [binary, '-crop', f"{x1 - x0}x{y1 - y0}+{x0}+{y0}", '-copy', 'all', '-optimize']
+    try:
+        completed = subprocess.run(command, input=data, capture_output=True, timeout=timeout, check=True)
+    except (OSError, subprocess.SubprocessError) as e:
+        logging.error(f"jpegtran crop failed: {str(e)}")
+        return None
+    return completed.stdout or None
@@ -1,3 +1,3 @@
-from .analyzer import ImageQualityAnalyzer, ImageQualityMetrics
+from .analyzer import ImageQualityAnalyzer, ImageQualityMetrics, summarize_metrics
 
-__all__ = ['ImageQualityAnalyzer', 'ImageQualityMetrics'] 
\ No newline at end of file
+__all__ = ['ImageQualityAnalyzer', 'ImageQualityMetrics', 'summarize_metrics']
\ No newline at end of file
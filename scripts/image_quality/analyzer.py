@@ -3,19 +3,22 @@
 analyzer.py - Core image quality analysis functionality
 """
 
+import io
 import os
+import inspect
+import threading
 import numpy as np
 from PIL import Image
-import scipy.fft
-from scipy.signal import convolve2d
-from dataclasses import dataclass
-from typing import Dict, List, Tuple
-from scipy.ndimage import uniform_filter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
 from collections import Counter
 import logging
-import cv2
-from skimage.filters.rank import entropy
-from skimage.morphology import disk
+from .duplicates import dhash, find_duplicate_groups
+from .precision import PRECISIONS, PEAK_BYTES_PER_PIXEL, ScratchBuffers, extract_features_float32
+
+if TYPE_CHECKING:
+    from face_detection.detector import FaceDetection
+    from pipeline.cache import PixelCache
 
 @dataclass
 class ImageQualityMetrics:
@@ -31,6 +34,165 @@ class ImageQualityMetrics:
     contrast_score: float
     is_acceptable: bool
     rejection_reasons: List[str]
+    # Per-face raw features and scores when analyzed in face ROI mode
+    face_rois: List[Dict[str, float]] = field(default_factory=list)
+    # Unthresholded measurements the scores are derived from, see RAW_FEATURES
+    raw_features: Dict[str, float] = field(default_factory=dict)
+    # 64-bit dHash as hex, and near-duplicate cluster membership set by the summary
+    perceptual_hash: str = ''
+    duplicate_group: Optional[int] = None
+    duplicate_of: Optional[str] = None
+
+# Raw measurements stored with every result, so new thresholds can be applied
+# without decoding any pixels again
+RAW_FEATURES = (
+    'laplacian_variance',   # Laplacian variance in high-detail regions
+    'high_freq_ratio',      # Share of FFT magnitude above the detail radius
+    'mean_gradient',        # Mean Sobel gradient magnitude
+    'mean_local_variance',  # Mean variance in 3x3 windows
+    'mean_saturation',      # Mean HSV-style saturation, 0-1
+    'contrast_ratio'        # Grayscale std / mean
+)
+
+# Analyzer settings that only affect scoring and can be changed by rescoring
+THRESHOLDS = (
+    'min_width',
+    'min_height',
+    'min_saturation',
+    'max_saturation',
+    'min_contrast',
+    'blur_threshold',
+    'detail_threshold',
+    'duplicate_distance'
+)
+
+# Scores averaged in the dataset summary, by summary name and metrics attribute
+SUMMARY_SCORES = {
+    'blur_score': 'blur_score',
+    'detail_score': 'detail_score',
+    'saturation': 'saturation_mean',
+    'contrast': 'contrast_score'
+}
+
+def summarize_metrics(analyzed_images: List[ImageQualityMetrics], duplicate_distance: int = 6) -> Dict:
+    """Summarize per-image metrics into dataset level trends and issues.
+
+    Metrics are ordered by filename first, so the summary only depends on which
+    images were analyzed and not on the order they finished in. Merging shard
+    results therefore gives exactly the summary of a single run.
+
+    Images whose perceptual hashes are within duplicate_distance bits are
+    clustered; each metric's duplicate_group and duplicate_of are updated, with
+    the best image of a cluster (accepted first, then most detailed) kept.
+    """
+    if not analyzed_images:
+        return {"error": "No images analyzed"}
+
+    analyzed_images = sorted(analyzed_images, key=lambda m: m.filename)
+    return {
+        **_summarize_scores(analyzed_images),
+        "duplicates": _cluster_duplicates(analyzed_images, duplicate_distance)
+    }
+
+def _summarize_scores(analyzed_images: List[ImageQualityMetrics]) -> Dict:
+    return {
+        "total_images": len(analyzed_images),
+        "accepted_images": sum(1 for m in analyzed_images if m.is_acceptable),
+        "rejection_reasons": dict(Counter(
+            reason
+            for metrics in analyzed_images
+            for reason in metrics.rejection_reasons
+        )),
+        "average_metrics": {
+            "blur_score": np.mean([m.blur_score for m in analyzed_images]),
+            "detail_score": np.mean([m.detail_score for m in analyzed_images]),
+            "saturation": np.mean([m.saturation_mean for m in analyzed_images]),
+            "contrast": np.mean([m.contrast_score for m in analyzed_images])
+        }
+    }
+
+def _cluster_duplicates(analyzed_images: List[ImageQualityMetrics], duplicate_distance: int) -> Dict:
+    hashed = [m for m in analyzed_images if m.perceptual_hash]
+    groups = find_duplicate_groups([int(m.perceptual_hash, 16) for m in hashed], duplicate_distance)
+
+    for metrics in analyzed_images:
+        metrics.duplicate_group = None
+        metrics.duplicate_of = None
+
+    clusters = []
+    for group_id, group in enumerate(groups):
+        members = [hashed[i] for i in group]
+        keeper = max(members, key=lambda m: (m.is_acceptable, m.detail_score))
+        for metrics in members:
+            metrics.duplicate_group = group_id
+            if metrics is not keeper:
+                metrics.duplicate_of = keeper.filename
+        clusters.append({
+            "keep": keeper.filename,
+            "duplicates": [m.filename for m in members if m is not keeper]
+        })
+
+    return {
+        "max_hash_distance": duplicate_distance,
+        "clusters": len(clusters),
+        "redundant_images": sum(len(cluster["duplicates"]) for cluster in clusters),
+        "groups": clusters
+    }
+
+class RunningSummary:
+    """Dataset summary of a changing set of images, updated by the delta.
+
+    Used by watch mode: adding, replacing or removing an image adjusts the
+    counts and score totals instead of recounting every image. Near-duplicate
+    clusters depend on all hashes, so they are rebuilt on the next summary()
+    after the set changed; summary(duplicates=False) skips them and stays
+    independent of the number of images. summary() matches summarize_metrics
+    over the same images, up to float rounding in the averages.
+    """
+
+    def __init__(self, duplicate_distance: int = 6):
+        self.duplicate_distance = duplicate_distance
+        self.metrics: Dict[str, ImageQualityMetrics] = {}
+        self._accepted = 0
+        self._reasons: Counter = Counter()
+        self._totals = {name: 0.0 for name in SUMMARY_SCORES}
+        self._duplicates: Optional[Dict] = None
+
+    def add(self, metrics: ImageQualityMetrics) -> None:
+        """Add an image, replacing an earlier result with the same filename"""
+        self.remove(metrics.filename)
+        self.metrics[metrics.filename] = metrics
+        self._count(metrics, 1)
+
+    def remove(self, filename: str) -> Optional[ImageQualityMetrics]:
+        metrics = self.metrics.pop(filename, None)
+        if metrics is not None:
+            self._count(metrics, -1)
+        return metrics
+
+    def _count(self, metrics: ImageQualityMetrics, sign: int) -> None:
+        self._accepted += sign * metrics.is_acceptable
+        self._reasons.update({reason: sign for reason in metrics.rejection_reasons})
+        for name, attribute in SUMMARY_SCORES.items():
+            self._totals[name] += sign * getattr(metrics, attribute)
+        self._duplicates = None
+
+    def summary(self, duplicates: bool = True) -> Dict:
+        if not self.metrics:
+            return {"error": "No images analyzed"}
+        total = len(self.metrics)
+        summary = {
+            "total_images": total,
+            "accepted_images": self._accepted,
+            "rejection_reasons": {reason: count for reason, count in self._reasons.items() if count > 0},
+            "average_metrics": {name: self._totals[name] / total for name in SUMMARY_SCORES}
+        }
+        if duplicates:
+            if self._duplicates is None:
+                ordered = [self.metrics[name] for name in sorted(self.metrics)]
+                self._duplicates = _cluster_duplicates(ordered, self.duplicate_distance)
+            summary["duplicates"] = self._duplicates
+        return summary
 
 class ImageQualityAnalyzer:
     """Comprehensive image quality analysis including blur detection and detail assessment"""
@@ -45,7 +207,12 @@ class ImageQualityAnalyzer:
         min_contrast: float = 0.3,
         blur_threshold: float = 50.0,
         detail_threshold: float = 0.5,
-        face_roi_size: Tuple[int, int] = (224, 224)
+        face_roi_size: Tuple[int, int] = (224, 224),
+        pixel_cache: Optional['PixelCache'] = None,
+        duplicate_distance: int = 6,
+        precision: str = 'float64',
+        memory_budget: Optional[int] = None,
+        fft_workers: int = 1
     ):
         self.min_width = min_width
         self.min_height = min_height
@@ -56,83 +223,467 @@ class ImageQualityAnalyzer:
         self.blur_threshold = blur_threshold
         self.detail_threshold = detail_threshold
         self.face_roi_size = face_roi_size
+        self.pixel_cache = pixel_cache
+        self.duplicate_distance = duplicate_distance
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision '{precision}', expected one of {', '.join(PRECISIONS)}")
+        # float32 halves the memory per intermediate and reuses scratch buffers between images
+        self.precision = precision
+        # Bytes one analysis may use; larger images are refused rather than risking the node
+        self.memory_budget = memory_budget
+        # Threads each FFT may use; more than one only pays off with few analysis threads
+        self.fft_workers = fft_workers
+        self._scratch = ScratchBuffers()
+        # Per thread, so concurrent analyses don't draw each other's masks
+        self._local = threading.local()
         self.analyzed_images: List[ImageQualityMetrics] = []
 
-    def analyze_image(self, image_path: str) -> ImageQualityMetrics:
+    @property
+    def _last_high_detail_mask(self) -> Optional[np.ndarray]:
+        """High detail mask of the last image this thread analyzed, for visualize_analysis"""
+        return getattr(self._local, 'high_detail_mask', None)
+
+    @_last_high_detail_mask.setter
+    def _last_high_detail_mask(self, mask: Optional[np.ndarray]) -> None:
+        self._local.high_detail_mask = mask
+
+    def reset(self, **settings) -> None:
+        """Forget analyzed images and apply new settings, so one warm instance can serve many runs.
+
+        Settings that aren't given go back to their defaults, so nothing
+        carries over from the previous run.
+        """
+        defaults = {
+            name: parameter.default
+            for name, parameter in inspect.signature(ImageQualityAnalyzer.__init__).parameters.items()
+            if name != 'self'
+        }
+        unknown = set(settings) - set(defaults)
+        if unknown:
+            raise TypeError(f"Unknown analyzer setting: {', '.join(sorted(unknown))}")
+        settings = {**defaults, **settings}
+        if settings['precision'] not in PRECISIONS:
+            raise ValueError(f"Unknown precision '{settings['precision']}', expected one of {', '.join(PRECISIONS)}")
+        for name, value in settings.items():
+            setattr(self, name, value)
+        self.analyzed_images = []
+
+    def load_image(self, source: Any) -> np.ndarray:
+        """Load an image as an RGB uint8 array.
+
+        Accepts a path, raw bytes, a file object, a PIL image or an array. With a
+        pixel cache configured, paths and bytes come back as read-only
+        memory-mapped views of the cached pixels.
+        """
+        if isinstance(source, np.ndarray):
+            return source
+        if isinstance(source, Image.Image):
+            return np.asarray(source.convert('RGB'))
+        if self.pixel_cache is not None:
+            if isinstance(source, (str, os.PathLike)):
+                with open(source, 'rb') as f:
+                    source = f.read()
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                return self.pixel_cache.get_or_decode(bytes(source), 'rgb', self._decode)
+        return self._decode(source)
+
+    def _decode(self, source: Any) -> np.ndarray:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        with Image.open(source) as image:
+            # Convert to RGB if needed
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            return np.asarray(image)
+
+    def analyze_image(self, source: Any, filename: Optional[str] = None) -> ImageQualityMetrics:
         """Analyze a single image for all quality metrics"""
+        filename = filename or self._source_name(source)
+        try:
+            # Convert to numpy array for analysis
+            np_image = self.load_image(source)
+            gray_plane = Image.fromarray(np_image).convert('L')
+            height, width = np_image.shape[:2]
+            return self._build_metrics(
+                filename,
+                width,
+                height,
+                self.extract_features(np_image, gray_plane),
+                perceptual_hash=dhash(gray_plane)
+            )
+
+        except Exception as e:
+            logging.error(f"Error analyzing {filename}: {str(e)}")
+            raise
+
+    def analyze_face_rois(
+        self,
+        source: Any,
+        faces: List['FaceDetection'],
+        filename: Optional[str] = None,
+        gray_plane: Optional[Image.Image] = None
+    ) -> ImageQualityMetrics:
+        """Analyze quality on face regions only, resampled to face_roi_size.
+
+        Every face is resampled to the same small patch, so the cost per image no
+        longer depends on the photo resolution. The image level scores are taken
+        from the largest face; per-face scores are kept in face_rois. Falls back
+        to whole-frame analysis when no usable face box is given.
+
+        gray_plane, when given, is a grayscale copy of the image at any size
+        (e.g. the one faces were detected on) and is used for the perceptual
+        hash instead of converting the full image again.
+        """
+        filename = filename or self._source_name(source)
         try:
-            with Image.open(image_path) as image:
-                # Convert to RGB if needed
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
-                
-                rejection_reasons = []
-                
-                # Basic dimension checks
-                width, height = image.size
-                if width < self.min_width or height < self.min_height:
-                    rejection_reasons.append(f"Resolution too low: {width}x{height}")
-
-                # Convert to numpy array for analysis
-                np_image = np.array(image)
-                gray_image = np.array(image.convert('L'), dtype=float)
-
-                # Analyze blur
-                is_blurry, blur_score = self._detect_blur(gray_image)
-                if is_blurry:
-                    rejection_reasons.append(f"Image too blurry (score: {blur_score:.2f})")
-
-                # Analyze detail with weighted combination
-                detail_metrics = self._analyze_detail(image)
-                
-                # Calculate weighted detail score with emphasis on edge density
-                detail_score = (
-                    detail_metrics['frequency_score'] * 0.3 +   # Frequency components
-                    detail_metrics['edge_density'] * 0.5 +      # Edge information (primary)
-                    detail_metrics['local_variance'] * 0.2      # Local contrast
-                )
-                
-                if detail_score < 50:
-                    rejection_reasons.append(f"Insufficient detail: {detail_score:.1f}/100")
-                    if detail_metrics['edge_density'] < 40:
-                        rejection_reasons.append(f"Low edge detail: {detail_metrics['edge_density']:.1f}/100")
-                    if detail_metrics['frequency_score'] < 40:
-                        rejection_reasons.append(f"Low frequency detail: {detail_metrics['frequency_score']:.1f}/100")
-
-                # Color analysis
-                saturation_score = self._analyze_saturation(np_image)
-                contrast_score = self._analyze_contrast(gray_image)
-                
-                if saturation_score < 50:
-                    rejection_reasons.append(f"Poor saturation: {saturation_score:.1f}/100")
-                
-                if contrast_score < 50:
-                    rejection_reasons.append(f"Insufficient contrast: {contrast_score:.1f}/100")
-
-                metrics = ImageQualityMetrics(
-                    filename=os.path.basename(image_path),
-                    width=width,
-                    height=height,
-                    face_coverage=0.0,
-                    blur_score=blur_score,  # Now 0-100
-                    detail_score=detail_score,  # Now 0-100
-                    edge_density=detail_metrics['edge_density'],  # Now 0-100
-                    local_variance=detail_metrics['local_variance'],  # Now 0-100
-                    saturation_mean=saturation_score,  # Now 0-100
-                    contrast_score=contrast_score,  # Now 0-100
-                    is_acceptable=len(rejection_reasons) == 0,
-                    rejection_reasons=rejection_reasons
-                )
-                
-                self.analyzed_images.append(metrics)
-                return metrics
+            np_image = self.load_image(source)
+
+            height, width = np_image.shape[:2]
+            boxes = self._clip_face_boxes(faces, width, height)
+            if not boxes:
+                return self.analyze_image(np_image, filename)
+
+            # No whole-frame mask in this mode; visualize_analysis must not draw the last image's
+            self._last_high_detail_mask = None
+            rgb_patches, gray_patches = self._extract_face_rois(Image.fromarray(np_image), boxes)
+            face_features = self.extract_face_roi_features(rgb_patches, gray_patches)
+            face_rois = self._face_roi_records(face_features)
+
+            # Largest face drives the image level scores
+            areas = [(x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in boxes]
+            primary = int(np.argmax(areas))
+            face_coverage = min(1.0, sum(areas) / float(width * height))
+
+            return self._build_metrics(
+                filename,
+                width,
+                height,
+                {name: float(values[primary]) for name, values in face_features.items()},
+                face_coverage=face_coverage,
+                face_rois=face_rois,
+                perceptual_hash=dhash(gray_plane if gray_plane is not None else Image.fromarray(np_image).convert('L'))
+            )
 
         except Exception as e:
-            logging.error(f"Error analyzing {image_path}: {str(e)}")
+            logging.error(f"Error analyzing face regions of {filename}: {str(e)}")
             raise
 
-    def _detect_blur(self, image: np.ndarray) -> Tuple[bool, float]:
-        """Detect if an image is blurry using Laplacian variance, focusing on high-detail regions."""
+    def _source_name(self, source: Any) -> str:
+        """Best effort file name for results and log messages"""
+        if isinstance(source, (str, os.PathLike)):
+            return os.path.basename(source)
+        return getattr(source, 'filename', None) or 'image'
+
+    def extract_face_roi_features(self, rgb_patches: np.ndarray, gray_patches: np.ndarray) -> Dict[str, np.ndarray]:
+        """Measure raw features on a batch of same-sized face patches in one vectorized pass.
+
+        rgb_patches is (N, H, W, 3) uint8 and gray_patches is (N, H, W) float.
+        Patches may come from different images since they all share one shape.
+        """
+        import scipy.fft
+        from scipy.ndimage import uniform_filter
+
+        # Laplacian ('valid' region) - the whole patch is the subject, so no entropy mask
+        laplacian = np.abs(
+            gray_patches[:, :-2, 1:-1] + gray_patches[:, 2:, 1:-1] +
+            gray_patches[:, 1:-1, :-2] + gray_patches[:, 1:-1, 2:] -
+            4 * gray_patches[:, 1:-1, 1:-1]
+        )
+        laplacian_variance = np.var(laplacian, axis=(1, 2))
+
+        # Sobel gradients ('valid' region)
+        grad_x = (
+            (gray_patches[:, :-2, 2:] - gray_patches[:, :-2, :-2]) +
+            2 * (gray_patches[:, 1:-1, 2:] - gray_patches[:, 1:-1, :-2]) +
+            (gray_patches[:, 2:, 2:] - gray_patches[:, 2:, :-2])
+        )
+        grad_y = (
+            (gray_patches[:, 2:, :-2] - gray_patches[:, :-2, :-2]) +
+            2 * (gray_patches[:, 2:, 1:-1] - gray_patches[:, :-2, 1:-1]) +
+            (gray_patches[:, 2:, 2:] - gray_patches[:, :-2, 2:])
+        )
+        mean_gradient = np.mean(np.sqrt(grad_x**2 + grad_y**2), axis=(1, 2))
+
+        # Local variance in 3x3 windows, never mixing neighbouring patches
+        local_mean = uniform_filter(gray_patches, size=(1, 3, 3))
+        local_sqr_mean = uniform_filter(gray_patches**2, size=(1, 3, 3))
+        mean_local_variance = np.mean(local_sqr_mean - local_mean**2, axis=(1, 2))
+
+        # High frequency energy ratio, sharing one radius mask across the batch
+        magnitude = np.abs(scipy.fft.fftshift(scipy.fft.fft2(gray_patches, axes=(1, 2), workers=self.fft_workers), axes=(1, 2)))
+        rows, cols = gray_patches.shape[1:]
+        y, x = np.ogrid[-(rows // 2):rows - rows // 2, -(cols // 2):cols - cols // 2]
+        high_freq_mask = np.sqrt(x*x + y*y) > (rows * self.detail_threshold)
+        total_energy = np.sum(magnitude, axis=(1, 2))
+        high_freq_energy = np.sum(magnitude * high_freq_mask, axis=(1, 2))
+        high_freq_ratio = np.divide(high_freq_energy, total_energy, out=np.zeros_like(total_energy), where=total_energy > 0)
+
+        # Color measurements per patch
+        mean_saturation = np.array([self._mean_saturation(patch) for patch in rgb_patches])
+        contrast_ratio = np.array([self._contrast_ratio(patch) for patch in gray_patches])
+
+        return {
+            'laplacian_variance': laplacian_variance,
+            'high_freq_ratio': high_freq_ratio,
+            'mean_gradient': mean_gradient,
+            'mean_local_variance': mean_local_variance,
+            'mean_saturation': mean_saturation,
+            'contrast_ratio': contrast_ratio
+        }
+
+    def _face_roi_records(self, face_features: Dict[str, np.ndarray]) -> List[Dict[str, float]]:
+        """Per-face dicts holding both the raw features and their scores"""
+        columns = {**face_features, **self.score_features(face_features)}
+        count = len(face_features['laplacian_variance'])
+        return [{name: float(values[i]) for name, values in columns.items()} for i in range(count)]
+
+    def _clip_face_boxes(self, faces: List['FaceDetection'], width: int, height: int) -> List[Tuple[int, int, int, int]]:
+        """Clip face boxes to the image, dropping any that end up empty."""
+        boxes = []
+        for face in faces:
+            x, y, w, h = face.get_box()
+            x0, y0 = max(0, x), max(0, y)
+            x1, y1 = min(width, x + w), min(height, y + h)
+            if x1 - x0 >= 3 and y1 - y0 >= 3:
+                boxes.append((x0, y0, x1, y1))
+        return boxes
+
+    def _extract_face_rois(self, image: Image.Image, boxes: List[Tuple[int, int, int, int]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Crop and resample each face box to face_roi_size in a single resize call."""
+        rgb_patches = np.stack([
+            np.asarray(image.resize(self.face_roi_size, Image.BILINEAR, box=box, reducing_gap=2.0))
+            for box in boxes
+        ])
+        gray_patches = np.stack([
+            np.asarray(Image.fromarray(patch).convert('L'), dtype=self.precision)
+            for patch in rgb_patches
+        ])
+        return rgb_patches, gray_patches
+
+    def _build_metrics(
+        self,
+        filename: str,
+        width: int,
+        height: int,
+        features: Dict[str, float],
+        face_coverage: float = 0.0,
+        face_rois: List[Dict[str, float]] = None,
+        perceptual_hash: Optional[int] = None
+    ) -> ImageQualityMetrics:
+        """Score raw features against the thresholds and record the result"""
+        scores = self.score_features(features)
+        rejection_reasons = self._rejection_reasons(width, height, scores)[0]
+
+        metrics = ImageQualityMetrics(
+            filename=filename,
+            width=width,
+            height=height,
+            face_coverage=face_coverage,
+            blur_score=float(scores['blur_score']),  # Now 0-100
+            detail_score=float(scores['detail_score']),  # Now 0-100
+            edge_density=float(scores['edge_density']),  # Now 0-100
+            local_variance=float(scores['local_variance']),  # Now 0-100
+            saturation_mean=float(scores['saturation_mean']),  # Now 0-100
+            contrast_score=float(scores['contrast_score']),  # Now 0-100
+            is_acceptable=len(rejection_reasons) == 0,
+            rejection_reasons=rejection_reasons,
+            face_rois=face_rois or [],
+            raw_features=features,
+            perceptual_hash=f"{perceptual_hash:016x}" if perceptual_hash is not None else ''
+        )
+        
+        self.analyzed_images.append(metrics)
+        return metrics
+
+    def extract_features(self, np_image: np.ndarray, gray_plane: Optional[Image.Image] = None) -> Dict[str, float]:
+        """Measure the raw, unthresholded features of an RGB image"""
+        if gray_plane is None:
+            gray_plane = Image.fromarray(np_image).convert('L')
+        self._check_memory_budget(*gray_plane.size)
+        if self.precision == 'float32':
+            features, self._last_high_detail_mask = extract_features_float32(
+                np_image, gray_plane, self.detail_threshold, self._scratch, self.fft_workers
+            )
+            return features
+
+        gray_image = np.array(gray_plane, dtype=float)
+        return {
+            'laplacian_variance': self._laplacian_variance(gray_image),
+            'high_freq_ratio': float(self._analyze_frequency_distribution(gray_image)),
+            'mean_gradient': self._calculate_edge_density(gray_image),
+            'mean_local_variance': self._calculate_local_variance(gray_image),
+            'mean_saturation': self._mean_saturation(np_image),
+            'contrast_ratio': self._contrast_ratio(gray_image)
+        }
+
+    def estimate_peak_bytes(self, width: int, height: int) -> int:
+        """Approximate peak memory of extract_features for an image of this size"""
+        return PEAK_BYTES_PER_PIXEL[self.precision] * width * height
+
+    def _check_memory_budget(self, width: int, height: int) -> None:
+        if self.memory_budget is None:
+            return
+        needed = self.estimate_peak_bytes(width, height)
+        if needed > self.memory_budget:
+            hint = " or use float32 precision" if self.precision == 'float64' else ""
+            raise MemoryError(
+                f"A {width}x{height} image needs about {needed / (1 << 20):.0f} MB at {self.precision}, "
+                f"over the {self.memory_budget / (1 << 20):.0f} MB memory budget; raise the budget{hint}"
+            )
+
+    def score_features(self, features: Dict[str, Any]) -> Dict[str, np.ndarray]:
+        """Normalize raw features to 0-100 scores against the current thresholds.
+
+        Works element-wise, so the same code scores a single image or the stored
+        features of a whole dataset in one vectorized pass.
+        """
+        laplacian_variance = np.asarray(features['laplacian_variance'], dtype=float)
+        high_freq_ratio = np.asarray(features['high_freq_ratio'], dtype=float)
+        mean_gradient = np.asarray(features['mean_gradient'], dtype=float)
+        mean_local_variance = np.asarray(features['mean_local_variance'], dtype=float)
+        mean_saturation = np.asarray(features['mean_saturation'], dtype=float)
+        contrast_ratio = np.asarray(features['contrast_ratio'], dtype=float)
+
+        # Blur: 0 is blurry, 100 is sharp, using blur_threshold as reference point (should give 50)
+        blur_score = np.minimum(100, (laplacian_variance / self.blur_threshold) * 50)
+
+        # Frequency score - use sigmoid for smoother transition
+        frequency_score = 100 / (1 + np.exp(-10 * (high_freq_ratio - self.detail_threshold)))
+        
+        # Edge density - normalize based on typical range (0-15)
+        edge_density = np.clip(mean_gradient * 6.67, 0, 100)  # 15 * 6.67 = 100
+        
+        # Local variance - use log scale for better distribution
+        # Typical values range from 50-5000
+        local_variance = np.clip(20 * np.log10(1 + mean_local_variance), 0, 100)
+
+        # Calculate weighted detail score with emphasis on edge density
+        detail_score = (
+            frequency_score * 0.3 +   # Frequency components
+            edge_density * 0.5 +      # Edge information (primary)
+            local_variance * 0.2      # Local contrast
+        )
+
+        # Saturation score peaks at ideal saturation (halfway between min and max thresholds)
+        ideal_saturation = (self.min_saturation + self.max_saturation) / 2
+        saturation_mean = np.clip(np.where(
+            mean_saturation < ideal_saturation,
+            # Scale 0 -> min_saturation to 0 -> 100
+            (mean_saturation / self.min_saturation) * 100,
+            # Scale max_saturation -> ideal_saturation to 0 -> 100
+            (1 - (mean_saturation - ideal_saturation) / (self.max_saturation - ideal_saturation)) * 100
+        ), 0, 100)
+
+        # Contrast using min_contrast as reference point (should give 50)
+        contrast_score = np.minimum(100, (contrast_ratio / self.min_contrast) * 50)
+
+        return {
+            'blur_score': blur_score,
+            'frequency_score': frequency_score,
+            'edge_density': edge_density,
+            'local_variance': local_variance,
+            'detail_score': detail_score,
+            'saturation_mean': saturation_mean,
+            'contrast_score': contrast_score
+        }
+
+    def _rejection_reasons(self, width: Any, height: Any, scores: Dict[str, np.ndarray]) -> List[List[str]]:
+        """Rejection reasons for one or many images, thresholds applied as whole-array masks"""
+        width, height = np.atleast_1d(width), np.atleast_1d(height)
+        scores = {name: np.atleast_1d(values) for name, values in scores.items()}
+
+        low_resolution = (width < self.min_width) | (height < self.min_height)
+        blurry = scores['blur_score'] < 50
+        low_detail = scores['detail_score'] < 50
+        poor_saturation = scores['saturation_mean'] < 50
+        low_contrast = scores['contrast_score'] < 50
+        rejected = low_resolution | blurry | low_detail | poor_saturation | low_contrast
+
+        # Plain Python values format much faster than NumPy scalars
+        width, height = width.tolist(), height.tolist()
+        scores = {name: values.tolist() for name, values in scores.items()}
+
+        reasons = [[] for _ in range(len(width))]
+        # Only rejected images need their reasons formatted
+        for i in np.flatnonzero(rejected).tolist():
+            image_reasons = reasons[i]
+            if low_resolution[i]:
+                image_reasons.append(f"Resolution too low: {width[i]}x{height[i]}")
+            if blurry[i]:
+                image_reasons.append(f"Image too blurry (score: {scores['blur_score'][i]:.2f})")
+            if low_detail[i]:
+                image_reasons.append(f"Insufficient detail: {scores['detail_score'][i]:.1f}/100")
+                if scores['edge_density'][i] < 40:
+                    image_reasons.append(f"Low edge detail: {scores['edge_density'][i]:.1f}/100")
+                if scores['frequency_score'][i] < 40:
+                    image_reasons.append(f"Low frequency detail: {scores['frequency_score'][i]:.1f}/100")
+            if poor_saturation[i]:
+                image_reasons.append(f"Poor saturation: {scores['saturation_mean'][i]:.1f}/100")
+            if low_contrast[i]:
+                image_reasons.append(f"Insufficient contrast: {scores['contrast_score'][i]:.1f}/100")
+        return reasons
+
+    def thresholds(self) -> Dict[str, float]:
+        """The scoring thresholds in use, stored alongside results for rescoring"""
+        return {name: getattr(self, name) for name in THRESHOLDS}
+
+    def rescore(self, records: List[Dict]) -> List[ImageQualityMetrics]:
+        """Apply the current thresholds to stored per-image results without touching pixels.
+
+        All images (and all faces in face ROI results) are scored together in one
+        vectorized pass. Note the frequency ratio was measured with the
+        detail_threshold of the original run; a new value only moves the
+        frequency score's sigmoid.
+        """
+        if any(not record.get('raw_features') for record in records):
+            raise ValueError("Results have no raw features, re-run the analysis to enable rescoring")
+
+        features = {
+            name: np.array([record['raw_features'][name] for record in records], dtype=float)
+            for name in RAW_FEATURES
+        }
+        width = np.array([record['width'] for record in records])
+        height = np.array([record['height'] for record in records])
+        scores = self.score_features(features)
+        reasons = self._rejection_reasons(width, height, scores)
+        columns = {name: values.tolist() for name, values in scores.items()}
+
+        # Face ROI results: rescore every face of every image in one batch as well
+        faces = [face for record in records for face in record.get('face_rois') or []]
+        face_rois = iter(self._face_roi_records({
+            name: np.array([face[name] for face in faces], dtype=float)
+            for name in RAW_FEATURES
+        }) if faces else [])
+
+        rescored = []
+        for i, record in enumerate(records):
+            metrics = ImageQualityMetrics(
+                filename=record['filename'],
+                width=record['width'],
+                height=record['height'],
+                face_coverage=record['face_coverage'],
+                blur_score=columns['blur_score'][i],
+                detail_score=columns['detail_score'][i],
+                edge_density=columns['edge_density'][i],
+                local_variance=columns['local_variance'][i],
+                saturation_mean=columns['saturation_mean'][i],
+                contrast_score=columns['contrast_score'][i],
+                is_acceptable=not reasons[i],
+                rejection_reasons=reasons[i],
+                face_rois=[next(face_rois) for _ in record['face_rois']] if record.get('face_rois') else [],
+                raw_features=record['raw_features'],
+                perceptual_hash=record.get('perceptual_hash', '')
+            )
+            rescored.append(metrics)
+
+        self.analyzed_images.extend(rescored)
+        return rescored
+
+    def _laplacian_variance(self, image: np.ndarray) -> float:
+        """Measure sharpness as Laplacian variance, focusing on high-detail regions."""
+        from skimage.filters.rank import entropy
+        from skimage.morphology import disk
+
         # First find regions of high detail using local entropy
         window_size = 9  # Size of the window for entropy calculation
         height, width = image.shape
@@ -156,49 +707,16 @@ class ImageQualityAnalyzer:
         # Calculate blur score only in high detail regions
         blur_score = np.var(conv_result[high_detail_mask[:-2, :-2]])  # Adjust for convolution size
         
-        # Normalize blur score: 0 is blurry, 100 is sharp
-        # Using blur_threshold as reference point (should give 50)
-        normalized_score = min(100, (blur_score / self.blur_threshold) * 50)
-        
         # For visualization (if needed)
-        self._last_entropy_map = entropy_map
         self._last_high_detail_mask = high_detail_mask
         
-        return normalized_score < 50, normalized_score
-
-    def _analyze_detail(self, image: Image.Image) -> Dict[str, float]:
-        """Analyze detail level in the image. All scores normalized to 0-100."""
-        gray_img = np.array(image.convert('L'), dtype=float)
-        
-        # Get raw scores
-        freq_score = self._analyze_frequency_distribution(gray_img)
-        edge_score = self._calculate_edge_density(gray_img)
-        var_score = self._calculate_local_variance(gray_img)
-        
-        # More nuanced normalization for each component
-        # Frequency score - use sigmoid for smoother transition
-        freq_norm = 100 / (1 + np.exp(-10 * (freq_score - self.detail_threshold)))
-        
-        # Edge density - normalize based on typical range (0-15)
-        # Use percentile-based normalization
-        edge_norm = np.clip(edge_score * 6.67, 0, 100)  # 15 * 6.67 = 100
-        
-        # Local variance - use log scale for better distribution
-        # Typical values range from 50-5000
-        var_norm = np.clip(20 * np.log10(1 + var_score), 0, 100)
-        
-        # Weight the components based on their reliability
-        detail_scores = {
-            'frequency_score': freq_norm,
-            'edge_density': edge_norm,
-            'local_variance': var_norm
-        }
-        
-        return detail_scores
+        return float(blur_score)
 
     def _analyze_frequency_distribution(self, img_array: np.ndarray) -> float:
         """Analyze frequency distribution using FFT"""
-        fft = scipy.fft.fft2(img_array)
+        import scipy.fft
+
+        fft = scipy.fft.fft2(img_array, workers=self.fft_workers)
         fft_shift = scipy.fft.fftshift(fft)
         magnitude_spectrum = np.abs(fft_shift)
         
@@ -226,14 +744,16 @@ class ImageQualityAnalyzer:
 
     def _calculate_local_variance(self, img_array: np.ndarray, window_size: int = 3) -> float:
         """Calculate average local variance in small windows"""
+        from scipy.ndimage import uniform_filter
+
         local_mean = uniform_filter(img_array, size=window_size)
         local_sqr_mean = uniform_filter(img_array**2, size=window_size)
         local_var = local_sqr_mean - local_mean**2
         
         return float(np.mean(local_var))
 
-    def _analyze_saturation(self, image: np.ndarray) -> float:
-        """Analyze image saturation. Returns normalized 0-100 score."""
+    def _mean_saturation(self, image: np.ndarray) -> float:
+        """Mean saturation of an RGB image, 0-1."""
         r, g, b = image[:,:,0], image[:,:,1], image[:,:,2]
         max_rgb = np.maximum(np.maximum(r, g), b)
         min_rgb = np.minimum(np.minimum(r, g), b)
@@ -241,62 +761,31 @@ class ImageQualityAnalyzer:
         saturation = np.zeros_like(max_rgb, dtype=np.float32)
         non_zero = max_rgb != 0
         saturation[non_zero] = diff[non_zero] / max_rgb[non_zero]
-        mean_saturation = float(np.mean(saturation))
-        
-        # Convert to 0-100 score
-        # Score peaks at ideal saturation (halfway between min and max thresholds)
-        ideal_saturation = (self.min_saturation + self.max_saturation) / 2
-        if mean_saturation < ideal_saturation:
-            # Scale 0 -> min_saturation to 0 -> 100
-            normalized_score = (mean_saturation / self.min_saturation) * 100
-        else:
-            # Scale max_saturation -> ideal_saturation to 0 -> 100
-            normalized_score = (1 - (mean_saturation - ideal_saturation) / 
-                              (self.max_saturation - ideal_saturation)) * 100
-            
-        return max(0, min(100, normalized_score))
+        return float(np.mean(saturation))
 
-    def _analyze_contrast(self, gray_image: np.ndarray) -> float:
-        """Analyze image contrast. Returns normalized 0-100 score."""
+    def _contrast_ratio(self, gray_image: np.ndarray) -> float:
+        """Grayscale contrast as std / mean, 0 for an all black image."""
         if np.mean(gray_image) == 0:
-            return 0
+            return 0.0
             
-        contrast = float(np.std(gray_image) / np.mean(gray_image))
-        
-        # Normalize to 0-100 scale
-        # Using min_contrast as reference point (should give 50)
-        normalized_score = min(100, (contrast / self.min_contrast) * 50)
-        return normalized_score
+        return float(np.std(gray_image) / np.mean(gray_image))
 
     def _convolve2d(self, img: np.ndarray, kernel: np.ndarray) -> np.ndarray:
         """Helper function for 2D convolution"""
+        from scipy.signal import convolve2d
+
         return np.abs(
             convolve2d(img, kernel, mode='valid')
         )
 
     def get_dataset_summary(self) -> Dict:
         """Analyze the entire dataset for trends and issues"""
-        if not self.analyzed_images:
-            return {"error": "No images analyzed"}
-
-        return {
-            "total_images": len(self.analyzed_images),
-            "accepted_images": sum(1 for m in self.analyzed_images if m.is_acceptable),
-            "rejection_reasons": dict(Counter(
-                reason
-                for metrics in self.analyzed_images
-                for reason in metrics.rejection_reasons
-            )),
-            "average_metrics": {
-                "blur_score": np.mean([m.blur_score for m in self.analyzed_images]),
-                "detail_score": np.mean([m.detail_score for m in self.analyzed_images]),
-                "saturation": np.mean([m.saturation_mean for m in self.analyzed_images]),
-                "contrast": np.mean([m.contrast_score for m in self.analyzed_images])
-            }
-        }
+        return summarize_metrics(self.analyzed_images, self.duplicate_distance)
 
     def visualize_analysis(self, img: np.ndarray, metrics: ImageQualityMetrics) -> np.ndarray:
         """Draw quality analysis results on the image."""
+        import cv2
+
         # Make a copy to avoid modifying the original
         viz_img = img.copy()
         
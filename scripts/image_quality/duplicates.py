@@ -0,0 +1,102 @@
+"""
+duplicates.py - Perceptual hashing and near-duplicate clustering
+"""
+
+import numpy as np
+from PIL import Image
+from typing import Dict, List, Union
+
+def dhash(gray: Union[Image.Image, np.ndarray], hash_size: int = 8) -> int:
+    """Difference hash of a grayscale image as a hash_size**2 bit integer.
+
+    Each bit records whether a pixel is brighter than its right neighbour in a
+    (hash_size + 1) x hash_size thumbnail, which survives re-encoding, resizing
+    and small exposure changes.
+    """
+    if isinstance(gray, np.ndarray):
+        gray = Image.fromarray(np.clip(gray, 0, 255).astype(np.uint8))
+    thumbnail = np.asarray(gray.resize((hash_size + 1, hash_size), Image.BOX), dtype=np.int16)
+    bits = (thumbnail[:, 1:] > thumbnail[:, :-1]).flatten()
+    return int(np.packbits(bits).tobytes().hex(), 16)
+
+_POPCOUNT8 = np.array([bin(n).count('1') for n in range(256)], dtype=np.uint8)
+
+def _popcount64(values: np.ndarray) -> np.ndarray:
+    """Number of set bits in each uint64"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return _POPCOUNT8[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+def _flip_patterns(bits: int, radius: int) -> List[int]:
+    """Every bit pattern with at most radius bits set, within a bits wide chunk"""
+    patterns = {0}
+    for _ in range(radius):
+        patterns |= {pattern | (1 << bit) for pattern in patterns for bit in range(bits)}
+    return sorted(patterns)
+
+def near_duplicate_pairs(hashes: np.ndarray, max_distance: int, chunks: int = 4) -> np.ndarray:
+    """Index pairs (i < j) of 64-bit hashes that differ in at most max_distance bits.
+
+    Multi-index hashing: each hash is split into chunks. If two hashes are
+    within max_distance, by pigeonhole at least one chunk differs in at most
+    max_distance // chunks bits, so for every chunk position the hashes are
+    sorted by chunk value and matched against the chunk values within that small
+    radius with binary searches. Only those candidates get a full Hamming
+    check, which keeps the work close to linear instead of all n^2 pairs, and
+    every step is a whole-array NumPy operation.
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    chunk_bits = 64 // chunks
+    mask = np.uint64((1 << chunk_bits) - 1)
+    flips = np.array(_flip_patterns(chunk_bits, max_distance // chunks), dtype=np.uint64)
+    items = np.arange(len(hashes))
+
+    found = [np.empty((0, 2), dtype=np.int64)]
+    for n in range(chunks):
+        chunk = (hashes >> np.uint64(n * chunk_bits)) & mask
+        order = np.argsort(chunk, kind='stable')
+        sorted_chunk = chunk[order]
+        for flip in flips:
+            keys = chunk ^ flip
+            start = np.searchsorted(sorted_chunk, keys, side='left')
+            counts = np.searchsorted(sorted_chunk, keys, side='right') - start
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            # Expand every query's matching run of the sorted chunks into pairs
+            queries = np.repeat(items, counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            others = order[np.repeat(start, counts) + offsets]
+            forward = queries < others
+            queries, others = queries[forward], others[forward]
+            close = _popcount64(hashes[queries] ^ hashes[others]) <= max_distance
+            found.append(np.stack([queries[close], others[close]], axis=1))
+
+    return np.unique(np.concatenate(found), axis=0)
+
+def find_duplicate_groups(hashes: List[int], max_distance: int = 6) -> List[List[int]]:
+    """Cluster indices of hashes that are within max_distance of each other.
+
+    Clusters are the connected components of the near-duplicate graph, so a
+    burst of gradually changing shots ends up in one group. Groups of two or
+    more are returned, each sorted, ordered by their first index.
+    """
+    # Exact copies collapse to one hash first, so they can't blow up the pair count
+    unique, inverse = np.unique(np.array(hashes, dtype=np.uint64), return_inverse=True)
+    parent = list(range(len(unique)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for a, b in near_duplicate_pairs(unique, max_distance).tolist():
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    groups: Dict[int, List[int]] = {}
+    for item, hash_index in enumerate(inverse.reshape(-1).tolist()):
+        groups.setdefault(find(hash_index), []).append(item)
+    return sorted((group for group in groups.values() if len(group) > 1), key=lambda group: group[0])
@@ -0,0 +1,186 @@
+"""
+estimate.py - Dataset summary estimated from a stratified random sample
+"""
+
+import re
+import math
+import random
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Any, Dict, List, Sequence, Tuple, TYPE_CHECKING
+import logging
+import numpy as np
+from .analyzer import ImageQualityMetrics, SUMMARY_SCORES
+
+if TYPE_CHECKING:
+    from pipeline.sources import Header
+
+# Smallest sample taken from a stratum, so its variance can be estimated
+MIN_PER_STRATUM = 2
+
+@dataclass
+class Stratum:
+    """Images of similar resolution and file size, in random order"""
+    label: str
+    names: List[str]
+    # The sample is the first `sampled` names
+    sampled: int = 0
+
+def scan_headers(source: Any, names: Sequence[str], workers: int = 8) -> Dict[str, 'Header']:
+    """Dimensions and file sizes of every image, reading only the file headers"""
+    def header(name: str) -> 'Header':
+        try:
+            return source.header(name)
+        except OSError as e:
+            logging.error(f"Error reading header of {name}: {str(e)}")
+            return None, 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(names, executor.map(header, names)))
+
+def _quantile_bins(values: np.ndarray, bins: int) -> np.ndarray:
+    """Bin index of every value, with bin edges at the quantiles"""
+    edges = np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1])) if len(values) else []
+    return np.searchsorted(edges, values, side='right')
+
+def build_strata(headers: Dict[str, 'Header'], bins: int = 3, seed: int = 0) -> List[Stratum]:
+    """Split images into resolution x file size strata, bins quantile bins each.
+
+    Images whose header couldn't be read get their own resolution bin.
+    """
+    names = sorted(headers)
+    pixels = np.array([size[0] * size[1] if size else -1 for size, _ in (headers[n] for n in names)], dtype=np.int64)
+    sizes = np.array([headers[n][1] for n in names], dtype=np.int64)
+    known = pixels >= 0
+    resolution_bin = np.full(len(names), -1)
+    resolution_bin[known] = _quantile_bins(pixels[known], bins)
+    size_bin = _quantile_bins(sizes, bins)
+
+    groups: Dict[Tuple[int, int], List[int]] = {}
+    for index, key in enumerate(zip(resolution_bin.tolist(), size_bin.tolist())):
+        groups.setdefault(key, []).append(index)
+
+    rng = random.Random(seed)
+    strata = []
+    for (resolution, _), members in sorted(groups.items()):
+        if resolution < 0:
+            resolution_label = "unknown resolution"
+        else:
+            megapixels = pixels[members] / 1e6
+            resolution_label = f"{megapixels.min():.1f}-{megapixels.max():.1f} MP"
+        kilobytes = sizes[members] / 1024
+        stratum_names = [names[i] for i in members]
+        rng.shuffle(stratum_names)
+        strata.append(Stratum(f"{resolution_label}, {kilobytes.min():.0f}-{kilobytes.max():.0f} KB", stratum_names))
+    return strata
+
+def grow_sample(strata: List[Stratum], size: int) -> List[str]:
+    """Extend the sample to about size images, allocated proportionally to stratum size.
+
+    Every stratum gets at least MIN_PER_STRATUM images where it has them.
+    Returns the names added to the sample.
+    """
+    total = sum(len(stratum.names) for stratum in strata)
+    size = min(size, total)
+    targets = [
+        max(stratum.sampled, min(len(stratum.names), max(MIN_PER_STRATUM, round(size * len(stratum.names) / total))))
+        for stratum in strata
+    ]
+    added = []
+    for stratum, target in zip(strata, targets):
+        added.extend(stratum.names[stratum.sampled:target])
+        stratum.sampled = target
+    return added
+
+def reason_category(reason: str) -> str:
+    """A rejection reason without its measured value, e.g. 'Image too blurry'"""
+    return re.split(r'[:(]', reason, 1)[0].strip()
+
+def _interval(estimate: float, half_width: float) -> Dict[str, float]:
+    return {'estimate': estimate, 'low': estimate - half_width, 'high': estimate + half_width}
+
+def _stratified(values: List[np.ndarray], weights: np.ndarray, populations: np.ndarray) -> Tuple[float, float]:
+    """Stratified mean and its variance, with the finite population correction"""
+    mean = 0.0
+    variance = 0.0
+    for value, weight, population in zip(values, weights, populations):
+        n = len(value)
+        mean += weight * float(value.mean())
+        if n > 1:
+            variance += weight ** 2 * (1 - n / population) * float(value.var(ddof=1)) / n
+    return mean, variance
+
+def _proportion_interval(values: List[np.ndarray], weights: np.ndarray, populations: np.ndarray, z: float) -> Dict[str, float]:
+    """Wilson score interval for a stratified proportion.
+
+    The effective sample size accounts for stratification and the finite
+    population, and Wilson's interval stays sensible for rates near 0 or 1,
+    where a plain normal interval collapses to zero width.
+    """
+    p, variance = _stratified(values, weights, populations)
+    sampled = sum(len(value) for value in values)
+    if sampled == populations.sum():
+        # Every image was analyzed, so the rate is exact
+        return _interval(p, 0.0)
+    n = p * (1 - p) / variance if variance > 0 else sampled
+    denominator = 1 + z ** 2 / n
+    center = (p + z ** 2 / (2 * n)) / denominator
+    half_width = z / denominator * math.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2))
+    return {'estimate': p, 'low': max(0.0, center - half_width), 'high': min(1.0, center + half_width)}
+
+def estimate_summary(strata: List[Stratum], results: Dict[str, ImageQualityMetrics], confidence: float = 0.95) -> Dict:
+    """Acceptance rate, rejection reason rates and mean scores with confidence intervals.
+
+    results maps sampled names to their metrics; sampled images that failed
+    to analyze are missing from it and left out of the estimate. Strata
+    without any result are left out and the others reweighted. Rejection
+    reasons that never occurred in the sample are not listed; their rate
+    is below unseen_reason_rate_bound at the same confidence.
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    sampled = [[results[name] for name in s.names[:s.sampled] if name in results] for s in strata]
+    used = [i for i, metrics in enumerate(sampled) if metrics]
+    if not used:
+        return {"error": "No images analyzed"}
+
+    populations = np.array([len(strata[i].names) for i in used], dtype=np.float64)
+    weights = populations / populations.sum()
+    groups = [sampled[i] for i in used]
+
+    def proportion(test) -> Dict[str, float]:
+        values = [np.array([test(m) for m in metrics], dtype=np.float64) for metrics in groups]
+        return _proportion_interval(values, weights, populations, z)
+
+    categories = sorted({reason_category(r) for metrics in groups for m in metrics for r in m.rejection_reasons})
+    average_metrics = {}
+    for name, attribute in SUMMARY_SCORES.items():
+        values = [np.array([getattr(m, attribute) for m in metrics], dtype=np.float64) for metrics in groups]
+        mean, variance = _stratified(values, weights, populations)
+        average_metrics[name] = _interval(mean, z * math.sqrt(variance))
+
+    return {
+        "total_images": sum(len(s.names) for s in strata),
+        "sampled_images": sum(s.sampled for s in strata),
+        "analyzed_images": sum(len(metrics) for metrics in groups),
+        "confidence": confidence,
+        "acceptance_rate": proportion(lambda m: m.is_acceptable),
+        "rejection_rates": {
+            category: proportion(lambda m, category=category: any(
+                reason_category(r) == category for r in m.rejection_reasons
+            ))
+            for category in categories
+        },
+        "average_metrics": average_metrics,
+        # Reasons that never occurred in the sample: -ln(1 - c) / n, the "rule of three" at 95%
+        "unseen_reason_rate_bound": -math.log(1 - confidence) / sum(len(metrics) for metrics in groups),
+        "strata": [
+            {"stratum": s.label, "images": len(s.names), "sampled": s.sampled}
+            for s in strata
+        ]
+    }
+
+def widest_rate_interval(estimate: Dict) -> float:
+    """Largest half-width among the acceptance and rejection reason rates"""
+    rates = [estimate['acceptance_rate'], *estimate['rejection_rates'].values()]
+    return max((rate['high'] - rate['low']) / 2 for rate in rates)
@@ -0,0 +1,220 @@
+"""
+precision.py - Low-memory float32 feature extraction with reusable scratch buffers
+"""
+
+import threading
+from typing import Dict, Tuple
+import numpy as np
+from PIL import Image
+
+PRECISIONS = ('float64', 'float32')
+
+# Peak bytes allocated per image pixel by ImageQualityAnalyzer.extract_features,
+# measured with tracemalloc (see benchmarks/precision_drift.py). The float32
+# figure includes the scratch buffers, which stay allocated between calls.
+PEAK_BYTES_PER_PIXEL = {
+    'float64': 76,
+    'float32': 34
+}
+
+# Rows of the spectrum handled at once when masking out low frequencies
+_SPECTRUM_BLOCK_ROWS = 256
+
+class ScratchBuffers:
+    """Named work arrays per thread, grown when needed and reused across calls.
+
+    Each thread gets its own set, so concurrent analyses never share memory,
+    and a thread's buffers are freed when the thread exits.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _buffers(self) -> Dict[str, np.ndarray]:
+        if not hasattr(self._local, 'buffers'):
+            self._local.buffers = {}
+        return self._local.buffers
+
+    def get(self, name: str, shape: Tuple[int, ...], dtype: type) -> np.ndarray:
+        """An uninitialized array of this shape and dtype backed by the named buffer"""
+        dtype = np.dtype(dtype)
+        needed = int(np.prod(shape)) * dtype.itemsize
+        buffers = self._buffers()
+        buffer = buffers.get(name)
+        if buffer is None or buffer.nbytes < needed:
+            buffer = buffers[name] = np.empty(needed, dtype=np.uint8)
+        return buffer[:needed].view(dtype).reshape(shape)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the calling thread's buffers"""
+        return sum(buffer.nbytes for buffer in self._buffers().values())
+
+    def clear(self) -> None:
+        self._buffers().clear()
+
+def extract_features_float32(
+    np_image: np.ndarray,
+    gray_plane: Image.Image,
+    detail_threshold: float,
+    scratch: ScratchBuffers,
+    fft_workers: int = 1
+) -> Tuple[Dict[str, float], np.ndarray]:
+    """The analyzer's raw features, computed in float32 with in-place operations.
+
+    Mirrors the float64 methods of ImageQualityAnalyzer step by step, but every
+    full-size intermediate lives in a scratch buffer, the spectrum is a
+    one-sided complex64 rfft, and reductions accumulate in float64. Returns
+    the features and the high-detail mask used for the blur measurement.
+    """
+    gray = scratch.get('gray', (gray_plane.size[1], gray_plane.size[0]), np.float32)
+    gray[...] = np.asarray(gray_plane)
+
+    laplacian_variance, high_detail_mask = _laplacian_variance(gray, scratch)
+    features = {
+        'laplacian_variance': laplacian_variance,
+        'high_freq_ratio': _high_freq_ratio(gray, detail_threshold, scratch, fft_workers),
+        'mean_gradient': _mean_gradient(gray, scratch),
+        'mean_local_variance': _mean_local_variance(gray, scratch),
+        'mean_saturation': _mean_saturation(np_image, scratch),
+        'contrast_ratio': _contrast_ratio(gray, scratch)
+    }
+    return features, high_detail_mask
+
+def _laplacian_variance(gray: np.ndarray, scratch: ScratchBuffers) -> Tuple[float, np.ndarray]:
+    from skimage.filters.rank import entropy
+    from skimage.morphology import disk
+
+    shape = gray.shape
+    scaled = scratch.get('a', shape, np.float32)
+    np.divide(gray, gray.max(), out=scaled)
+    scaled *= 255
+    img_uint8 = scratch.get('uint8', shape, np.uint8)
+    np.copyto(img_uint8, scaled, casting='unsafe')
+
+    entropy_map = scratch.get('entropy', shape, np.float32)
+    entropy(img_uint8, disk(9), out=entropy_map)
+
+    # 90th percentile with numpy's linear interpolation, partitioning a copy in place
+    values = scaled.reshape(-1)
+    np.copyto(values, entropy_map.reshape(-1))
+    position = 0.9 * (values.size - 1)
+    low, high = int(np.floor(position)), int(np.ceil(position))
+    values.partition([low, high])
+    threshold = values[low] + (position - low) * (float(values[high]) - float(values[low]))
+
+    high_detail_mask = np.greater(entropy_map, threshold)
+    if not np.any(high_detail_mask):
+        high_detail_mask[...] = True
+
+    # Laplacian over the 'valid' region
+    laplacian = scratch.get('a', (shape[0] - 2, shape[1] - 2), np.float32)
+    center = scratch.get('b', laplacian.shape, np.float32)
+    np.add(gray[:-2, 1:-1], gray[2:, 1:-1], out=laplacian)
+    laplacian += gray[1:-1, :-2]
+    laplacian += gray[1:-1, 2:]
+    np.multiply(gray[1:-1, 1:-1], 4, out=center)
+    laplacian -= center
+    np.abs(laplacian, out=laplacian)
+
+    selected = laplacian[high_detail_mask[:-2, :-2]]
+    return float(np.var(selected, dtype=np.float64)), high_detail_mask
+
+def _high_freq_ratio(gray: np.ndarray, detail_threshold: float, scratch: ScratchBuffers, workers: int = 1) -> float:
+    import scipy.fft
+
+    rows, cols = gray.shape
+    spectrum = scipy.fft.rfft2(gray, workers=workers)
+    magnitude = scratch.get('b', spectrum.shape, np.float32)
+    np.abs(spectrum, out=magnitude)
+    del spectrum
+
+    # A real image's spectrum is symmetric, so every column but the first (and
+    # the Nyquist column for even widths) stands for itself and its mirror
+    weights = np.full(magnitude.shape[1], 2, dtype=np.float32)
+    weights[0] = 1
+    if cols % 2 == 0:
+        weights[-1] = 1
+    magnitude *= weights
+
+    # Distances from the centre of the fftshift-ed spectrum, as in the float64 path
+    y = (np.arange(rows) + rows // 2) % rows - rows // 2
+    x = (np.arange(magnitude.shape[1]) + cols // 2) % cols - cols // 2
+    radius_limit = rows * detail_threshold
+
+    total_energy = float(magnitude.sum(dtype=np.float64))
+    high_freq_energy = 0.0
+    for start in range(0, rows, _SPECTRUM_BLOCK_ROWS):
+        block = slice(start, start + _SPECTRUM_BLOCK_ROWS)
+        high_freq = np.sqrt(y[block, None]**2 + x[None, :]**2) > radius_limit
+        high_freq_energy += float(np.sum(magnitude[block], where=high_freq, dtype=np.float64))
+
+    return high_freq_energy / total_energy if total_energy > 0 else 0.0
+
+def _mean_gradient(gray: np.ndarray, scratch: ScratchBuffers) -> float:
+    shape = (gray.shape[0] - 2, gray.shape[1] - 2)
+    grad_x = scratch.get('a', shape, np.float32)
+    grad_y = scratch.get('b', shape, np.float32)
+    term = scratch.get('c', shape, np.float32)
+
+    # Sobel over the 'valid' region
+    np.subtract(gray[:-2, 2:], gray[:-2, :-2], out=grad_x)
+    np.subtract(gray[1:-1, 2:], gray[1:-1, :-2], out=term)
+    term *= 2
+    grad_x += term
+    np.subtract(gray[2:, 2:], gray[2:, :-2], out=term)
+    grad_x += term
+
+    np.subtract(gray[2:, :-2], gray[:-2, :-2], out=grad_y)
+    np.subtract(gray[2:, 1:-1], gray[:-2, 1:-1], out=term)
+    term *= 2
+    grad_y += term
+    np.subtract(gray[2:, 2:], gray[:-2, 2:], out=term)
+    grad_y += term
+
+    grad_x *= grad_x
+    grad_y *= grad_y
+    grad_x += grad_y
+    np.sqrt(grad_x, out=grad_x)
+    return float(grad_x.mean(dtype=np.float64))
+
+def _mean_local_variance(gray: np.ndarray, scratch: ScratchBuffers, window_size: int = 3) -> float:
+    from scipy.ndimage import uniform_filter
+
+    local_mean = scratch.get('a', gray.shape, np.float32)
+    squared = scratch.get('b', gray.shape, np.float32)
+    local_sqr_mean = scratch.get('c', gray.shape, np.float32)
+    uniform_filter(gray, size=window_size, output=local_mean)
+    np.multiply(gray, gray, out=squared)
+    uniform_filter(squared, size=window_size, output=local_sqr_mean)
+
+    local_mean *= local_mean
+    local_sqr_mean -= local_mean
+    return float(local_sqr_mean.mean(dtype=np.float64))
+
+def _mean_saturation(np_image: np.ndarray, scratch: ScratchBuffers) -> float:
+    shape = np_image.shape[:2]
+    r, g, b = np_image[:, :, 0], np_image[:, :, 1], np_image[:, :, 2]
+    max_rgb = scratch.get('max_rgb', shape, np.uint8)
+    diff = scratch.get('min_rgb', shape, np.uint8)
+    np.maximum(r, g, out=max_rgb)
+    np.maximum(max_rgb, b, out=max_rgb)
+    np.minimum(r, g, out=diff)
+    np.minimum(diff, b, out=diff)
+    np.subtract(max_rgb, diff, out=diff)
+
+    # Black pixels have no difference either, so dividing them by 1 gives 0
+    np.maximum(max_rgb, 1, out=max_rgb)
+    saturation = scratch.get('a', shape, np.float32)
+    np.divide(diff, max_rgb, out=saturation, dtype=np.float32)
+    return float(np.mean(saturation))
+
+def _contrast_ratio(gray: np.ndarray, scratch: ScratchBuffers) -> float:
+    mean = float(gray.mean(dtype=np.float64))
+    if mean == 0:
+        return 0.0
+
+    deviation = scratch.get('a', gray.shape, np.float32)
+    np.subtract(gray, np.float32(mean), out=deviation)
+    deviation *= deviation
+    return float(np.sqrt(deviation.mean(dtype=np.float64)) / mean)
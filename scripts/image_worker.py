@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+image_worker.py - Long-running worker serving analysis and cropping jobs
+
+Starting analyze_images.py or crop_faces.py for every small job pays for the
+interpreter, the cv2/scipy/skimage imports and the Haar cascade XML parsing
+before the first pixel is touched. The worker pays that once, keeps warm
+ImageQualityAnalyzer and FaceCropper instances, and runs jobs as they arrive.
+
+A job is a JSON object with the command line the job would otherwise run:
+
+    {"id": "job-1", "command": "analyze", "args": ["in/", "out/", "--face-roi"]}
+    {"id": "job-2", "command": "crop", "args": ["in/", "faces/", "--padding", "40"]}
+
+Jobs arrive either over a Unix socket, one JSON object per line, with one
+JSON line sent back per job as it finishes, or as *.json files dropped into
+SPOOL/incoming (write elsewhere and rename in). A spool job moves to
+SPOOL/running while it runs and its result is written to SPOOL/done.
+"""
+
+import io
+import os
+import json
+import time
+import signal
+import argparse
+import socketserver
+import threading
+from contextlib import redirect_stderr
+from pathlib import Path
+from typing import Dict, Optional
+import logging
+import numpy as np
+import analyze_images
+import crop_faces
+from image_quality.analyzer import ImageQualityAnalyzer
+from face_detection.detector import FaceCropper
+
+class Worker:
+    """Warm analyzer and cropper instances, running one job at a time"""
+
+    def __init__(self, threads: int = 4, pixel_cache: Optional[str] = None, pixel_cache_mb: int = 10240):
+        self.threads = threads
+        # Default --pixel-cache for jobs that don't give their own; each job opens it anew
+        self.pixel_cache = pixel_cache
+        self.pixel_cache_mb = pixel_cache_mb
+        self.analyzer = ImageQualityAnalyzer()
+        self.cropper = FaceCropper()
+        self.jobs_run = 0
+        self._lock = threading.Lock()
+
+    def warm_up(self) -> float:
+        """Load cascades for every detection thread and run one small analysis"""
+        start = time.perf_counter()
+        self.cropper.warm_up(self.threads)
+        rng = np.random.default_rng(0)
+        self.analyzer.analyze_image(rng.integers(0, 256, (64, 64, 3), dtype=np.uint8), 'warm-up')
+        self.analyzer.reset()
+        return time.perf_counter() - start
+
+    def run_job(self, job: Dict) -> Dict:
+        """Run one job and return its result message"""
+        job_id = job.get('id') if isinstance(job, dict) else None
+        start = time.perf_counter()
+        try:
+            if not isinstance(job, dict):
+                raise ValueError("A job must be a JSON object")
+            command = job.get('command')
+            argv = job.get('args', [])
+            if command not in ('analyze', 'crop'):
+                raise ValueError(f"Unknown command {command!r}, expected 'analyze' or 'crop'")
+            if not isinstance(argv, list) or not all(isinstance(arg, str) for arg in argv):
+                raise ValueError("args must be a list of strings")
+
+            with self._lock:
+                tool = analyze_images if command == 'analyze' else crop_faces
+                args = self._parse(tool, argv)
+                if args.watch:
+                    raise ValueError("--watch jobs would never finish; run the tool directly instead")
+                if args.pixel_cache is None and self.pixel_cache is not None:
+                    args.pixel_cache, args.pixel_cache_mb = self.pixel_cache, self.pixel_cache_mb
+                if command == 'analyze':
+                    result = analyze_images.run(args, analyzer=self.analyzer, cropper=self.cropper)
+                else:
+                    result = crop_faces.run(args, cropper=self.cropper)
+                self.jobs_run += 1
+        except Exception as e:
+            logging.error(f"Job {job_id} failed: {str(e)}")
+            return {'id': job_id, 'status': 'error', 'error': str(e), 'elapsed': time.perf_counter() - start}
+        return {'id': job_id, 'status': 'done', 'result': result, 'elapsed': time.perf_counter() - start}
+
+    @staticmethod
+    def _parse(tool, argv: list) -> argparse.Namespace:
+        """Parse and validate job arguments as the tool's main() would, turning argparse's exit into an exception"""
+        parser = tool.build_parser()
+        errors = io.StringIO()
+        try:
+            with redirect_stderr(errors):
+                args = parser.parse_args(argv)
+                tool.validate_args(parser, args)
+                return args
+        except SystemExit:
+            message = errors.getvalue().strip().splitlines()
+            # Drop the "prog: error: " prefix, prog being the worker's own name
+            raise ValueError(message[-1].split('error: ', 1)[-1] if message else "Invalid arguments")
+
+def serve_socket(worker: Worker, socket_path: Path) -> None:
+    """Accept JSON lines on a Unix socket and answer each job with a JSON line"""
+
+    class JobHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    job = json.loads(line)
+                except ValueError as e:
+                    response = {'id': None, 'status': 'error', 'error': f"Invalid JSON: {str(e)}"}
+                else:
+                    response = worker.run_job(job)
+                self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+                self.wfile.flush()
+
+    if socket_path.exists():
+        socket_path.unlink()
+    with socketserver.ThreadingUnixStreamServer(str(socket_path), JobHandler) as server:
+        server.daemon_threads = True
+        _stop_on_signal(server.shutdown)
+        print(f"Listening on {socket_path}")
+        try:
+            server.serve_forever()
+        finally:
+            socket_path.unlink(missing_ok=True)
+
+def serve_spool(worker: Worker, spool_dir: Path, poll_interval: float = 0.5) -> None:
+    """Run *.json jobs from SPOOL/incoming in name order, writing results to SPOOL/done"""
+    incoming, running, done = (spool_dir / name for name in ('incoming', 'running', 'done'))
+    for directory in (incoming, running, done):
+        directory.mkdir(parents=True, exist_ok=True)
+
+    stop = threading.Event()
+    _stop_on_signal(stop.set)
+    print(f"Watching {incoming}")
+    while not stop.is_set():
+        pending = sorted(path for path in incoming.iterdir() if path.suffix == '.json')
+        if not pending:
+            stop.wait(poll_interval)
+            continue
+        for path in pending:
+            if stop.is_set():
+                break
+            claimed = running / path.name
+            try:
+                # Renaming claims the job, so several workers can share a spool
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            try:
+                with open(claimed) as f:
+                    job = json.load(f)
+            except ValueError as e:
+                response = {'id': None, 'status': 'error', 'error': f"Invalid JSON: {str(e)}"}
+            else:
+                response = worker.run_job(job)
+            tmp_path = done / f"{path.name}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(response, f, indent=2)
+            os.replace(tmp_path, done / path.name)
+            claimed.unlink()
+
+def _stop_on_signal(stop) -> None:
+    """Call stop() on SIGTERM/SIGINT, from a thread since server.shutdown() blocks"""
+    def handler(signum, frame):
+        threading.Thread(target=stop, daemon=True).start()
+    signal.signal(signal.SIGTERM, handler)
+    signal.signal(signal.SIGINT, handler)
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve image analysis and face cropping jobs from a warm process')
+    transport = parser.add_mutually_exclusive_group(required=True)
+    transport.add_argument('--socket', help='Unix socket path to accept JSON-line jobs on')
+    transport.add_argument('--spool', help='Spool directory to pick up job files from')
+    parser.add_argument('--threads', '-t', type=int, default=4,
+                      help='Detection threads to load cascades for up front (default: 4)')
+    parser.add_argument('--poll-interval', type=float, default=0.5,
+                      help='Seconds between spool directory scans when idle (default: 0.5)')
+    parser.add_argument('--pixel-cache',
+                      help='Directory for a memory-mapped cache of decoded pixels, for jobs without their own --pixel-cache')
+    parser.add_argument('--pixel-cache-mb', type=int, default=10240,
+                      help='Maximum pixel cache size in MB (default: 10240)')
+    args = parser.parse_args()
+
+    worker = Worker(args.threads, args.pixel_cache, args.pixel_cache_mb)
+    print(f"Worker warmed up in {worker.warm_up():.2f}s")
+
+    if args.socket:
+        serve_socket(worker, Path(args.socket))
+    else:
+        serve_spool(worker, Path(args.spool), args.poll_interval)
+    print(f"Stopped after {worker.jobs_run} jobs")
+
+if __name__ == '__main__':
+    main()
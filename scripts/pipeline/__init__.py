@@ -0,0 +1,3 @@
+from .stages import FrameJob, Stage, StagedPipeline, WorkItem
+
+__all__ = ['FrameJob', 'Stage', 'StagedPipeline', 'WorkItem']
\ No newline at end of file
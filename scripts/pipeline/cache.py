@@ -0,0 +1,117 @@
+"""
+cache.py - Memory-mapped cache of decoded pixels, keyed by file content
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional
+import numpy as np
+
+class PixelCache:
+    """Stores decoded uint8 images as one .npy file each and serves them memory-mapped.
+
+    Entries are keyed by a hash of the encoded file bytes plus a variant name
+    (e.g. 'rgb' or 'bgr', since decoders differ), so renamed or copied files
+    still hit and edited files miss. Hits are read-only views straight from the
+    page cache, with no decode and no copy. The cache is capped at max_bytes
+    and evicts the least recently used entries; file mtimes record use, so the
+    LRU order survives between runs.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int = 10 << 30):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        # key -> size in bytes, least recently used first
+        self._entries: 'OrderedDict[str, int]' = OrderedDict()
+        existing = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith('.npy')]
+        for entry in sorted(existing, key=lambda e: e.stat().st_mtime_ns):
+            self._entries[entry.name[:-4]] = entry.stat().st_size
+        self._total = sum(self._entries.values())
+        # A cache written with a larger cap, or only ever hit, still gets trimmed
+        with self._lock:
+            self._evict()
+
+    @staticmethod
+    def key(data: bytes, variant: str) -> str:
+        return f"{hashlib.blake2b(data, digest_size=20).hexdigest()}-{variant}"
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npy"
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Memory-mapped read-only view of a cached image, or None"""
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        path = self._path(key)
+        try:
+            array = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            # Evicted or half written by another process
+            with self._lock:
+                self._total -= self._entries.pop(key, 0)
+            return None
+        try:
+            # Record the use, so the next run evicts in LRU order too
+            os.utime(path)
+        except OSError:
+            pass
+        return array
+
+    def put(self, key: str, array: np.ndarray) -> np.ndarray:
+        """Store an image and return a memory-mapped view of the stored copy"""
+        path = self._path(key)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(array, dtype=np.uint8))
+        # Atomic, so concurrent readers never see a partial file
+        os.replace(tmp_path, path)
+        size = path.stat().st_size
+
+        with self._lock:
+            self._total += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._evict()
+        return np.load(path, mmap_mode='r')
+
+    def get_or_decode(self, data: bytes, variant: str, decode: Callable[[bytes], Optional[np.ndarray]]) -> Optional[np.ndarray]:
+        """Return cached pixels for these file bytes, decoding and storing them on a miss."""
+        key = self.key(data, variant)
+        array = self.get(key)
+        # Counters are shared by the decode threads
+        if array is not None:
+            with self._lock:
+                self.hits += 1
+            return array
+
+        with self._lock:
+            self.misses += 1
+        array = decode(data)
+        if array is None:
+            return None
+        try:
+            return self.put(key, array)
+        except OSError as e:
+            logging.warning(f"Could not write pixel cache entry {key}: {str(e)}")
+            return array
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                # Views that are still open keep the data alive until they close
+                os.remove(self._path(key))
+            except OSError:
+                pass
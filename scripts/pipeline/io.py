@@ -0,0 +1,65 @@
+"""
+io.py - Read, encode and write stages shared by the command line tools
+"""
+
+from pathlib import Path, PurePath, PurePosixPath
+from typing import Callable, Optional, Union
+import numpy as np
+from .stages import WorkItem
+from .sinks import DirectorySink, TarShardSink
+
+def output_name(name: Union[str, PurePath], suffix: str) -> str:
+    """Output name for an input's relative path or member name, e.g. 'a/img.jpg' -> 'a/img_face.jpg'.
+
+    Keeping the directories means members with the same file name in
+    different archive folders don't overwrite each other's outputs.
+    """
+    path = PurePosixPath(PurePath(name).as_posix())
+    return path.with_name(f"{path.stem}{suffix}{path.suffix}").as_posix()
+
+def read_bytes(item: WorkItem) -> WorkItem:
+    """Read the raw file bytes; decoding happens in a separate stage.
+
+    The source is a file path or a callable returning the bytes (archive
+    members). Items streamed from a tar already carry their bytes.
+    """
+    if item.data is None:
+        if callable(item.source):
+            item.data = item.source()
+        else:
+            with open(item.source, 'rb') as f:
+                item.data = f.read()
+    return item
+
+def encode_outputs(item: WorkItem) -> Optional[WorkItem]:
+    """Encode every image output with the codec matching its file extension.
+
+    Outputs that are already bytes, or a Path to link, pass through as is.
+    """
+    import cv2
+
+    encoded = []
+    for name, payload in item.outputs:
+        if isinstance(payload, np.ndarray):
+            ok, buffer = cv2.imencode(Path(name).suffix, payload)
+            if not ok:
+                raise ValueError(f"Could not encode {name}")
+            payload = buffer.tobytes()
+        encoded.append((name, payload))
+    item.outputs = encoded
+    return item if encoded else None
+
+def write_output(sink: Union[DirectorySink, TarShardSink], name: str, payload: Union[bytes, Path]) -> None:
+    """Write encoded bytes, or link an unchanged input file given as a Path"""
+    if isinstance(payload, Path):
+        sink.link(name, payload)
+    else:
+        sink.write(name, payload)
+
+def make_writer(sink: Union[DirectorySink, TarShardSink]) -> Callable[[WorkItem], None]:
+    """Build a stage function that writes encoded outputs to a sink."""
+    def write_outputs(item: WorkItem) -> None:
+        for name, payload in item.outputs:
+            write_output(sink, name, payload)
+        item.outputs = []
+    return write_outputs
@@ -0,0 +1,35 @@
+"""
+sharding.py - Deterministic partitioning of an input list across nodes
+"""
+
+import argparse
+import hashlib
+from typing import List, Sequence, Tuple
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """Parse an 'i/N' shard spec (0 <= i < N) into (index, count), as an argparse type."""
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid shard '{spec}', expected i/N, e.g. 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Invalid shard '{spec}', index must be between 0 and {count - 1}")
+    return index, count
+
+def shard_of(key: str, count: int) -> int:
+    """Stable shard number for a key, identical on every machine and Python run"""
+    digest = hashlib.sha1(key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count
+
+def select_shard(names: Sequence[str], index: int, count: int) -> List[str]:
+    """Keep the names belonging to shard index of count.
+
+    Names are paths relative to the input directory (or archive member names),
+    so nodes that mount the shared filesystem at different places still agree
+    on the partitioning.
+    """
+    return [name for name in sorted(names) if shard_of(name, count) == index]
+
+def shard_suffix(index: int, count: int) -> str:
+    """File name suffix marking per-shard output, e.g. '.shard-001-of-004'"""
+    return f".shard-{index:03d}-of-{count:03d}"
@@ -0,0 +1,245 @@
+"""
+shm.py - Process pool that hands decoded frames to workers through shared memory
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator, Optional, Tuple, TYPE_CHECKING
+import numpy as np
+from .stages import FrameJob, WorkItem
+from .io import read_bytes
+from .tuning import set_library_threads
+
+if TYPE_CHECKING:
+    from multiprocessing.shared_memory import SharedMemory
+
+# Ends a process's loop; plain None so it pickles to nothing
+_STOP = None
+
+@dataclass
+class FrameRef:
+    """Index message for one decoded frame: the slot holding it and its shape"""
+    name: str
+    slot: int
+    shape: Tuple[int, ...]
+    # Frames too large for a slot travel through the pipe instead, still
+    # holding the slot so they count against the same in-flight limit
+    inline: Optional[np.ndarray] = None
+    # The encoded file and its path (None for archive members), for jobs with keep_original
+    original: Optional[bytes] = None
+    path: Optional[str] = None
+
+class FrameRing:
+    """Fixed-size slots for uint8 frames in one shared memory block.
+
+    The creating process owns the block and unlinks it on close; other
+    processes attach by name. Which slots are free is tracked by the
+    caller, see SharedFramePool.
+    """
+
+    def __init__(self, slots: int, slot_bytes: int, name: Optional[str] = None):
+        from multiprocessing import shared_memory
+
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.owner = name is None
+        if self.owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=max(1, slots * slot_bytes))
+        else:
+            self._shm = _attach(name)
+        self.name = self._shm.name
+
+    def fits(self, frame: np.ndarray) -> bool:
+        return frame.dtype == np.uint8 and frame.nbytes <= self.slot_bytes
+
+    def view(self, slot: int, shape: Tuple[int, ...], writable: bool = False) -> np.ndarray:
+        """Zero-copy array over a slot's bytes"""
+        if not 0 <= slot < self.slots:
+            raise IndexError(f"Slot {slot} out of range")
+        array = np.ndarray(shape, dtype=np.uint8, buffer=self._shm.buf, offset=slot * self.slot_bytes)
+        array.flags.writeable = writable
+        return array
+
+    def write(self, slot: int, frame: np.ndarray) -> None:
+        self.view(slot, frame.shape, writable=True)[...] = frame
+
+    def close(self) -> None:
+        try:
+            self._shm.close()
+        except BufferError:
+            # A view is still alive somewhere; the mapping goes away with the process
+            logging.warning(f"Shared frame ring {self.name} still has views open")
+        if self.owner:
+            self._shm.unlink()
+
+def _attach(name: str) -> 'SharedMemory':
+    from multiprocessing import shared_memory
+
+    try:
+        # Python 3.13+: the owner alone is responsible for unlinking
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+def _decoder_main(job: FrameJob, ring_name: str, slots: int, slot_bytes: int, tasks, free, frames, results) -> None:
+    job.setup()
+    ring = FrameRing(slots, slot_bytes, ring_name)
+    while True:
+        task = tasks.get()
+        if task is _STOP:
+            break
+        name, path, data = task
+        try:
+            if data is None:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            frame = job.decode(data)
+            if frame is None:
+                raise ValueError("Could not decode image")
+        except Exception as e:
+            logging.error(f"Error decoding {name}: {str(e)}")
+            results.put((name, None))
+            continue
+
+        source = (data, path) if job.keep_original else (None, None)
+        # Blocks while every slot is taken, which holds the decoders back
+        slot = free.get()
+        if not ring.fits(frame):
+            frames.put(FrameRef(name, slot, frame.shape, np.ascontiguousarray(frame), *source))
+            continue
+        ring.write(slot, frame)
+        frames.put(FrameRef(name, slot, frame.shape, None, *source))
+    ring.close()
+
+def _worker_main(job: FrameJob, ring_name: str, slots: int, slot_bytes: int, free, frames, results) -> None:
+    job.setup()
+    if job.library_threads is not None:
+        set_library_threads(job.library_threads)
+    ring = FrameRing(slots, slot_bytes, ring_name)
+    while True:
+        ref = frames.get()
+        if ref is _STOP:
+            break
+        frame = ref.inline if ref.inline is not None else ring.view(ref.slot, ref.shape)
+        try:
+            result = job.process(ref.name, frame, ref.original, ref.path)
+        except Exception as e:
+            logging.error(f"Error processing {ref.name}: {str(e)}")
+            result = None
+        finally:
+            del frame
+            free.put(ref.slot)
+        results.put((ref.name, result))
+    ring.close()
+
+class SharedFramePool:
+    """Decoder and worker processes connected by a shared memory frame ring.
+
+    Decoders decode a file, copy the pixels into a free slot and pass on a
+    FrameRef; workers read the slot as a zero-copy view, run the job and
+    return the slot index to the free queue. Only names, slot indices, shapes
+    and results cross the pipes, never pixels. With every slot in use the
+    decoders wait, so memory stays at slots * slot_bytes however far the
+    workers fall behind. Frames too large for a slot are sent through the
+    pipe but still take a slot, so at most slots frames are in flight.
+    """
+
+    def __init__(
+        self,
+        job: FrameJob,
+        workers: int = 4,
+        decoders: int = 2,
+        slots: Optional[int] = None,
+        slot_bytes: int = 48 << 20
+    ):
+        self.job = job
+        self.workers = max(1, workers)
+        self.decoders = max(1, decoders)
+        self.slots = slots or 2 * self.workers
+        self.slot_bytes = slot_bytes
+        self.processed = 0
+        self.failed = 0
+        self._elapsed = 0.0
+
+    def run(self, items: Iterable[WorkItem]) -> Iterator[Tuple[str, Any]]:
+        """Yield (name, result) for every item as workers finish; result is None on failure"""
+        # Loaded here so importing the command line tools stays fast
+        import multiprocessing
+
+        start = time.perf_counter()
+        context = multiprocessing.get_context()
+        ring = FrameRing(self.slots, self.slot_bytes)
+        tasks = context.Queue(maxsize=self.slots)
+        free = context.Queue()
+        frames = context.Queue()
+        results = context.Queue()
+        for slot in range(self.slots):
+            free.put(slot)
+
+        ring_args = (ring.name, self.slots, self.slot_bytes)
+        decoders = [
+            context.Process(target=_decoder_main, args=(self.job, *ring_args, tasks, free, frames, results), daemon=True)
+            for _ in range(self.decoders)
+        ]
+        workers = [
+            context.Process(target=_worker_main, args=(self.job, *ring_args, free, frames, results), daemon=True)
+            for _ in range(self.workers)
+        ]
+        # Processes start before the feeder thread, so nothing forks mid-write
+        for process in decoders + workers:
+            process.start()
+
+        sent = [0]
+        fed = threading.Event()
+
+        def feed() -> None:
+            try:
+                for item in items:
+                    if item.data is None and not isinstance(item.source, (str, os.PathLike)):
+                        # Archive members are read here; paths are read by the decoders
+                        read_bytes(item)
+                    tasks.put((item.name, item.source if item.data is None else None, item.data))
+                    sent[0] += 1
+            finally:
+                for _ in decoders:
+                    tasks.put(_STOP)
+                fed.set()
+
+        feeder = threading.Thread(target=feed, name='frame-feeder', daemon=True)
+        feeder.start()
+        received = 0
+        try:
+            while not (fed.is_set() and received == sent[0]):
+                try:
+                    name, result = results.get(timeout=0.5)
+                except queue.Empty:
+                    crashed = [p for p in decoders + workers if p.exitcode not in (None, 0)]
+                    if crashed:
+                        raise RuntimeError(f"{len(crashed)} frame pool processes exited unexpectedly")
+                    continue
+                received += 1
+                self.processed += 1
+                self.failed += result is None
+                yield name, result
+        finally:
+            for _ in workers:
+                frames.put(_STOP)
+            for process in decoders + workers:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+            feeder.join(timeout=5)
+            ring.close()
+            self._elapsed = time.perf_counter() - start
+
+    def report(self) -> str:
+        rate = self.processed / self._elapsed if self._elapsed > 0 else 0.0
+        return (
+            f"Processed {self.processed} images ({self.failed} failed) in {self._elapsed:.2f}s, {rate:.1f}/s, "
+            f"with {self.decoders} decoder and {self.workers} worker processes sharing "
+            f"{self.slots} x {self.slot_bytes / (1 << 20):.0f} MB frame slots"
+        )
@@ -0,0 +1,204 @@
+"""
+sources.py - Input sources: a directory of files, or a zip/tar archive read in place
+"""
+
+import fnmatch
+import io
+import tarfile
+import threading
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Dict, Iterator, Optional, Sequence, Tuple
+from .stages import WorkItem
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+def is_archive(path: Path) -> bool:
+    return path.is_file() and path.name.lower().endswith(ARCHIVE_SUFFIXES)
+
+def _matches(name: str, patterns: Sequence[str]) -> bool:
+    path = PurePosixPath(name)
+    # Outputs are named after members, so names that would escape the output directory are skipped
+    if path.is_absolute() or '..' in path.parts:
+        return False
+    base = path.name
+    # Skip resource forks and metadata that macOS adds to zip files
+    if name.startswith('__MACOSX/') or base.startswith('._'):
+        return False
+    return any(fnmatch.fnmatchcase(base, pattern) for pattern in patterns)
+
+def _member_name(name: str) -> str:
+    """Archive member name as a DirectorySource would name the file, e.g. './a//b.jpg' -> 'a/b.jpg'"""
+    return PurePosixPath(name.lstrip('/')).as_posix()
+
+# Start of a member read for its header; JPEG metadata segments come before the size
+HEADER_BYTES = 256 << 10
+
+# (width, height) from the image header, or None when it can't be parsed, and the file size
+Header = Tuple[Optional[Tuple[int, int]], int]
+
+def _image_size(f: BinaryIO) -> Optional[Tuple[int, int]]:
+    """Dimensions from an image header; PIL stops reading once it has them"""
+    from PIL import Image
+
+    try:
+        with Image.open(f) as image:
+            return image.size
+    except Exception:
+        return None
+
+class DirectorySource:
+    """Image files directly inside a directory, named by their file name.
+
+    Given names (from a DirectoryWatcher, say), the directory isn't listed.
+    """
+
+    random_access = True
+
+    def __init__(self, root: Path, patterns: Sequence[str], names: Optional[Sequence[str]] = None):
+        self.root = Path(root)
+        if names is not None:
+            self.names = sorted(names)
+            return
+        paths = set()
+        for pattern in patterns:
+            paths.update(self.root.glob(pattern))
+        self.names = sorted(path.relative_to(self.root).as_posix() for path in paths)
+
+    def items(self, names: Optional[Sequence[str]] = None) -> Iterator[WorkItem]:
+        for name in self.names if names is None else names:
+            yield WorkItem(name=name, source=self.root / name)
+
+    def header(self, name: str) -> Header:
+        path = self.root / name
+        with open(path, 'rb') as f:
+            return _image_size(f), path.stat().st_size
+
+    def close(self) -> None:
+        pass
+
+class ZipSource:
+    """Image members of a zip file, read on demand by the read stage workers"""
+
+    random_access = True
+
+    def __init__(self, path: Path, patterns: Sequence[str]):
+        self.path = Path(path)
+        self._zip = zipfile.ZipFile(self.path)
+        self._lock = threading.Lock()
+        self.names = sorted(
+            info.filename for info in self._zip.infolist()
+            if not info.is_dir() and _matches(info.filename, patterns)
+        )
+
+    def read(self, name: str) -> bytes:
+        # Members share one file handle, so reads are serialized
+        with self._lock:
+            return self._zip.read(name)
+
+    def items(self, names: Optional[Sequence[str]] = None) -> Iterator[WorkItem]:
+        for name in self.names if names is None else names:
+            yield WorkItem(name=name, source=lambda name=name: self.read(name))
+
+    def header(self, name: str) -> Header:
+        # Only the start of the member is decompressed
+        with self._lock:
+            with self._zip.open(name) as f:
+                return _image_size(f), self._zip.getinfo(name).file_size
+
+    def close(self) -> None:
+        self._zip.close()
+
+class TarSource:
+    """Image members of a (possibly compressed) tar file.
+
+    Plain tars are indexed once, by each member's data offset and size, and
+    members are read in place on demand like zip members, as often as
+    needed. Compressed tars can't be seeked: their members are streamed in
+    archive order with one sequential pass (a full decompress) per items()
+    call, with the bytes attached to each item for the read stage to pass
+    through. random_access tells the two apart, so modes that read the
+    input repeatedly can refuse compressed tars.
+
+    Member names are normalized ('./a/img.jpg' -> 'a/img.jpg'), so results,
+    output names and shards match a run over the extracted directory.
+    """
+
+    def __init__(self, path: Path, patterns: Sequence[str]):
+        self.path = Path(path)
+        try:
+            tar = tarfile.open(self.path, mode='r:')
+            self.random_access = True
+        except tarfile.ReadError:
+            # Listing needs one pass over the headers, a full decompress for .tar.gz
+            tar = tarfile.open(self.path)
+            self.random_access = False
+        with tar:
+            # name -> (offset of the data in the file, size)
+            self._members: Dict[str, Tuple[int, int]] = {}
+            # Raw member name -> name, since 'tar -C dir .' stores './img.jpg'
+            self._names: Dict[str, str] = {}
+            for member in tar:
+                name = _member_name(member.name)
+                if member.isfile() and _matches(name, patterns):
+                    self._members[name] = (member.offset_data, member.size)
+                    self._names[member.name] = name
+                    # Sparse members aren't stored contiguously
+                    self.random_access = self.random_access and not member.issparse()
+        self.names = sorted(self._members)
+        self._file: Optional[BinaryIO] = open(self.path, 'rb') if self.random_access else None
+        self._lock = threading.Lock()
+
+    def read(self, name: str, limit: Optional[int] = None) -> bytes:
+        """Bytes of a member of a plain tar, or only the first limit of them"""
+        offset, size = self._members[name]
+        # Members share one file handle, so reads are serialized
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(size if limit is None else min(size, limit))
+
+    def items(self, names: Optional[Sequence[str]] = None) -> Iterator[WorkItem]:
+        if self.random_access:
+            for name in self.names if names is None else names:
+                yield WorkItem(name=name, source=lambda name=name: self.read(name))
+            return
+        wanted = set(self.names if names is None else names)
+        with tarfile.open(self.path, mode='r|*') as tar:
+            for member in tar:
+                name = self._names.get(member.name)
+                # Of members stored under the same name, the indexed (last) one is read
+                if name in wanted and self._members[name][0] == member.offset_data:
+                    with tar.extractfile(member) as f:
+                        yield WorkItem(name=name, data=f.read())
+
+    def header(self, name: str) -> Header:
+        size = self._members[name][1]
+        if not self.random_access:
+            # Compressed members can't be opened in place, so only the size from the listing is known
+            return None, size
+        return _image_size(io.BytesIO(self.read(name, HEADER_BYTES))), size
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+class SequentialSourceError(ValueError):
+    """A mode that reads the input repeatedly was given a source that can only be streamed"""
+
+def require_random_access(source, purpose: str) -> None:
+    """Refuse sources that would be decompressed again on every pass, for modes that read the input repeatedly"""
+    if not getattr(source, 'random_access', True):
+        source.close()
+        raise SequentialSourceError(
+            f"{source.path} is a compressed tar, which would be decompressed again for every {purpose}; "
+            f"extract it, or use a zip or an uncompressed tar"
+        )
+
+def open_source(input_path: Path, patterns: Sequence[str]):
+    """Open a directory or an archive as an input source"""
+    input_path = Path(input_path)
+    if is_archive(input_path):
+        if input_path.name.lower().endswith('.zip'):
+            return ZipSource(input_path, patterns)
+        return TarSource(input_path, patterns)
+    return DirectorySource(input_path, patterns)
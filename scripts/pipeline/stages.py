@@ -0,0 +1,192 @@
+"""
+stages.py - Staged producer/consumer pipeline with bounded queues
+"""
+
+import queue
+import threading
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Marks the end of the input for a single worker
+_STOP = object()
+
+@dataclass
+class WorkItem:
+    """Unit of work handed from stage to stage"""
+    name: str
+    source: Any = None
+    data: Optional[bytes] = None
+    image: Any = None
+    result: Any = None
+    # (output name, payload) pairs - images before encoding, bytes after
+    outputs: List[Tuple[str, Any]] = field(default_factory=list)
+
+class FrameJob:
+    """The work a SharedFramePool (see shm.py) runs; subclasses must be picklable.
+
+    setup() runs once in every process, so expensive state (classifiers,
+    analyzers) is built there rather than pickled. decode() runs in decoder
+    processes and returns a uint8 array; process() runs in worker processes
+    on a read-only view of that array and returns a small, picklable result.
+    The result must not reference the frame, since its slot is reused as
+    soon as process() returns. Jobs that set keep_original also get the
+    encoded file bytes and its path, which then cross the pipe too.
+    """
+
+    keep_original = False
+    # Threads OpenCV may use inside each worker process; None leaves the default
+    library_threads: Optional[int] = None
+
+    def setup(self) -> None:
+        pass
+
+    def decode(self, data: bytes) -> Optional['np.ndarray']:
+        raise NotImplementedError
+
+    def process(self, name: str, frame: 'np.ndarray', original: Optional[bytes] = None, path: Optional[str] = None) -> Any:
+        raise NotImplementedError
+
+@dataclass
+class Stage:
+    """A pipeline stage: a function applied to each item by its own worker threads.
+
+    The function returns the item to pass downstream, or None to drop it.
+    """
+    name: str
+    func: Callable[[WorkItem], Optional[WorkItem]]
+    workers: int = 1
+    queue_size: int = 16
+
+@dataclass
+class StageStats:
+    name: str
+    workers: int
+    queue_size: int
+    processed: int = 0
+    errors: int = 0
+    busy_seconds: float = 0.0
+    depth_samples: int = 0
+    depth_total: int = 0
+    max_depth: int = 0
+    # Share of the stage's worker time spent busy, filled in after a run
+    utilization: float = 0.0
+
+    @property
+    def mean_depth(self) -> float:
+        return self.depth_total / self.depth_samples if self.depth_samples else 0.0
+
+class StagedPipeline:
+    """Runs items through a chain of stages connected by bounded queues.
+
+    Each stage has its own worker threads, so disk reads, decodes, compute and
+    encodes overlap. A full queue blocks the stage feeding it, which keeps memory
+    flat no matter how many items are queued up at the source.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage")
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=max(1, stage.queue_size)) for stage in stages]
+        self.stats = [StageStats(stage.name, stage.workers, stage.queue_size) for stage in stages]
+        self._lock = threading.Lock()
+        self._elapsed = 0.0
+
+    def queue_depths(self) -> Dict[str, int]:
+        """Current number of items waiting in front of each stage"""
+        return {stage.name: q.qsize() for stage, q in zip(self.stages, self.queues)}
+
+    def run(self, items: Iterable[WorkItem]) -> None:
+        """Feed all items through the pipeline and wait for it to drain."""
+        start = time.perf_counter()
+        threads = []
+        for index, stage in enumerate(self.stages):
+            stage_threads = [
+                threading.Thread(
+                    target=self._worker,
+                    args=(index,),
+                    name=f"{stage.name}-{n}",
+                    daemon=True
+                )
+                for n in range(max(1, stage.workers))
+            ]
+            for thread in stage_threads:
+                thread.start()
+            threads.append(stage_threads)
+
+        try:
+            for item in items:
+                self.queues[0].put(item)
+        finally:
+            # Shut stages down in order so every queued item still gets processed
+            for index, stage_threads in enumerate(threads):
+                for _ in stage_threads:
+                    self.queues[index].put(_STOP)
+                for thread in stage_threads:
+                    thread.join()
+
+        self._elapsed = time.perf_counter() - start
+        for stats in self.stats:
+            capacity = self._elapsed * max(1, stats.workers)
+            stats.utilization = stats.busy_seconds / capacity if capacity > 0 else 0.0
+
+    def _worker(self, index: int) -> None:
+        stage = self.stages[index]
+        stats = self.stats[index]
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.queues) else None
+
+        while True:
+            depth = inbox.qsize()
+            item = inbox.get()
+            if item is _STOP:
+                break
+
+            started = time.perf_counter()
+            try:
+                result = stage.func(item)
+                failed = False
+            except Exception as e:
+                logging.error(f"Error in {stage.name} stage for {getattr(item, 'name', item)}: {str(e)}")
+                result = None
+                failed = True
+            busy = time.perf_counter() - started
+
+            with self._lock:
+                stats.processed += 1
+                stats.errors += failed
+                stats.busy_seconds += busy
+                stats.depth_samples += 1
+                stats.depth_total += depth
+                stats.max_depth = max(stats.max_depth, depth)
+
+            if result is not None and outbox is not None:
+                outbox.put(result)
+
+    def bottleneck(self) -> Optional[str]:
+        """Name of the stage with the highest worker utilization in the last run"""
+        if not any(stats.processed for stats in self.stats):
+            return None
+        return max(self.stats, key=lambda stats: stats.utilization).name
+
+    def report(self) -> str:
+        """Per-stage throughput and queue depth table for the last run"""
+        lines = [
+            f"{'stage':<10} {'workers':>7} {'items':>7} {'errors':>6} {'busy s':>8} "
+            f"{'util':>6} {'avg queue':>9} {'max queue':>9}"
+        ]
+        for stats in self.stats:
+            lines.append(
+                f"{stats.name:<10} {stats.workers:>7} {stats.processed:>7} {stats.errors:>6} "
+                f"{stats.busy_seconds:>8.2f} {stats.utilization:>6.0%} "
+                f"{stats.mean_depth:>9.1f} {f'{stats.max_depth}/{stats.queue_size}':>9}"
+            )
+        bottleneck = self.bottleneck()
+        if bottleneck:
+            lines.append(f"Bottleneck: {bottleneck} ({self._elapsed:.2f}s total)")
+        return "\n".join(lines)
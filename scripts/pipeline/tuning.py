@@ -0,0 +1,187 @@
+"""
+tuning.py - Pick worker counts from a measured warm-up instead of fixed defaults
+"""
+
+import os
+import sys
+import time
+import contextlib
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Optional, Tuple
+
+# Stop adding workers once the CPUs are this busy, or throughput grows by less than MIN_GAIN
+SATURATED_UTILIZATION = 0.9
+MIN_GAIN = 0.1
+# Threads whose throughput is below this share of linear scaling are held back
+# by the GIL, so separate processes are tried as well
+THREAD_EFFICIENCY = 0.75
+
+def available_cpus() -> int:
+    """CPUs this process may run on, which can be fewer than the machine has"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def cpu_seconds() -> float:
+    """CPU time used so far by this process and its finished child processes"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+def set_library_threads(count: int) -> Optional[int]:
+    """Limit the threads OpenCV uses inside a single call, if OpenCV is loaded.
+
+    scipy.fft takes its worker count per call instead (the analyzer's
+    fft_workers), since its default is per thread. Returns the previous
+    OpenCV setting.
+    """
+    cv2 = sys.modules.get('cv2')
+    if cv2 is None:
+        return None
+    previous = cv2.getNumThreads()
+    cv2.setNumThreads(count)
+    return previous
+
+@contextlib.contextmanager
+def library_threads(count: int) -> Iterator[None]:
+    """set_library_threads for the duration of a block"""
+    previous = set_library_threads(count)
+    try:
+        yield
+    finally:
+        if previous is not None:
+            set_library_threads(previous)
+
+@dataclass
+class Concurrency:
+    """Compute threads or processes, and the library threads each of them may use"""
+    threads: int
+    processes: int = 0
+    library_threads: int = 1
+
+    @property
+    def workers(self) -> int:
+        return self.processes or self.threads
+
+    def __str__(self) -> str:
+        if self.processes:
+            workers = f"{self.processes} process{'es' if self.processes != 1 else ''}"
+        else:
+            workers = f"{self.threads} thread{'s' if self.threads != 1 else ''}"
+        return f"{workers}, {self.library_threads} OpenCV/FFT threads each"
+
+@dataclass
+class Probe:
+    """Throughput and CPU use measured over one slice of the warm-up"""
+    concurrency: Concurrency
+    images: int
+    seconds: float
+    cpu_seconds: float
+    cpus: int
+
+    @property
+    def images_per_second(self) -> float:
+        return self.images / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def latency(self) -> float:
+        """Seconds one worker spends on an image"""
+        return self.seconds * self.concurrency.workers / self.images if self.images else 0.0
+
+    @property
+    def utilization(self) -> float:
+        """Share of the available CPUs kept busy"""
+        return self.cpu_seconds / (self.seconds * self.cpus) if self.seconds > 0 else 0.0
+
+class AutoTuner:
+    """Chooses worker counts by running the first images at increasing concurrency.
+
+    Each probe processes the next slice of images for real, so the warm-up
+    costs nothing extra, and measures throughput, per-image latency and CPU
+    utilization. Thread counts double from one while throughput improves by
+    MIN_GAIN and the CPUs aren't saturated. When threads scale poorly and
+    processes are allowed, one probe with a process per CPU is added.
+    Workers times library threads never exceeds the CPU count, so OpenCV's
+    and the FFT's own threads can't oversubscribe the cores.
+
+    run_batch(names, concurrency) processes the named images with the given
+    settings.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[str], Concurrency], None],
+        cpus: Optional[int] = None,
+        allow_processes: bool = False,
+        probe_images: int = 4,
+        max_warmup: int = 64
+    ):
+        self.run_batch = run_batch
+        self.cpus = cpus or available_cpus()
+        self.allow_processes = allow_processes
+        # Each probe runs at least this many images, and two per worker
+        self.probe_images = probe_images
+        self.max_warmup = max_warmup
+        self.probes: List[Probe] = []
+
+    def concurrency(self, threads: int = 0, processes: int = 0) -> Concurrency:
+        """Settings for this many workers, with the CPUs left over split among them"""
+        workers = processes or threads
+        return Concurrency(threads, processes, max(1, self.cpus // workers))
+
+    def _probe(self, concurrency: Concurrency, remaining: List[str]) -> Probe:
+        count = max(self.probe_images, 2 * concurrency.workers)
+        batch = remaining[:count]
+        del remaining[:count]
+        with library_threads(concurrency.library_threads):
+            start, cpu_start = time.perf_counter(), cpu_seconds()
+            self.run_batch(batch, concurrency)
+            probe = Probe(concurrency, len(batch), time.perf_counter() - start, cpu_seconds() - cpu_start, self.cpus)
+        self.probes.append(probe)
+        print(
+            f"Auto-tune: {concurrency}: {probe.images_per_second:.2f} images/s, "
+            f"{probe.latency * 1000:.0f} ms/image, {probe.utilization:.0%} CPU"
+        )
+        return probe
+
+    def tune(self, names: List[str]) -> Tuple[Concurrency, List[str]]:
+        """Process a warm-up window of names and return the chosen settings and the names left over"""
+        remaining = list(names)
+        warmup_end = len(remaining) - self.max_warmup
+
+        best = widest = first = self._probe(self.concurrency(threads=1), remaining)
+        while remaining and len(remaining) > warmup_end and best.utilization < SATURATED_UTILIZATION:
+            threads = min(2 * widest.concurrency.threads, self.cpus)
+            if threads == widest.concurrency.threads:
+                break
+            widest = self._probe(self.concurrency(threads=threads), remaining)
+            if widest.images_per_second < best.images_per_second * (1 + MIN_GAIN):
+                break
+            best = widest
+
+        # Share of linear scaling the most threads tried achieved
+        efficiency = 1.0
+        if first.images_per_second > 0:
+            efficiency = widest.images_per_second / (first.images_per_second * widest.concurrency.threads)
+        if (
+            self.allow_processes and remaining and self.cpus > 1 and
+            efficiency < THREAD_EFFICIENCY and best.utilization < SATURATED_UTILIZATION
+        ):
+            probe = self._probe(self.concurrency(processes=self.cpus), remaining)
+            if probe.images_per_second > best.images_per_second * (1 + MIN_GAIN):
+                best = probe
+
+        print(
+            f"Auto-tune chose {best.concurrency} on {self.cpus} CPUs "
+            f"({best.images_per_second:.2f} images/s, {best.utilization:.0%} CPU) "
+            f"after {sum(probe.images for probe in self.probes)} warm-up images"
+        )
+        return best.concurrency, remaining
+
+    def run(self, names: List[str]) -> Concurrency:
+        """Tune on the first names, then process the rest with the chosen settings"""
+        concurrency, remaining = self.tune(names)
+        if remaining:
+            with library_threads(concurrency.library_threads):
+                self.run_batch(remaining, concurrency)
+        return concurrency
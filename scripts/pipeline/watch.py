@@ -0,0 +1,218 @@
+"""
+watch.py - Follow a directory for new and changed images, with inotify or polling
+"""
+
+import os
+import stat
+import argparse
+import time
+import errno
+import fnmatch
+import select
+import struct
+import logging
+import threading
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+# inotify(7) event bits
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+
+_WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+# struct inotify_event: int wd; uint32_t mask, cookie, len; char name[len]
+_EVENT = struct.Struct('iIII')
+
+# (size, mtime in ns) of a file; a file is finished once this stops changing
+Signature = Tuple[int, int]
+
+class _Inotify:
+    """Minimal inotify binding through ctypes, watching one directory"""
+
+    def __init__(self, directory: str):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), _WATCH_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"inotify_add_watch failed for {directory}")
+
+    def read(self, timeout: float) -> Optional[List[Tuple[int, str]]]:
+        """(mask, name) events within timeout seconds; None when events were lost"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buffer = os.read(self.fd, 1 << 16)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+        events = []
+        offset = 0
+        while offset < len(buffer):
+            _, mask, _, length = _EVENT.unpack_from(buffer, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(buffer[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            events.append((mask, name))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+class DirectoryWatcher:
+    """New, changed and removed image files directly inside a directory.
+
+    Changes are noticed through inotify on Linux and by rescanning the
+    directory every poll_interval seconds elsewhere, or when inotify is
+    unavailable. A file is only reported once its size and modification time
+    have stayed the same for settle seconds, so files still being uploaded
+    or copied are picked up when they are complete.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        patterns: Sequence[str],
+        settle: float = 2.0,
+        poll_interval: float = 1.0,
+        use_inotify: bool = True
+    ):
+        self.root = str(root)
+        self.patterns = patterns
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self._inotify: Optional[_Inotify] = None
+        if use_inotify:
+            try:
+                self._inotify = _Inotify(self.root)
+            except (OSError, AttributeError) as e:
+                logging.warning(f"inotify unavailable ({str(e)}), polling {self.root} instead")
+        # Signatures of the files already reported, and the files still settling
+        self._reported: Dict[str, Signature] = {}
+        self._pending: Set[str] = set()
+
+    @property
+    def mode(self) -> str:
+        return 'inotify' if self._inotify is not None else 'polling'
+
+    def _matches(self, name: str) -> bool:
+        return not name.startswith('.') and any(fnmatch.fnmatchcase(name, pattern) for pattern in self.patterns)
+
+    def _stat(self, name: str) -> Optional[Tuple[Signature, float]]:
+        """The file's signature and mtime in seconds, or None if it is gone"""
+        try:
+            st = os.stat(os.path.join(self.root, name))
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        return (st.st_size, st.st_mtime_ns), st.st_mtime
+
+    def _scan(self) -> List[str]:
+        with os.scandir(self.root) as entries:
+            return [entry.name for entry in entries if self._matches(entry.name) and entry.is_file()]
+
+    def _changed_names(self, first: bool) -> Optional[List[str]]:
+        """Names that may have changed since the last call; None means all of them"""
+        if first or self._inotify is None:
+            return None
+        events = self._inotify.read(self.poll_interval)
+        if events is None:
+            logging.warning(f"inotify queue overflowed, rescanning {self.root}")
+            return None
+        if any(mask & (IN_DELETE_SELF | IN_MOVE_SELF) for mask, _ in events):
+            raise FileNotFoundError(f"Watched directory {self.root} was removed or moved")
+        return [name for _, name in events if self._matches(name)]
+
+    def batches(self, stop: threading.Event, idle: bool = False) -> Iterator[Tuple[List[str], List[str]]]:
+        """Yield (ready, removed) name lists until stop is set.
+
+        ready holds files that are new or changed since they were last
+        reported and have settled; removed holds reported files that are
+        gone. The first batch reports every settled file already present.
+        With idle, empty batches are yielded too, about every poll_interval,
+        so the caller can do timed work while nothing arrives.
+        """
+        first = True
+        try:
+            while not stop.is_set():
+                if self._inotify is None and not first and stop.wait(self.poll_interval):
+                    break
+                changed = self._changed_names(first)
+                if changed is None:
+                    changed = set(self._scan()) | set(self._reported)
+                first = False
+
+                # Settled files haven't been modified for settle seconds, going by their mtime
+                now = time.time()
+                ready, removed = [], []
+                for name in sorted(set(changed) | self._pending):
+                    observed = self._stat(name)
+                    if observed is None:
+                        self._pending.discard(name)
+                        if self._reported.pop(name, None) is not None:
+                            removed.append(name)
+                        continue
+                    signature, mtime = observed
+                    if signature == self._reported.get(name):
+                        self._pending.discard(name)
+                    elif now - mtime >= self.settle:
+                        ready.append(name)
+                        self._reported[name] = signature
+                        self._pending.discard(name)
+                    else:
+                        self._pending.add(name)
+
+                if ready or removed or idle:
+                    yield ready, removed
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+def stop_on_signal() -> threading.Event:
+    """An event set by SIGTERM or SIGINT, for ending a watch loop cleanly"""
+    import signal
+
+    stop = threading.Event()
+
+    def handler(signum, frame):
+        stop.set()
+    signal.signal(signal.SIGTERM, handler)
+    signal.signal(signal.SIGINT, handler)
+    return stop
+
+def add_watch_arguments(parser: argparse.ArgumentParser) -> argparse._ArgumentGroup:
+    """--watch and its options, shared by the command line tools; returns the group for tool specific options"""
+    group = parser.add_argument_group('watch mode')
+    group.add_argument('--watch', action='store_true',
+                       help='Keep running and process new or changed images as they arrive (directories only)')
+    group.add_argument('--settle', type=float, default=2.0,
+                       help='Seconds a file must go unmodified before it is processed, so partial uploads are skipped (default: 2.0)')
+    group.add_argument('--poll-interval', type=float, default=1.0,
+                       help='Seconds between directory scans when polling (default: 1.0)')
+    group.add_argument('--poll', action='store_true',
+                       help='Poll instead of using inotify, e.g. for network filesystems where inotify misses remote writes')
+    return group